@@ -0,0 +1,2 @@
+# Offline benchmarks for the bot's hot paths, run with `python -m benchmarks` from the repository root.
+# Discord objects are replaced by the stand-ins in fakes, so no token or network is needed.
@@ -0,0 +1,31 @@
+# Runs the hot path benchmarks for each ledger size, each in its own process and working directory.
+# Usage, from the repository root: python -m benchmarks [--sizes 1000,10000,100000,1000000] [--members 500] [names...]
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from benchmarks.fixtures import root, workspace
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Offline benchmarks for the bot\'s hot paths.')
+    parser.add_argument('names', nargs='*', help='only run benchmarks whose names start with one of these')
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help='comma separated ledger sizes in transactions')
+    parser.add_argument('--members', type=int, default=500, help='members in the fake guild')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([root, os.path.join(root, 'src')]))
+    for size in args.sizes.split(','):
+        workdir = tempfile.mkdtemp(prefix='cactus-bench-')
+        try:
+            rundir = workspace(workdir)
+            subprocess.run([sys.executable, '-m', 'benchmarks.suite', size, str(args.members)] + args.names, cwd=rundir, env=env, check=True)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        print()
+
+
+if __name__ == '__main__':
+    main()
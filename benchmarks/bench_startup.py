@@ -0,0 +1,64 @@
+# Measures how long the bot takes from process start until it is ready to open the gateway connection,
+# that is importing discord_client and constructing the client, for the working tree and for an older git revision.
+# Usage, from the repository root: python benchmarks/bench_startup.py [revision to compare against, default HEAD~1] [runs]
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the measured process, with src as the working directory
+probe = '''
+import time
+start = time.perf_counter()
+import discord
+import discord_client
+intents = discord.Intents.default()
+intents.members = True
+client = discord_client.Client(intents=intents)
+print(time.perf_counter() - start)
+import os
+os._exit(0)
+'''
+
+
+# Copies src from a git revision into a throwaway directory laid out like a deployment
+def checkout(revision: str):
+    workdir = tempfile.mkdtemp()
+    archive = subprocess.run(['git', 'archive', revision, 'src'], cwd=root, check=True, capture_output=True).stdout
+    subprocess.run(['tar', '-x', '-C', workdir], input=archive, check=True)
+    return workdir
+
+
+def prepare(workdir: str):
+    with open(os.path.join(workdir, 'config.yml'), 'w') as f:
+        f.write(f'dbFile: {os.path.join(workdir, "db")}\nchannelName: commands\ndefaultCoin: 1000\ndebtLimit: -1000\n')
+    os.makedirs(os.path.join(workdir, 'tmp'), exist_ok=True)
+
+
+def measure(srcdir: str, runs: int):
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', probe], cwd=srcdir, check=True, capture_output=True, text=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def main():
+    revision = sys.argv[1] if len(sys.argv) > 1 else 'HEAD~1'
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    old = checkout(revision)
+    prepare(old)
+    current = tempfile.mkdtemp()
+    subprocess.run(['cp', '-r', os.path.join(root, 'src'), current], check=True)
+    prepare(current)
+
+    for label, workdir in ((revision, old), ('working tree', current)):
+        times = measure(os.path.join(workdir, 'src'), runs)
+        print(f'{label:>14}: median {statistics.median(times) * 1000:7.1f} ms, min {min(times) * 1000:7.1f} ms over {runs} runs')
+
+
+if __name__ == '__main__':
+    main()
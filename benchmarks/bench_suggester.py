@@ -0,0 +1,49 @@
+# Measures how long it takes to build the command suggester and to look up suggestions for typos.
+# Usage, from the repository root: python benchmarks/bench_suggester.py
+import os
+import random
+import statistics
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'src'))
+
+from command_suggester import CommandSuggester  # noqa: E402
+
+commandNames = ['!help', '!setup', '!rankings', '!give', '!bet', '!wheel', '!brokecheck', '!debtlimit', '!adminhelp',
+                '!adminadjust', '!balance', '!clear', '!bigwins', '!biglosses', '!reset', '!hello', '!sadge', '!hardreset']
+
+
+def typo(word: str, rng: random.Random):
+    i = rng.randrange(1, len(word))
+    edit = rng.choice(['delete', 'insert', 'replace', 'swap'])
+    if edit == 'delete':
+        return word[:i] + word[i + 1:]
+    if edit == 'insert':
+        return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i:]
+    if edit == 'replace':
+        return word[:i] + rng.choice('abcdefghijklmnopqrstuvwxyz') + word[i + 1:]
+    return word[:i - 1] + word[i] + word[i - 1] + word[i + 1:] if i > 1 else word
+
+
+def main():
+    rng = random.Random(0)
+    start = time.perf_counter()
+    suggester = CommandSuggester()
+    suggester.add_all(commandNames)
+    print(f'build: {(time.perf_counter() - start) * 1e6:.0f} us for {len(commandNames)} commands, {len(suggester.index)} index entries')
+
+    typos = [typo(rng.choice(commandNames), rng) for _ in range(10000)] + ['!' + 'x' * 40] * 100
+    latencies = []
+    for word in typos:
+        start = time.perf_counter()
+        suggester.suggest(word)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(f'lookup: p50 {latencies[len(latencies) // 2] * 1e6:.1f} us, p99 {latencies[int(len(latencies) * .99)] * 1e6:.1f} us, '
+          f'mean {statistics.mean(latencies) * 1e6:.1f} us over {len(typos)} typos')
+
+
+if __name__ == '__main__':
+    main()
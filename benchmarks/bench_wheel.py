@@ -0,0 +1,41 @@
+# Measures wheel gif rendering: frames per second, gif size and peak memory for a range of player counts.
+# Every player count renders in a fresh process, the peak RSS a process reports only ever goes up.
+# Usage, from the repository root: python benchmarks/bench_wheel.py [canvas size]
+import os
+import resource
+import subprocess
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(root, 'src'))
+
+import charts  # noqa: E402
+
+
+# Runs in the child process: renders one wheel and prints its row. The RSS peak before rendering is the interpreter
+# with the plotting stack loaded, the growth past it is what the render itself needed.
+def measure(players: int, canvas_size: int):
+    colors = [((i * 67) % 256, (i * 131) % 256, (i * 197) % 256) for i in range(players)]
+    frames = len(charts.spin_rotations(0))
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    start = time.perf_counter()
+    gif = charts.render_wheel(colors, 123, canvas_size)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{players:>3} players: {frames / elapsed:7.1f} frames/s, {elapsed * 1000:7.1f} ms, {len(gif) / 1024:7.1f} KiB gif, '
+          f'peak rss {peak:6.1f} MiB (+{peak - baseline:5.1f} MiB rendering)', flush=True)
+
+
+def main():
+    canvas_size = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    print(f'canvas {canvas_size}px, {len(charts.spin_rotations(0))} frames per wheel', flush=True)
+    for players in (2, 5, 10, 25):
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--players', str(players), str(canvas_size)], check=True)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--players':
+        measure(int(sys.argv[2]), int(sys.argv[3]))
+    else:
+        main()
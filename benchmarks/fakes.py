@@ -0,0 +1,132 @@
+# In-process stand-ins for the parts of discord.py the bot touches. They carry just the attributes and coroutines
+# commands and discord_client use, and every REST call completes after an optional simulated round trip.
+import asyncio
+import itertools
+import random
+import struct
+import zlib
+import discord
+
+ids = itertools.count(10 ** 17)
+
+
+# An uncompressed-then-deflated RGB PNG of one flat color, so avatars cost no imaging library in the bot process
+def png(size: int, color: tuple):
+    def chunk(kind: bytes, data: bytes):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+    row = b'\x00' + bytes(color) * size
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', size, size, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * size)) + chunk(b'IEND', b''))
+
+
+class FakeAsset:
+    def __init__(self, key: str, color: tuple, latency: float = 0):
+        self.key = key
+        self.color = color
+        self.latency = latency
+
+    async def read(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return png(128, self.color)
+
+
+class FakeRole:
+    def __init__(self, guild, name: str, color: discord.Color = None):
+        self.id = next(ids)
+        self.guild = guild
+        self.name = name
+        self.color = color or discord.Color.default()
+
+    async def delete(self, reason: str = None):
+        await self.guild.rest()
+        self.guild.roles.remove(self)
+        # like Discord, deleting a role takes it away from its holders
+        for member in self.guild.members:
+            if self in member.roles:
+                member.roles.remove(self)
+
+
+class FakeMember:
+    def __init__(self, guild, name: str, color: discord.Color, avatar: FakeAsset):
+        self.id = next(ids)
+        self.guild = guild
+        self.name = name
+        self.display_name = name
+        self.mention = f'<@{self.id}>'
+        self.color = color
+        self.display_avatar = avatar
+        self.roles = []
+        self.bot = False
+
+    async def add_roles(self, *roles, reason: str = None):
+        await self.guild.rest()
+        self.roles.extend(role for role in roles if role not in self.roles)
+
+    async def remove_roles(self, *roles, reason: str = None):
+        await self.guild.rest()
+        self.roles = [role for role in self.roles if role not in roles]
+
+
+class FakeGuild:
+    def __init__(self, memberCount: int, latency: float = 0, seed: int = 0):
+        rng = random.Random(seed)
+        self.id = next(ids)
+        self.name = 'Benchmark Guild'
+        # simulated REST round trip for role and avatar calls
+        self.latency = latency
+        self.restCalls = 0
+        self.roles = [FakeRole(self, '@everyone')]
+        self.members = []
+        for i in range(memberCount):
+            color = discord.Color.from_rgb(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            avatar = FakeAsset(f'avatar{i}', (color.r, color.g, color.b), latency)
+            self.members.append(FakeMember(self, f'member{i}', color, avatar))
+        self.memberMap = {member.id: member for member in self.members}
+
+    async def rest(self):
+        self.restCalls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def get_member(self, memberid: int):
+        return self.memberMap.get(memberid)
+
+    def get_role(self, roleid: int):
+        return next((role for role in self.roles if role.id == roleid), None)
+
+    async def create_role(self, name: str, reason: str = None, color: discord.Color = None):
+        await self.rest()
+        role = FakeRole(self, name, color)
+        self.roles.append(role)
+        return role
+
+
+class FakeChannel:
+    def __init__(self, name: str):
+        self.id = next(ids)
+        self.name = name
+        self.sent = 0
+
+    async def send(self, *args, **kwargs):
+        self.sent += 1
+
+
+class FakeMessage:
+    def __init__(self, guild: FakeGuild, channel: FakeChannel, author: FakeMember, content: str, mentions: list = None):
+        self.id = next(ids)
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mentions = mentions or []
+        self.replies = 0
+
+    async def reply(self, *args, **kwargs):
+        self.replies += 1
+
+
+# Stands in for the logged in client when calling Client.on_message directly
+class FakeClient:
+    def __init__(self):
+        self.user = FakeMember(FakeGuild(0), 'Cactus Coin Bot', discord.Color.default(), FakeAsset('bot', (0, 0, 0)))
@@ -0,0 +1,60 @@
+# Throwaway deployments for the benchmarks: a working directory laid out like the real one (config.yml next to the
+# directory the bot runs from) and a ledger filled with synthetic wallets and transactions.
+import datetime
+import os
+import random
+import sqlite3
+import tempfile
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+settings = {
+    'channelName': 'commands',
+    'defaultCoin': 1000,
+    'debtLimit': -1000,
+    'logLevel': 'WARNING',
+    # role syncs still run against the fakes, just without the debounce holding them back for seconds
+    'roleSyncDelay': 0.01,
+    'warmRenderer': False,
+}
+
+
+# Creates <workdir>/config.yml and <workdir>/run, returns the directory the bot should run from
+def workspace(workdir: str = None, **overrides):
+    workdir = workdir or tempfile.mkdtemp(prefix='cactus-bench-')
+    os.makedirs(os.path.join(workdir, 'run'), exist_ok=True)
+    values = dict(settings, dbFile=os.path.join(workdir, 'ledger.db'), avatarCacheDir=os.path.join(workdir, 'avatars'), **overrides)
+    with open(os.path.join(workdir, 'config.yml'), 'w') as f:
+        for key, value in values.items():
+            f.write(f'{key}: {value}\n')
+    return os.path.join(workdir, 'run')
+
+
+# Writes `transactions` random transactions spread over the last year between the given member ids of one guild, and
+# their balances. Uses its own connection so it can run before the ledger thread opens the file.
+def build_ledger(dbFile: str, guildid: int, memberids: list, transactions: int, seed: int = 0, chunkSize: int = 50000):
+    from schema import create_schema
+    rng = random.Random(seed)
+    connection = sqlite3.connect(dbFile, isolation_level=None)
+    connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=OFF')
+    create_schema(connection)
+    now = datetime.datetime.utcnow()
+    balances = {memberid: 1000 for memberid in memberids}
+    written = 0
+    while written < transactions:
+        rows = []
+        for _ in range(min(chunkSize, transactions - written)):
+            memberid = rng.choice(memberids)
+            amount = int(rng.gauss(0, 200))
+            balances[memberid] += amount
+            rows.append((guildid, now - datetime.timedelta(seconds=rng.randrange(365 * 24 * 3600)), memberid, amount, None))
+        connection.execute('BEGIN')
+        connection.executemany('INSERT INTO TRANSACTIONS(guild_id, date, id, coin, memo) VALUES (?, ?, ?, ?, ?)', rows)
+        connection.execute('COMMIT')
+        written += len(rows)
+    connection.execute('BEGIN')
+    connection.executemany('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (?, ?, ?)', [(guildid, memberid, coin) for memberid, coin in balances.items()])
+    connection.execute('COMMIT')
+    connection.close()
@@ -0,0 +1,51 @@
+# Timing and memory measurement shared by the benchmarks
+import time
+import tracemalloc
+
+
+class Result:
+    def __init__(self, name: str, latencies: list, peak: int):
+        self.name = name
+        self.latencies = sorted(latencies)
+        self.peak = peak
+
+    def percentile(self, fraction: float):
+        return self.latencies[min(int(len(self.latencies) * fraction), len(self.latencies) - 1)]
+
+    def throughput(self):
+        return len(self.latencies) / sum(self.latencies)
+
+    def row(self):
+        return (f'{self.name:<24} {len(self.latencies):>6} {self.throughput():>10.1f}/s {self.percentile(.5) * 1000:>9.2f} ms '
+                f'{self.percentile(.99) * 1000:>9.2f} ms {self.peak / 1024 / 1024:>8.2f} MiB')
+
+
+header = f'{"benchmark":<24} {"runs":>6} {"throughput":>12} {"p50":>12} {"p99":>12} {"peak mem":>12}'
+
+
+# Awaits call(i) `runs` times after `warmup` untimed calls. reset(), when given, runs untimed before every call so
+# each one starts cold. Peak memory is the largest traced Python allocation during a few extra calls, chart worker
+# processes are not included.
+async def measure(name: str, call, runs: int, warmup: int = 1, reset=None, memoryRuns: int = 3):
+    for i in range(warmup):
+        if reset:
+            reset()
+        await call(i)
+    latencies = []
+    for i in range(runs):
+        if reset:
+            reset()
+        start = time.perf_counter()
+        await call(i)
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        for i in range(memoryRuns):
+            if reset:
+                reset()
+            await call(i)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return Result(name, latencies, peak)
@@ -0,0 +1,97 @@
+# Fires thousands of concurrent balance changes, wallet checks and role syncs at a few small fake guilds, then checks
+# that no coin was created or destroyed and nothing was left half done: every wallet must equal its starting amount plus
+# the transactions recorded for it in its guild, the cache must match the ledger and every member must end up with
+# exactly the wallet role for their balance.
+# Usage, from the repository root: python -m benchmarks.stress_locks [--operations 5000] [--members 20] [--guilds 2] [--role-tiers 0,1000,2000]
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from benchmarks.fixtures import root, workspace
+
+
+async def stress(operations: int, memberCount: int, guildCount: int):
+    import commands
+    from benchmarks.fakes import FakeGuild
+
+    rng = random.Random(0)
+    # a little simulated latency so role calls for the same member really overlap
+    guilds = [FakeGuild(memberCount, latency=0.002, seed=seed) for seed in range(guildCount)]
+    startingCoin = 1000
+    for guild in guilds:
+        await commands.update_coins(guild.id, [(member.id, startingCoin) for member in guild.members])
+        await commands.prepare_roles(guild)
+
+    async def operation():
+        kind = rng.random()
+        guild = rng.choice(guilds)
+        first, second = rng.sample(guild.members, 2)
+        amount = rng.randint(1, 50)
+        # yield first so all operations are in flight together
+        await asyncio.sleep(0)
+        if kind < .35:
+            await commands.transfer(guild, first, second, amount, 'stress')
+        elif kind < .7:
+            await commands.add_coin(guild, first, amount)
+        elif kind < .85:
+            await commands.settle(guild, {first: -amount, second: amount // 2}, 'stress')
+        else:
+            await commands.verify_coin(guild, first)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[operation() for _ in range(operations)])
+    elapsed = time.perf_counter() - start
+    # let the background role sync finish before looking at roles
+    while commands.roleSync.task and not commands.roleSync.task.done():
+        await commands.roleSync.task
+
+    def audit(connection):
+        return connection.execute('SELECT AMOUNTS.guild_id, AMOUNTS.id, AMOUNTS.coin, COALESCE(SUM(TRANSACTIONS.coin), 0) FROM AMOUNTS '
+                                  'LEFT JOIN TRANSACTIONS ON TRANSACTIONS.guild_id = AMOUNTS.guild_id AND TRANSACTIONS.id = AMOUNTS.id '
+                                  'GROUP BY AMOUNTS.guild_id, AMOUNTS.id').fetchall()
+
+    rows = await commands.sql.read(audit)
+    balances = {(guildid, memberid): coin for guildid, memberid, coin, _ in rows}
+    wrongRoles = []
+    for guild in guilds:
+        index = commands.role_index(guild)
+        wrongRoles += [member for member in guild.members
+                       if [index.parse(role) for role in index.roles_of(member.id)] != [index.key(balances[(guild.id, member.id)])]
+                       or len(member.roles) != 1]
+    drifted = [(guildid, memberid, coin, startingCoin + recorded) for guildid, memberid, coin, recorded in rows if coin != startingCoin + recorded]
+    stale = [key for key, coin in balances.items() if commands.balances.get(key) not in (coin, commands.MISSING)]
+    print(f'{operations} operations on {guildCount} guilds of {memberCount} members in {elapsed:.2f} s ({operations / elapsed:.0f}/s), '
+          f'{len(commands.accountLocks)} locks left over, {sum(guild.restCalls for guild in guilds)} role calls')
+    print(f'ledger total {sum(balances.values())}, expected {startingCoin * memberCount * guildCount + sum(row[3] for row in rows)}')
+    if drifted or stale or wrongRoles or len(rows) != memberCount * guildCount:
+        print(f'FAILED: {len(rows)} wallets, {len(drifted)} do not match their transactions, {len(stale)} cached balances are stale, '
+              f'{len(wrongRoles)} members have the wrong wallet roles')
+        for guildid, memberid, coin, expected in drifted[:5]:
+            print(f'  {memberid} in {guildid}: {coin}, transactions say {expected}')
+        return False
+    print('OK: every wallet matches its transactions, the cache matches the ledger and every member has the right role')
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.stress_locks')
+    parser.add_argument('--operations', type=int, default=5000)
+    parser.add_argument('--members', type=int, default=20)
+    parser.add_argument('--guilds', type=int, default=2)
+    parser.add_argument('--role-tiers', help='show wallets as tier roles: comma separated boundaries or one rounding step')
+    args = parser.parse_args()
+
+    overrides = {}
+    if args.role_tiers:
+        tiers = [int(bound) for bound in args.role_tiers.split(',')]
+        overrides = {'roleMode': 'tiers', 'roleTiers': tiers if len(tiers) > 1 else tiers[0]}
+    # the bot's modules read ../config.yml and open the ledger when imported
+    os.chdir(workspace(**overrides))
+    sys.path.insert(0, os.path.join(root, 'src'))
+    sys.exit(0 if asyncio.run(stress(args.operations, args.members, args.guilds)) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Runs every hot path benchmark against one ledger size. Started by benchmarks/__main__.py in a fresh process from a
+# throwaway working directory, because the bot's modules read config.yml and open the ledger when imported.
+# Usage: python -m benchmarks.suite TRANSACTIONS MEMBERS [benchmark names...]
+import asyncio
+import sys
+import time
+import config
+from benchmarks.fakes import FakeGuild, FakeChannel, FakeMessage, FakeClient
+from benchmarks.fixtures import build_ledger
+from benchmarks.harness import measure, header
+
+
+async def main(transactions: int, memberCount: int, only: list):
+    guild = FakeGuild(memberCount)
+    start = time.perf_counter()
+    build_ledger(config.getAttribute('dbFile'), guild.id, [member.id for member in guild.members], transactions)
+    print(f'{transactions} transactions between {memberCount} members, ledger built in {time.perf_counter() - start:.1f} s')
+
+    # imported only now so the ledger thread opens the fixture rather than an empty file
+    import commands
+    import discord_client
+    import outbound
+    import renderer
+
+    channel = FakeChannel(config.getAttribute('channelName'))
+    members = guild.members
+    client = FakeClient()
+    commands.build_role_index(guild)
+
+    def cold():
+        commands.chartQueries.clear()
+        commands.renderCache.clear()
+
+    def message(i: int, content: str, mentions: bool):
+        author = members[i % len(members)]
+        target = members[(i + 1) % len(members)]
+        if mentions:
+            content = content.replace('@user', target.mention)
+        return FakeMessage(guild, channel, author, content, [target] if mentions else [])
+
+    async def add_coin(i):
+        await commands.add_coin(guild, members[i % len(members)], 1)
+
+    async def add_coin_concurrent(i):
+        await asyncio.gather(*[commands.add_coin(guild, member, 1) for member in members[:100]])
+
+    async def movements(i):
+        await commands.get_movements(guild, 'year', i % 2 == 0)
+
+    async def rankings(i):
+        await commands.compute_rankings(guild)
+
+    chartData = [(member.id, 1000 + 37 * i) for i, member in enumerate(members[:10])]
+
+    async def graph(i):
+        await commands.graph_amounts(guild, chartData, 'Benchmark')
+
+    async def wheel(i):
+        await commands.generate_wheel(members[:5])
+
+    async def dispatch_command(i):
+        await discord_client.Client.on_message(client, message(i, '!brokecheck @user', True))
+
+    async def dispatch_typo(i):
+        await discord_client.Client.on_message(client, message(i, '!rankngs', False))
+
+    # a command reply queued behind a burst of wallet role updates in a guild with slow REST calls
+    churnGuild = FakeGuild(50, latency=0.01)
+    commands.build_role_index(churnGuild)
+    churn = []
+
+    def role_churn():
+        churn.extend(asyncio.ensure_future(commands.update_role(churnGuild, member, 1000 + len(churn)))
+                     for member in churnGuild.members)
+
+    async def reply_under_churn(i):
+        await outbound.reply(message(i, '!balance', False), 'Balance')
+
+    benchmarks = [
+        ('add_coin', add_coin, 1000, {}),
+        ('add_coin x100 gathered', add_coin_concurrent, 20, {}),
+        ('get_movements', movements, 20, {'reset': cold}),
+        ('compute_rankings', rankings, 20, {'reset': cold}),
+        ('graph_amounts', graph, 20, {'reset': commands.renderCache.clear}),
+        ('generate_wheel', wheel, 5, {}),
+        ('dispatch command', dispatch_command, 2000, {}),
+        ('dispatch typo', dispatch_typo, 2000, {}),
+        ('reply under role churn', reply_under_churn, 10, {'reset': role_churn}),
+    ]
+    print(header)
+    for name, call, runs, options in benchmarks:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        result = await measure(name, call, runs, **options)
+        print(result.row(), flush=True)
+    await asyncio.gather(*churn)
+    # let the background role sync finish before looking at roles
+    while commands.roleSync.task and not commands.roleSync.task.done():
+        await commands.roleSync.task
+    print(f'{guild.restCalls} simulated REST calls, {channel.sent} messages sent')
+    renderer.pool().shutdown()
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3:]))
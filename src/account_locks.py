@@ -0,0 +1,41 @@
+import asyncio
+import contextlib
+
+
+class AccountLock:
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # coroutines holding or waiting for the lock, it is dropped once this is back to zero
+        self.users = 0
+
+
+# One asyncio lock per member id, created on demand and dropped when nobody needs it. Operations on several members
+# take their locks in id order, so two of them can never wait on each other, and operations on different members
+# never wait at all.
+class AccountLocks:
+    def __init__(self):
+        self.locks = {}
+
+    @contextlib.asynccontextmanager
+    async def hold(self, *memberids: int):
+        registered, held = [], []
+        try:
+            for memberid in sorted(set(memberids)):
+                entry = self.locks.get(memberid)
+                if entry is None:
+                    entry = self.locks[memberid] = AccountLock()
+                entry.users += 1
+                registered.append(entry)
+                await entry.lock.acquire()
+                held.append(entry)
+            yield
+        finally:
+            for entry in held:
+                entry.lock.release()
+            for memberid, entry in zip(sorted(set(memberids)), registered):
+                entry.users -= 1
+                if entry.users == 0:
+                    del self.locks[memberid]
+
+    def __len__(self):
+        return len(self.locks)
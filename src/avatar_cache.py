@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+import discord
+import renderer
+import metrics
+
+
+# Chart icons keyed by display_avatar.key. Icons are held in memory, backed by a directory on disk kept under a size budget,
+# and misses are downloaded concurrently with at most `concurrency` requests in flight.
+class AvatarCache:
+    def __init__(self, directory: str, maxBytes: int, maxEntries: int, concurrency: int):
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxEntries = maxEntries
+        self.concurrency = concurrency
+        self.icons = OrderedDict()
+        self.index = None
+        self.diskSize = 0
+        self.fetches = {}
+        self.semaphore = None
+
+    # Reads the directory once, oldest files first so they are evicted first
+    def scan_directory(self):
+        os.makedirs(self.directory, exist_ok=True)
+        entries = sorted(os.scandir(self.directory), key=lambda entry: entry.stat().st_mtime)
+        return OrderedDict((entry.name[:-len('.png')], entry.stat().st_size) for entry in entries if entry.name.endswith('.png'))
+
+    def path(self, key: str):
+        return os.path.join(self.directory, f'{key}.png')
+
+    # Returns the icons for a list of avatar assets in the same order, fetching any misses in parallel
+    async def get_many(self, assets: list):
+        return await asyncio.gather(*[self.get(asset) for asset in assets])
+
+    async def get(self, asset: discord.Asset):
+        icon = self.icons.get(asset.key)
+        if icon is not None:
+            self.icons.move_to_end(asset.key)
+            return icon
+        # members sharing an avatar, or two charts at once, wait on the same fetch
+        fetch = self.fetches.get(asset.key)
+        if fetch is None:
+            fetch = asyncio.ensure_future(self.load(asset))
+            self.fetches[asset.key] = fetch
+            fetch.add_done_callback(lambda _: self.fetches.pop(asset.key, None))
+        return await fetch
+
+    async def load(self, asset: discord.Asset):
+        if self.index is None:
+            index = await asyncio.to_thread(self.scan_directory)
+            if self.index is None:
+                self.index = index
+                self.diskSize = sum(index.values())
+        icon = None
+        if asset.key in self.index:
+            self.index.move_to_end(asset.key)
+            try:
+                icon = await asyncio.to_thread(self.read_file, asset.key)
+            except OSError:
+                self.diskSize -= self.index.pop(asset.key, 0)
+        if icon is None:
+            if self.semaphore is None:
+                self.semaphore = asyncio.Semaphore(self.concurrency)
+            async with self.semaphore:
+                with metrics.timed('discord', 'GET avatar'):
+                    data = await asset.read()
+            icon = await renderer.render('mask_icon', data)
+            await asyncio.to_thread(self.write_file, asset.key, icon)
+            evicted = self.record(asset.key, len(icon))
+            if evicted:
+                await asyncio.to_thread(self.remove_files, evicted)
+        self.remember(asset.key, icon)
+        return icon
+
+    def remember(self, key: str, icon: bytes):
+        self.icons[key] = icon
+        self.icons.move_to_end(key)
+        while len(self.icons) > self.maxEntries:
+            self.icons.popitem(last=False)
+
+    def read_file(self, key: str):
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+
+    def write_file(self, key: str, icon: bytes):
+        with open(self.path(key), 'wb') as f:
+            f.write(icon)
+
+    # Adds a new file to the index and returns the keys pushed out of the disk budget
+    def record(self, key: str, size: int):
+        self.index[key] = size
+        self.diskSize += size
+        evicted = []
+        while self.diskSize > self.maxBytes and len(self.index) > 1:
+            oldest, oldSize = self.index.popitem(last=False)
+            self.diskSize -= oldSize
+            evicted.append(oldest)
+        return evicted
+
+    def remove_files(self, keys: list):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except OSError as e:
+                logging.warning('Could not remove cached avatar ' + key + ': ' + str(e))
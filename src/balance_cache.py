@@ -0,0 +1,34 @@
+from collections import OrderedDict
+
+
+# Returned by BalanceCache.get when a member has not been loaded yet
+MISSING = object()
+
+
+# Bounded LRU map of member id -> balance. A balance of None means the member is known to have no wallet.
+# The ledger write functions in commands keep it in step with the database.
+class BalanceCache:
+    def __init__(self, maxSize: int):
+        self.maxSize = maxSize
+        self.entries = OrderedDict()
+
+    def get(self, memberid: int):
+        amount = self.entries.get(memberid, MISSING)
+        if amount is not MISSING:
+            self.entries.move_to_end(memberid)
+        return amount
+
+    def put(self, memberid: int, amount):
+        self.entries[memberid] = amount
+        self.entries.move_to_end(memberid)
+        while len(self.entries) > self.maxSize:
+            self.entries.popitem(last=False)
+
+    def discard(self, memberid: int):
+        self.entries.pop(memberid, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,189 @@
+# Everything drawn by the bot. This module pulls in numpy, PIL and matplotlib, so only the renderer worker processes import it.
+import datetime
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageDraw
+import matplotlib.style
+import matplotlib.image
+from matplotlib.figure import Figure
+from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+
+
+# Matplotlib styling, applied per render so figures never share global pyplot state
+style = ['dark_background', {
+    'text.color': '0.9',  # very light grey
+    'axes.labelcolor': '0.9',
+    'xtick.color': '0.9',
+    'ytick.color': '0.9',
+    'figure.facecolor': '#212946',  # bluish dark grey
+    'axes.facecolor': '#212946',
+    'savefig.facecolor': '#212946',
+    'font.family': 'Tahoma',
+    'font.size': 16,
+}]
+
+icon_size = (44, 44)
+icon_mask = Image.new('L', (128, 128))
+mask_draw = ImageDraw.Draw(icon_mask)
+mask_draw.ellipse((0, 0, 128, 128), fill=255)
+
+
+# Draws a throwaway chart so fonts and the style are loaded before the first real request
+def warm_up():
+    render_bar_chart(['warm up'], [1], [(0, 0, 0)], [mask_icon(blank_icon())], '', '')
+
+
+def blank_icon():
+    buffer = BytesIO()
+    Image.new('RGB', (128, 128)).save(buffer, format='png')
+    return buffer.getvalue()
+
+
+# Turns a downloaded avatar into the round 44px PNG drawn on charts
+def mask_icon(data: bytes):
+    with Image.open(BytesIO(data)) as img:
+        img = img.convert('RGBA').resize((128, 128))
+        img.putalpha(icon_mask)
+        img = img.resize(icon_size)
+        buffer = BytesIO()
+        img.save(buffer, format='png')
+    return buffer.getvalue()
+
+
+# Draws a nice looking horizontal bar chart of values for each member and returns it as PNG bytes.
+# names, amounts, colors and icons are parallel lists, colors are RGB tuples between 0 and 1, icons are PNG bytes.
+def render_bar_chart(names, amounts, colors, icons, title: str, xlabel: str):
+    with matplotlib.style.context(style):
+        fig = Figure()
+        ax = fig.add_subplot()
+        ax.set_axisbelow(True)
+        ax.yaxis.grid(color='.9', linestyle='dashed')
+        ax.xaxis.grid(color='.9', linestyle='dashed')
+        lab_x = [i for i in range(len(amounts))]
+        height = .8
+        ax.barh(lab_x, amounts, height=height, color=colors)
+        ax.set_yticks(lab_x)
+        ax.set_yticklabels(names)
+
+        # create a glowy effect on the plot by plotting different bars
+        n_shades = 5
+        diff_linewidth = .05
+        alpha_value = 0.5 / n_shades
+        for n in range(1, n_shades + 1):
+            ax.barh(lab_x, amounts,
+                    height=(height + (diff_linewidth * n)),
+                    alpha=alpha_value,
+                    color=colors)
+
+        # add user icons to bar charts
+        max_value = max(amounts)
+        for i, (value, icon) in enumerate(zip(amounts, icons)):
+            offset_image(value, i, icon, max_value=max_value, ax=ax)
+
+        ax.set_title(title, fontweight='bold')
+        ax.set_xlabel(xlabel)
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', bbox_inches='tight', pad_inches=.5)
+    return buffer.getvalue()
+
+
+# Draws a member's balance over time as a glowing step line in the same style as the bar charts, returns PNG bytes.
+# days are ISO dates and amounts the balance at the end of each day.
+def render_history(days, amounts, color, title: str, ylabel: str = 'Coin (¢)'):
+    dates = [datetime.date.fromisoformat(day) for day in days]
+    with matplotlib.style.context(style):
+        fig = Figure()
+        ax = fig.add_subplot()
+        ax.set_axisbelow(True)
+        ax.yaxis.grid(color='.9', linestyle='dashed')
+        ax.xaxis.grid(color='.9', linestyle='dashed')
+        ax.step(dates, amounts, where='post', color=color, linewidth=2)
+
+        # create a glowy effect on the plot by drawing wider, fainter copies of the line
+        n_shades = 5
+        diff_linewidth = 1.05
+        alpha_value = 0.5 / n_shades
+        for n in range(1, n_shades + 1):
+            ax.step(dates, amounts, where='post', color=color,
+                    linewidth=2 + (diff_linewidth * n),
+                    alpha=alpha_value)
+        ax.fill_between(dates, amounts, step='post', color=color, alpha=0.1)
+
+        fig.autofmt_xdate()
+        ax.set_title(title, fontweight='bold')
+        ax.set_ylabel(ylabel)
+        buffer = BytesIO()
+        fig.savefig(buffer, format='png', bbox_inches='tight', pad_inches=.5)
+    return buffer.getvalue()
+
+
+# Adds discord icons to bar chart
+def offset_image(x, y, icon, max_value, ax):
+    img = matplotlib.image.imread(BytesIO(icon), format='png')
+    im = OffsetImage(img, zoom=0.65)
+    im.image.axes = ax
+    x_offset = -25
+    # if bar is too short to show icon
+    if 0 <= x < max_value / 5:
+        x = x + max_value // 8
+    elif x < max_value / 5:
+        x = 0
+    ab = AnnotationBbox(im, (x, y), xybox=(x_offset, 0), frameon=False,
+                        xycoords='data', boxcoords="offset points", pad=0)
+    ax.add_artist(ab)
+
+
+# Computes the rotation of the wheel (in degrees) for every frame of the spin so that win_ang ends up at the top
+def spin_rotations(win_ang: int):
+    #generate time mesh for acceleration function to operate on
+    #set to be 7 "seconds" polled at .1 seconds found this gave enough
+    #points to make a smoother gif
+    time_mesh = np.arange(0.0, 7.0, 0.1)
+
+    #starting set of rotations I found to look like someone is pulling a wheel back for
+    #a rather large spin. can be messed around with
+    start_animation = np.array([0.0, -0.75, -1.5, -2.25, -3.0, -3.75, -4.5, -5.25])
+
+    #i picked e^2t for no real reason other than it makes the wheel get up to speed quick
+    acceleration = np.where(time_mesh <= 2.0, np.exp(2 * time_mesh), 0.0)
+
+    #now calculate distance traveled in degrees from the original image for each point in the
+    #time mesh using basic rotational dynamics, starting at the last part of the pullback.
+    #the first mesh point is t=0 so it adds nothing to either running sum
+    velocities = np.cumsum(acceleration * time_mesh)
+    spin = start_animation[-1] + np.cumsum(velocities * time_mesh)
+
+    #reguardless of where we ended up, square up the last point with the original image so we can
+    #position the wheel where the winning slice always hits the top
+    win_ang_pos = spin[-1] + (360 - (spin[-1] % 360))
+
+    #in order to hit the top of the circle, find the distance from the winning angle to 270(the top
+    #of the circle). The minus 180 here is used to get the more gentle stop from the end_animation
+    #array
+    stop = win_ang_pos + (270 - win_ang) - 180 if win_ang <= 270 else win_ang_pos + 360 - (win_ang - 270) - 180
+    end_animation = stop + np.cumsum([45, 45, 25, 20, 20, 10, 5, 2, 1, 1, 1])
+
+    return np.concatenate((start_animation, spin, [win_ang_pos, stop], end_animation))
+
+
+# Draws the wheel once as a palette image and saves its rotated frames as an optimized gif, returns the gif bytes.
+# Pillow's gif writer holds every frame until the file is written, what keeps memory down is the small palette canvas.
+# colors holds one RGB tuple per player, slices are drawn clockwise from 3 o'clock in that order.
+def render_wheel(colors, win_ang: int, canvas_size: int = 400):
+    wheel_offset = max(canvas_size // 200, 1)
+    bounding_box = [(wheel_offset, wheel_offset), (canvas_size - wheel_offset, canvas_size - wheel_offset)]
+    sliceDegree = 360 / len(colors)
+
+    # palette index 0 is the background, 1 the outline and 2.. the players
+    palette = [(0xDD, 0xDD, 0xDD), (0, 0, 0)] + [tuple(color) for color in colors]
+    wheel = Image.new('P', (canvas_size, canvas_size), 0)
+    wheel.putpalette([channel for color in palette for channel in color])
+    # TODO: FIX WHEEL STYLE AND ADD TEXT
+    wheelDraw = ImageDraw.Draw(wheel)
+    for i in range(len(colors)):
+        wheelDraw.pieslice(bounding_box, start=i * sliceDegree, end=(i + 1) * sliceDegree, fill=i + 2, width=max(canvas_size // 200, 1), outline=1)
+
+    frames = (wheel.rotate(-rotation, expand=False, fillcolor=0) for rotation in spin_rotations(win_ang))
+    buffer = BytesIO()
+    wheel.save(buffer, format='GIF', save_all=True, append_images=frames, optimize=True, duration=100)
+    return buffer.getvalue()
@@ -0,0 +1,147 @@
+import discord
+import metrics
+import outbound
+
+
+# A chat command: the coroutine that runs it, how its arguments are parsed and who is allowed to use it
+class Command:
+    def __init__(self, name: str, handler, parser=None, check=None, usage: str = None, error: str = None):
+        self.name = name
+        self.handler = handler
+        # parser(message) returns a tuple of arguments for the handler, or None if the message is malformed
+        self.parser = parser
+        # check(member) returns False for members that may not run the command
+        self.check = check
+        self.usage = usage or name
+        self.error = error or f'Error parsing command. Follow the format: `{self.usage}`'
+
+
+# Maps the first word of a message to its command, so dispatch costs one split and one dict lookup however many commands exist
+class CommandRegistry:
+    def __init__(self):
+        self.commands = {}
+
+    def register(self, name: str, handler, parser=None, check=None, usage: str = None, error: str = None):
+        self.commands[name] = Command(name, handler, parser, check, usage, error)
+        return handler
+
+    # Decorator form of register
+    def command(self, name: str, parser=None, check=None, usage: str = None, error: str = None):
+        def decorator(handler):
+            return self.register(name, handler, parser, check, usage, error)
+        return decorator
+
+    # Whether member may run the command called name
+    def permitted(self, name: str, member: discord.Member):
+        command = self.commands.get(name)
+        return command is not None and (command.check is None or command.check(member))
+
+    def names(self):
+        return list(self.commands.keys())
+
+    # Runs the command a message starts with. Returns 'handled', 'unknown' if there is no such command or
+    # 'not permitted' if the author may not use it.
+    async def dispatch(self, message: discord.Message):
+        words = message.content.split(maxsplit=1)
+        command = self.commands.get(words[0]) if words else None
+        if command is None:
+            return 'unknown'
+        if command.check and not command.check(message.author):
+            return 'not permitted'
+        with metrics.timed('command', command.name):
+            args = ()
+            if command.parser:
+                args = command.parser(message)
+                if args is None:
+                    await outbound.reply(message, command.error)
+                    return 'handled'
+            await command.handler(message, *args)
+        return 'handled'
+
+
+#############################################################
+# Argument parsers shared by commands
+#############################################################
+def is_amount(word: str):
+    return word.lstrip('-').isnumeric()
+
+
+# [user]
+def parse_member(message: discord.Message):
+    if message.mentions:
+        return (message.mentions[0],)
+    return None
+
+
+# [user1] [user2] ...
+def parse_members(message: discord.Message):
+    if message.mentions:
+        return (message.mentions,)
+    return None
+
+
+# [user] [amount]
+def parse_member_amount(message: discord.Message):
+    messageContent = message.content.split()
+    if message.mentions and len(messageContent) == 3 and is_amount(messageContent[2]):
+        return message.mentions[0], int(messageContent[2])
+    return None
+
+
+# [user] [amount] [reason]
+def parse_member_amount_reason(message: discord.Message):
+    messageContent = message.content.split(sep=None, maxsplit=3)
+    if message.mentions and len(messageContent) == 4 and is_amount(messageContent[2]):
+        return message.mentions[0], int(messageContent[2]), messageContent[3]
+    return None
+
+
+# [amount], positive only
+def parse_amount(message: discord.Message):
+    messageContent = message.content.split()
+    if len(messageContent) == 2 and messageContent[1].isnumeric():
+        return (int(messageContent[1]),)
+    return None
+
+
+# [week|month|year]
+def parse_period(message: discord.Message):
+    messageContent = message.content.split()
+    if len(messageContent) > 1 and messageContent[1] in ['week', 'month', 'year']:
+        return (messageContent[1],)
+    return None
+
+
+# [user], optional, None when no one is mentioned
+def parse_optional_member(message: discord.Message):
+    messageContent = message.content.split()
+    if len(messageContent) > 2 or (len(messageContent) == 2 and not message.mentions):
+        return None
+    return (message.mentions[0] if message.mentions else None,)
+
+
+# [page], optional and positive, defaults to 1
+def parse_page(message: discord.Message):
+    messageContent = message.content.split()
+    if len(messageContent) == 1:
+        return (1,)
+    if len(messageContent) == 2 and messageContent[1].isnumeric() and int(messageContent[1]) > 0:
+        return (int(messageContent[1]),)
+    return None
+
+
+# [user] [week|month|year], both optional: the member defaults to None and the period to month
+def parse_history(message: discord.Message):
+    messageContent = message.content.split()
+    periods = [word for word in messageContent[1:] if word in ['week', 'month', 'year']]
+    if len(messageContent) - 1 > len(periods) + len(message.mentions[:1]):
+        return None
+    return (message.mentions[0] if message.mentions else None), (periods[0] if periods else 'month')
+
+
+# [directory]
+def parse_directory(message: discord.Message):
+    messageContent = message.content.split(maxsplit=1)
+    if len(messageContent) == 2:
+        return (messageContent[1].strip(),)
+    return None
@@ -0,0 +1,61 @@
+# Suggests known commands for a mistyped one. Every command is indexed once under all the strings reachable by deleting
+# up to maxDistance characters (a symmetric delete index), so a lookup only generates the deletes of the typo and
+# scores the few commands that share one of them.
+class CommandSuggester:
+    def __init__(self, maxDistance: int = 2):
+        self.maxDistance = maxDistance
+        self.words = set()
+        self.index = {}
+        self.longest = 0
+
+    def add(self, word: str):
+        if word in self.words:
+            return
+        self.words.add(word)
+        self.longest = max(self.longest, len(word))
+        for variant in deletes(word, self.maxDistance):
+            self.index.setdefault(variant, set()).add(word)
+
+    def add_all(self, words):
+        for word in words:
+            self.add(word)
+
+    # Returns up to `limit` known commands closest to word, best match first. The word itself is never suggested.
+    def suggest(self, word: str, limit: int = 3):
+        if len(word) > self.longest + self.maxDistance:
+            return []
+        candidates = set()
+        for variant in deletes(word, self.maxDistance):
+            candidates.update(self.index.get(variant, ()))
+        scored = []
+        for candidate in candidates:
+            distance = edit_distance(word, candidate)
+            if 0 < distance <= self.maxDistance:
+                scored.append((distance, candidate))
+        scored.sort()
+        return [candidate for _, candidate in scored[:limit]]
+
+
+# The word itself plus every string made by deleting up to maxDistance of its characters
+def deletes(word: str, maxDistance: int):
+    variants = {word}
+    frontier = {word}
+    for _ in range(maxDistance):
+        frontier = {variant[:i] + variant[i + 1:] for variant in frontier for i in range(len(variant))}
+        variants |= frontier
+    return variants
+
+
+# Optimal string alignment distance: insertions, deletions, substitutions and swaps of neighbouring characters
+def edit_distance(a: str, b: str):
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[len(b)]
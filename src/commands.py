@@ -1,183 +1,438 @@
-from random import randint
 import discord
 import config
 import sql_client as sql
+from balance_cache import BalanceCache, MISSING
+from role_sync import RoleSyncQueue
+from wallet_roles import WalletRoleIndex, ExactRoles, TierRoles
+from render_cache import RenderCache
+from avatar_cache import AvatarCache
+from leaderboard import Leaderboard
+from account_locks import AccountLocks
+import snapshots
+import renderer
+import metrics
+import outbound
 import logging
-from io import BytesIO
-from PIL import Image, ImageDraw
-import os
+import asyncio
+import time
 from typing import List
-import matplotlib.pyplot as plt
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
 import datetime
-from math import atan, exp
-import numpy as np
 import random
+import itertools
 
-if not os.path.exists('../tmp'):
-    os.makedirs('../tmp')
+# Write-through cache of wallet balances keyed by (guild id, member id), the DB is only read on a miss
+balances = BalanceCache(config.getAttribute('balanceCacheSize', 10000))
+# When set, every cache hit is checked against the DB and mismatches are logged
+debugBalanceCache = config.getAttribute('debugBalanceCache', False)
 
-# Matplotlib styling
-plt.style.use('dark_background')
-for param in ['text.color', 'axes.labelcolor', 'xtick.color', 'ytick.color']:
-    plt.rcParams[param] = '0.9'  # very light grey
-for param in ['figure.facecolor', 'axes.facecolor', 'savefig.facecolor']:
-    plt.rcParams[param] = '#212946'  # bluish dark grey
-plt.rcParams['font.family'] = 'Tahoma'
-plt.rcParams['font.size'] = 16
+# Rendered charts keyed by a hash of their inputs, plus the query results they were drawn from
+renderCache = RenderCache(config.getAttribute('renderCacheBytes', 32 * 1024 * 1024))
+# only ever holds results read at the current ledger generation, see cached_query
+chartQueries = {}
+chartQueriesGeneration = None
 
-icon_size = (44, 44)
-icon_mask = Image.new('L', (128, 128))
-mask_draw = ImageDraw.Draw(icon_mask)
-mask_draw.ellipse((0, 0, 128, 128), fill=255)
+# Balance changes are single ledger jobs and need no locking, these are held around the steps that read a balance
+# and then act on it across awaits (a wallet's set up or its role update) so they never interleave for one member.
+# Locks are taken on (guild id, member id), a member's wallets in different guilds are unrelated.
+accountLocks = AccountLocks()
+
+# Every wallet of a guild in rank order per guild id, each loaded on first use
+leaderboards = {}
+leaderboardLoads = {}
+
+# Masked chart icons, in memory and on disk
+avatars = AvatarCache(config.getAttribute('avatarCacheDir', '../tmp/avatars'), config.getAttribute('avatarCacheBytes', 16 * 1024 * 1024),
+                      config.getAttribute('avatarCacheEntries', 1000), config.getAttribute('avatarFetchConcurrency', 8))
+
+
+# Admin and dev status per (guild id, member id), cleared whenever the member's roles change
+permissionCache = {}
+
+
+def member_permissions(member: discord.Member):
+    key = (member.guild.id, member.id)
+    permissions = permissionCache.get(key)
+    if permissions is None:
+        roleNames = [role.name for role in member.roles]
+        isAdmin = any('CactusCoinDev' in name or 'President' in name or 'Vice President' in name for name in roleNames)
+        isDev = any('CactusCoinDev' in name for name in roleNames)
+        permissions = permissionCache[key] = (isAdmin, isDev)
+    return permissions
+
+
+# Forgets cached permissions for one member, or for everyone when a role itself changes
+def invalidate_permissions(member: discord.Member = None):
+    if member is None:
+        permissionCache.clear()
+    else:
+        permissionCache.pop((member.guild.id, member.id), None)
 
 
 # Checks admin status for a member for specific admin only functionality.
 def is_admin(member: discord.Member):
-    roleNames = [role.name for role in member.roles if 'CactusCoinDev' in role.name or 'President' in role.name or 'Vice President' in role.name]
-    if roleNames:
-        return True
-    return False
+    return member_permissions(member)[0]
 
 
 def is_dev(member: discord.Member):
-    roleNames = [role.name for role in member.roles if 'CactusCoinDev' in role.name]
-    if roleNames:
-        return True
-    return False
+    return member_permissions(member)[1]
+
+
+# Wallet role index for each guild id, built in on_ready and kept current by the role and member events
+roleIndexes = {}
 
 
-# Creates a cactus coin role that denotes the amount of coin a member has.
+# How balances are shown as roles in a guild: one role per amount (roleMode exact) or a fixed set of ranges (roleMode
+# tiers), where roleTiers is either a list of boundaries or a number balances are rounded down to
+def role_scheme(guildid: int):
+    prefix = config.getGuildAttribute(guildid, 'rolePrefix', 'Cactus Coin')
+    if config.getGuildAttribute(guildid, 'roleMode', 'exact') != 'tiers':
+        return ExactRoles(prefix)
+    tiers = config.getGuildAttribute(guildid, 'roleTiers', 1000)
+    if isinstance(tiers, list) and tiers and all(isinstance(bound, int) and not isinstance(bound, bool) for bound in tiers):
+        return TierRoles(prefix, bounds=tiers)
+    if isinstance(tiers, int) and not isinstance(tiers, bool) and tiers > 0:
+        return TierRoles(prefix, step=tiers)
+    raise ValueError(f'roleTiers for guild {guildid} must be a positive whole number or a non-empty list of whole numbers, not {tiers!r}')
+
+
+def build_role_index(guild: discord.Guild):
+    roleIndexes[guild.id] = WalletRoleIndex.build(guild, role_scheme(guild.id))
+    return roleIndexes[guild.id]
+
+
+def role_index(guild: discord.Guild):
+    index = roleIndexes.get(guild.id)
+    if index is None:
+        index = build_role_index(guild)
+    return index
+
+
+# Role creations in flight per (guild id, amount), so concurrent role updates for the same amount share one new role
+pendingRoles = {}
+
+
+# Creates a cactus coin role that denotes the amount of coin a member has, or the tier it falls in.
 async def create_role(guild: discord.Guild, amount: int):
     # avoid duplicating roles whenever possible
-    prefix = config.getAttribute('rolePrefix', 'Cactus Coin')
-    newRoleName = f'{prefix}: ' + str(amount)
-    existingRole = [role for role in guild.roles if role.name == newRoleName]
+    index = role_index(guild)
+    roleKey = index.key(amount)
+    existingRole = index.get(roleKey)
     if existingRole:
-        return existingRole[0]
-    return await guild.create_role(name=newRoleName, reason='Cactus Coin: New CC amount.', color=discord.Color.dark_gold())
+        return existingRole
+    key = (guild.id, roleKey)
+    creation = pendingRoles.get(key)
+    if creation is None:
+        creation = asyncio.ensure_future(outbound.create_role(guild, name=index.role_name(roleKey), reason='Cactus Coin: New CC amount.',
+                                                              color=discord.Color.dark_gold()))
+        pendingRoles[key] = creation
+        creation.add_done_callback(lambda _: pendingRoles.pop(key, None))
+    role = await creation
+    index.add_role(role)
+    return role
 
 
 # Removes the cactus coin role from the member's role and from the guild if necessary
-async def remove_role(guild: discord.Guild, member: discord.Member):
-    cactusRoles = [role for role in member.roles if 'Cactus Coin:' in role.name]
+async def remove_role(guild: discord.Guild, member: discord.Member, keep: discord.Role = None):
+    index = role_index(guild)
+    cactusRoles = [role for role in index.roles_of(member.id) if role != keep]
     if cactusRoles:
-        cactusRole = cactusRoles[0]
-        await member.remove_roles(cactusRole)
-        # if the current user is the only one with the role or there are no users with the role
-        await clear_old_roles(guild)
+        await outbound.remove_roles(member, *cactusRoles)
+        # only roles whose last holder just left can be empty now
+        emptyRoles = [role for role in cactusRoles if index.remove_holder(member.id, role)]
+        await clear_old_roles(guild, emptyRoles)
 
 
 # Verifies the state of a user's role denoting their coin, creates it if it doesn't exist.
-async def verify_coin(guild: discord.Guild, member: discord.Member, amount: int = config.getAttribute('defaultCoin')):
+async def verify_coin(guild: discord.Guild, member: discord.Member, amount: int = None):
+    if amount is None:
+        amount = config.getGuildAttribute(guild.id, 'defaultCoin')
     # update coin for member who has cactus coin in database
-    db_amount = get_coin(member.id)
-    if db_amount:
-        amount = db_amount
-        logging.debug('Found coin for ' + member.display_name + ': ' + str(db_amount))
-    else:
-        logging.debug('No coin found for ' + member.display_name + ', defaulting to: ' + str(amount))
-        update_coin(member.id, amount)
-
-    roleNames = [role.name for role in member.roles if 'Cactus Coin:' in role.name]
-    if not roleNames:
-        role = await create_role(guild, amount)
-        await member.add_roles(role, reason='Cactus Coin: Role updated for ' + member.name + ' to ' + str(amount))
-
-
-# Deletes all old cactus coin roles
-async def clear_old_roles(guild: discord.Guild):
-    emptyRoles = [role for role in guild.roles if 'Cactus Coin:' in role.name and len(role.members) == 0]
-    for role in emptyRoles:
-        await role.delete(reason='Cactus Coin: Removing unused role.')
-
-
-# Deletes old role and calls function to update new role displaying coin amount
+    async with accountLocks.hold((guild.id, member.id)):
+        db_amount = await get_coin(guild.id, member.id)
+        if db_amount is not None:
+            amount = db_amount
+            logging.debug('Found coin for ' + member.display_name + ': ' + str(db_amount))
+        else:
+            logging.debug('No coin found for ' + member.display_name + ', defaulting to: ' + str(amount))
+            # a wallet created by anything else in the meantime wins
+            if not await create_wallets(guild.id, [(member.id, amount)]):
+                amount = await get_coin(guild.id, member.id)
+
+        if not role_index(guild).roles_of(member.id):
+            await update_role(guild, member, amount)
+
+
+# Brings every member's wallet and role in line in one pass over the guild: one query for all balances, one bulk upsert
+# for members without a wallet and a bounded pool of role updates. Returns (members checked, wallets created, roles fixed, seconds).
+async def reconcile(guild: discord.Guild):
+    start = time.perf_counter()
+    stored = dict(await get_all_coin(guild.id))
+    index = role_index(guild)
+    defaultCoin = config.getGuildAttribute(guild.id, 'defaultCoin')
+
+    members, newWallets, roleFixes = 0, [], []
+    for member in guild.members:
+        if member.bot:
+            continue
+        members += 1
+        amount = stored.get(member.id)
+        if amount is None:
+            amount = defaultCoin
+            newWallets.append((member.id, amount))
+        heldRoles = index.roles_of(member.id)
+        if len(heldRoles) != 1 or index.parse(heldRoles[0]) != index.key(amount):
+            roleFixes.append(member)
+
+    if newWallets:
+        # wallets set up since the balances were read are left alone
+        await create_wallets(guild.id, newWallets)
+
+    semaphore = asyncio.Semaphore(config.getAttribute('reconcileConcurrency', 4))
+
+    # the balance read above only decides who needs a fix, sync_role reads it again under the member's lock so a change
+    # committed in between is not undone
+    async def fix_role(member: discord.Member):
+        async with semaphore:
+            try:
+                await sync_role(guild, member)
+                return True
+            except discord.HTTPException as e:
+                logging.warning('Could not fix wallet role for ' + member.display_name + ': ' + str(e))
+                return False
+
+    fixed = await asyncio.gather(*[fix_role(member) for member in roleFixes])
+    return members, len(newWallets), sum(fixed), time.perf_counter() - start
+
+
+# Deletes the given cactus coin roles if nobody holds them anymore, tier roles are kept for the next member in the tier
+async def clear_old_roles(guild: discord.Guild, roles: List[discord.Role]):
+    index = role_index(guild)
+    if not index.scheme.collect:
+        return
+    for role in roles:
+        if index.holder_count(role) == 0:
+            index.remove_role(role)
+            await outbound.delete_role(role, reason='Cactus Coin: Removing unused role.')
+
+
+# Gives the member the role for their new amount, then removes their old role and deletes it if it is now unused
 async def update_role(guild: discord.Guild, member: discord.Member, amount: int):
-    await remove_role(guild, member)
+    index = role_index(guild)
     role = await create_role(guild, amount)
-    await member.add_roles(role, reason='Cactus Coin: Role updated for ' + member.name + ' to ' + str(amount))
+    if role not in index.roles_of(member.id):
+        # count the member as a holder before awaiting so the role cannot be collected in the meantime
+        index.add_holder(member.id, role)
+        await outbound.add_roles(member, role, reason='Cactus Coin: Role updated for ' + member.name + ' to ' + str(amount))
+    await remove_role(guild, member, keep=role)
 
 
 # Adds a specified coin amount to a member's role and stores in the database
 async def add_coin(guild: discord.Guild, member: discord.Member, amount: int, persist: bool=True):
     memberId = member.id
-    current_coin = get_coin(memberId)
-    current_coin += amount
-    update_coin(memberId, current_coin)
-    if persist:
-        add_transaction(memberId, amount)
-    await update_role(guild, member, current_coin)
+    # read, update and transaction are one ledger job, so concurrent changes to the same wallet cannot lose each other
+    balance = await sql.run(_add_coin, guild.id, memberId, amount, persist, config.getGuildAttribute(guild.id, 'defaultCoin'))
+    store_balance(guild.id, memberId, balance)
+    schedule_role_sync(guild, member, balance)
+
+
+# Puts a member's wallet back to the default amount
+async def reset_coin(guild: discord.Guild, member: discord.Member):
+    schedule_role_sync(guild, member, await update_coin(guild.id, member.id, config.getGuildAttribute(guild.id, 'defaultCoin')))
+
+
+# Brings a member's wallet role in line with the balance currently on record
+async def sync_role(guild: discord.Guild, member: discord.Member):
+    async with accountLocks.hold((guild.id, member.id)):
+        amount = await get_coin(guild.id, member.id)
+        if amount is None:
+            await remove_role(guild, member)
+        else:
+            await update_role(guild, member, amount)
+
+
+# Role changes are debounced per member so a burst of balance changes costs one role update
+roleSync = RoleSyncQueue(sync_role, config.getAttribute('roleSyncDelay', 2), config.getAttribute('roleSyncConcurrency', 4))
+
+
+# Queues a role update after a balance change, unless the member already holds just the role for the new balance.
+# With tier roles that is most changes. A sync already queued still runs, it reads the balance when it does.
+def schedule_role_sync(guild: discord.Guild, member: discord.Member, amount: int):
+    index = role_index(guild)
+    heldRoles = index.roles_of(member.id)
+    if len(heldRoles) == 1 and index.parse(heldRoles[0]) == index.key(amount):
+        return
+    roleSync.schedule(guild, member)
+
+
+# Makes every tier role up front. In tier mode it also deletes the one-per-amount roles left over from exact mode, and
+# then gives their holders a tier role, and deletes step tier roles that nobody holds anymore.
+async def prepare_roles(guild: discord.Guild):
+    index = role_index(guild)
+    for key in index.scheme.keys():
+        await create_role(guild, key)
+    if not isinstance(index.scheme, TierRoles):
+        return
+    if index.scheme.collect:
+        await clear_old_roles(guild, list(index.roles.values()))
+    exact = ExactRoles(config.getGuildAttribute(guild.id, 'rolePrefix', 'Cactus Coin'))
+    oldRoles = [role for role in guild.roles if exact.parse(role.name) is not None]
+    for role in oldRoles:
+        await outbound.delete_role(role, reason='Cactus Coin: Wallet roles are shown as tiers now.')
+    if oldRoles:
+        # reconcile sets up wallets for members without one, legacy wallets have to be in the guild by then
+        await legacyClaimed.wait()
+        await reconcile(guild)
+
+
+# Moves coin from one member to another as a single ledger transaction, returns None if the sender would pass the debt limit
+async def transfer(guild: discord.Guild, fromMember: discord.Member, toMember: discord.Member, amount: int, memo: str = None):
+    return await settle(guild, {fromMember: -amount, toMember: amount}, memo)
+
+
+# Applies a set of balance changes (member -> amount) all at once, e.g. paying out a wheel.
+# Either every balance and transaction is written in one commit or, if anyone would pass the debt limit, nothing is.
+async def settle(guild: discord.Guild, changes: dict, memo: str = None):
+    members = {member.id: member for member in changes}
+    newBalances = await sql.run(_settle, guild.id, [(member.id, amount) for member, amount in changes.items()], memo,
+                                config.getGuildAttribute(guild.id, 'defaultCoin'), config.getGuildAttribute(guild.id, 'debtLimit'))
+    if newBalances is None:
+        return None
+    for memberid, amount in newBalances.items():
+        store_balance(guild.id, memberid, amount)
+        schedule_role_sync(guild, members[memberid], amount)
+    return newBalances
 
 
-# Gets outlier movements either positive or negative and outputs a chart of them
-async def get_movements(guild: discord.Guild, timePeriod: str, isWins: bool):
+# Same as the end of settle, for balances written by other ledger jobs that move coin (bets and wheels)
+def apply_balances(guild: discord.Guild, newBalances: dict):
+    for memberid, amount in newBalances.items():
+        store_balance(guild.id, memberid, amount)
+        member = guild.get_member(memberid)
+        if member:
+            schedule_role_sync(guild, member, amount)
+
+
+# First day of the current week, month or year
+def period_start(timePeriod: str):
     # TODO: FIX TIME PERIODS, GET START OF TIME THEN CONVERT TO UTC
     if timePeriod == 'week':
-        startPeriod = datetime.datetime.now() - datetime.timedelta(days=datetime.datetime.now().weekday())
+        return datetime.date.today() - datetime.timedelta(days=datetime.date.today().weekday())
     elif timePeriod == 'month':
-        startPeriod = datetime.datetime.today().replace(day=1)
+        return datetime.date.today().replace(day=1)
     elif timePeriod == 'year':
-        startPeriod = datetime.date(datetime.date.today().year, 1, 1)
+        return datetime.date(datetime.date.today().year, 1, 1)
+
 
-    transactions = get_transactions(startPeriod)
+# Gets outlier movements either positive or negative and outputs a chart of them
+async def get_movements(guild: discord.Guild, timePeriod: str, isWins: bool):
+    startPeriod = period_start(timePeriod)
+    transactions = await cached_query(('movements', guild.id, startPeriod, isWins), get_top_transactions, guild.id, startPeriod, isWins)
     if not transactions:
         return None
+    # largest movement is drawn at the top of the chart
+    transactions = transactions[::-1]
+
     if isWins:
-        transactions = [i for i in transactions if i[1] > 0]
+        title = 'Greatest Wins From the Past ' + timePeriod.capitalize()
     else:
-        transactions = [i for i in transactions if i[1] < 0]
-    numb_trans = min(len(transactions), 5)
-    transactions = transactions[:numb_trans] if isWins else transactions[-numb_trans:]
-    
-    await graph_amounts(guild, transactions)
-    plt.xlabel('Coin (¢)')
+        title = 'Greatest Losses From the Past ' + timePeriod.capitalize()
+    return await graph_amounts(guild, transactions, title)
 
-    if isWins:
-        plt.title('Greatest Wins From the Past ' + timePeriod.capitalize(), fontweight='bold')
-        filename = f'../tmp/wins-{timePeriod}.png'
-    else:    
-        plt.title('Greatest Losses From the Past ' + timePeriod.capitalize(), fontweight='bold')
-        filename = f'../tmp/losses-{timePeriod}.png'
-    plt.savefig(filename, bbox_inches='tight', pad_inches=.5)
-    plt.close()
-    return filename
-
-
-# Computes power rankings for the server and outputs them in a bar graph in an image
-async def compute_rankings(guild: discord.Guild):
-    rankings = get_coin_rankings()
-    await graph_amounts(guild, rankings)
+
+# Charts a member's balance over the period from their daily snapshots, returns PNG bytes or None without history
+async def get_history(member: discord.Member, timePeriod: str):
+    startPeriod = period_start(timePeriod)
+    history = await cached_query(('history', member.guild.id, member.id, startPeriod), snapshots.get_history, member.guild.id, member.id, startPeriod)
+    if not history:
+        return None
+    days = [max(day, startPeriod.isoformat()) for day, _ in history]
+    amounts = [amount for _, amount in history]
+    # carry the latest balance through to today
+    today = datetime.datetime.utcnow().date().isoformat()
+    if days[-1] != today:
+        days.append(today)
+        amounts.append(amounts[-1])
+
+    title = f'{member.display_name}\'s Wallet This {timePeriod.capitalize()}'
+    memberC = member.color if member.color != discord.Color.default() else discord.Color.blurple()
+    color = tuple(t/255. for t in (memberC.r, memberC.g, memberC.b))
+    key = RenderCache.key(title, days, amounts, color)
+    chart = renderCache.get(key)
+    metrics.count('renderCache', 'miss' if chart is None else 'hit')
+    if chart is None:
+        chart = await renderer.render('render_history', days, amounts, color, title)
+        renderCache.put(key, chart)
+    return chart
+
+
+# Returns a guild's leaderboard, loading it from the ledger the first time. Concurrent callers share one load.
+async def get_leaderboard(guildid: int):
+    leaderboard = leaderboards.get(guildid)
+    if leaderboard is None:
+        leaderboard = leaderboards[guildid] = Leaderboard()
+    if not leaderboard.loaded:
+        load = leaderboardLoads.get(guildid)
+        if load is None:
+            load = leaderboardLoads[guildid] = asyncio.ensure_future(load_leaderboard(guildid, leaderboard))
+            load.add_done_callback(lambda _: leaderboardLoads.pop(guildid, None))
+        await asyncio.shield(load)
+    return leaderboard
+
+
+async def load_leaderboard(guildid: int, leaderboard: Leaderboard):
+    leaderboard.begin_load()
+    try:
+        leaderboard.finish_load(await get_coin_rankings(guildid))
+    except Exception:
+        leaderboard.clear()
+        raise
+
+
+# Computes power rankings for the server and outputs one page of them in a bar graph as PNG bytes.
+# Members who have left the server are skipped.
+async def compute_rankings(guild: discord.Guild, page: int = 1):
+    board = await get_leaderboard(guild.id)
+    pageSize = config.getAttribute('rankingsPageSize', 10)
+    present = ((memberid, amount) for memberid, amount in board.iterate() if guild.get_member(memberid))
+    rankings = list(itertools.islice(present, (page - 1) * pageSize, page * pageSize))
+    if not rankings:
+        return None
     today = datetime.date.today().strftime("%m-%d-%Y")
-    plt.title('Cactus Gang Power Rankings\n' + today, fontweight='bold')
-    plt.xlabel('Coin (¢)')
-    plt.savefig(f'../tmp/power-rankings-{today}.png', bbox_inches='tight', pad_inches=.5)
-    plt.close()
-    return f'../tmp/power-rankings-{today}.png'
+    title = 'Cactus Gang Power Rankings\n' + today
+    if page > 1:
+        title += f' (Page {page})'
+    # richest is drawn at the top of the chart
+    return await graph_amounts(guild, rankings[::-1], title)
+
+
+# Returns (position, number of wallets, amount) for a member in a guild, or None if they have no wallet there
+async def get_rank(guildid: int, memberid: int):
+    board = await get_leaderboard(guildid)
+    position = board.rank(memberid)
+    if position is None:
+        return None
+    return position, len(board), board.amounts[memberid]
 
 
 # Generic function for graphing a nice looking bar chart of values for each member
-# This function does not set plot title, axis titles, or close the plot
-async def graph_amounts(guild: discord.Guild, data):
-    # pull all images of ranking members from Discord
-    memberIcons, memberNames, memberAmounts, memberColor = [], [], [], []
-    storedIcons = os.listdir('../tmp')
-    for memberid, amount in data:
-        member = guild.get_member(memberid)
-        if not member:
-            return
-        icon = member.display_avatar
-        # check if we already have the file in tmp folder, if not grab it and save it.
-        if f'{icon.key}-44px.png' not in storedIcons:
-            img = Image.open(BytesIO(await icon.read()))
-            img = img.resize((128, 128))
-            img.save(f'../tmp/{icon.key}.png')
-            img.putalpha(icon_mask)
-            img = img.resize(icon_size)
-            img.save(f'../tmp/{icon.key}-44px.png')
-            img.close()
-
-        memberIcons.append(f'../tmp/{icon.key}-44px.png')
+# The chart is rendered in the chart worker pool and returned as PNG bytes
+async def graph_amounts(guild: discord.Guild, data, title: str, xlabel: str = 'Coin (¢)'):
+    # members who have left the server have no name or avatar to draw
+    data = [(memberid, amount) for memberid, amount in data if guild.get_member(memberid)]
+    if not data:
+        return None
+    members = [guild.get_member(memberid) for memberid, _ in data]
+    # an identical chart is served from memory without touching avatars or the renderer
+    key = RenderCache.key(title, xlabel, data, [(member.display_name, member.display_avatar.key, member.color.value) for member in members])
+    chart = renderCache.get(key)
+    metrics.count('renderCache', 'hit' if chart else 'miss')
+    if chart:
+        return chart
+
+    # pull all images of ranking members from Discord, or the avatar cache when we have them
+    memberIcons = await avatars.get_many([member.display_avatar for member in members])
+    memberNames, memberAmounts, memberColor = [], [], []
+    for member, (_, amount) in zip(members, data):
         memberNames.append(member.display_name)
         memberAmounts.append(amount)
         # alternate bar color generation
@@ -187,45 +442,34 @@ async def graph_amounts(guild: discord.Guild, data):
         memberC = member.color if member.color != discord.Color.default() or member.color != discord.Color.from_rgb(1, 1, 1) else discord.Color.blurple()
         color = (memberC.r, memberC.g, memberC.b)
         memberColor.append(tuple(t/255. for t in color))
-    ax = plt.axes()
-    ax.set_axisbelow(True)
-    ax.yaxis.grid(color='.9', linestyle='dashed')
-    ax.xaxis.grid(color='.9', linestyle='dashed')
-    lab_x = [i for i in range(len(data))]
-    height = .8
-    plt.barh(lab_x, memberAmounts, height=height, color=memberColor)
-    plt.yticks(lab_x, memberNames)
-
-    # create a glowy effect on the plot by plotting different bars
-    n_shades = 5
-    diff_linewidth = .05
-    alpha_value = 0.5 / n_shades
-    for n in range(1, n_shades + 1):
-        plt.barh(lab_x, memberAmounts,
-                height=(height + (diff_linewidth * n)),
-                alpha=alpha_value,
-                color=memberColor)
-
-    # add user icons to bar charts
-    max_value = max(memberAmounts)
-    for i, (value, icon) in enumerate(zip(memberAmounts, memberIcons)):
-        offset_image(value, i, icon, max_value=max_value, ax=ax)
-
-
-# Adds discord icons to bar chart
-def offset_image(x, y, icon, max_value, ax):
-    img = plt.imread(icon)
-    im = OffsetImage(img, zoom=0.65)
-    im.image.axes = ax
-    x_offset = -25
-    # if bar is too short to show icon
-    if 0 <= x < max_value / 5:
-        x = x + max_value // 8
-    elif x < max_value / 5:
-        x = 0
-    ab = AnnotationBbox(im, (x, y), xybox=(x_offset, 0), frameon=False,
-                        xycoords='data', boxcoords="offset points", pad=0)
-    ax.add_artist(ab)
+    chart = await renderer.render('render_bar_chart', memberNames, memberAmounts, memberColor, memberIcons, title, xlabel)
+    renderCache.put(key, chart)
+    return chart
+
+
+# Drops everything cached from the ledger, used after rows were written behind the ledger thread's back (e.g. an import)
+def reload_ledger():
+    balances.clear()
+    for leaderboard in leaderboards.values():
+        leaderboard.clear()
+    chartQueries.clear()
+
+
+# Returns the rows from query(*args), reusing the last result for this key if nothing has been written to the ledger since.
+# Every result is dropped once the ledger has been written to, so the cache never outgrows the queries run between writes.
+async def cached_query(key, query, *args):
+    global chartQueriesGeneration
+    generation = sql.generation()
+    if generation != chartQueriesGeneration:
+        chartQueries.clear()
+        chartQueriesGeneration = generation
+    elif key in chartQueries:
+        return chartQueries[key]
+    rows = await query(*args)
+    # a write committed while the query ran makes the result stale
+    if sql.generation() == generation == chartQueriesGeneration:
+        chartQueries[key] = rows
+    return rows
 
 
 #dont know if you wanted this returns the index of the winning member in members
@@ -237,129 +481,208 @@ def get_winner(num_players,win_ang):
             return i
         curr_degree -= sliceDegree
 
-# Generate wheel for bet as a gif
-def generate_wheel(members: List[discord.Member]):
-    canvas_size = 1000
-    wheel_offset = 5
-    bounding_box = [(wheel_offset, wheel_offset), (canvas_size - wheel_offset, canvas_size - wheel_offset)]
-    sliceDegree = 360 / len(members)
-    currSlice = 0
-    wheelPath = '../tmp/wheel.png'
-    # TODO: FIX WHEEL STYLE AND ADD TEXT
-    wheel = Image.new('RGBA', (canvas_size, canvas_size), '#DDD')
+# Generate wheel for bet as a gif, returns the gif bytes and the index of the winning member.
+# win_ang is random unless the winner was already drawn.
+async def generate_wheel(members: List[discord.Member], win_ang: int = None):
+    colors = []
     for member in members:
-        wheelDraw = ImageDraw.Draw(wheel)
-        wheelDraw.pieslice(bounding_box, start=currSlice, end=currSlice+sliceDegree, fill=member['color'], width=5, outline='black')
-        currSlice += sliceDegree
-    wheel.save('../tmp/wheel.png')
-
-    win_ang = random.randint(0,360)
-
-    #generate time mesh for acceleration function to operate on
-    #set to be 7 "seconds" polled at .1 seconds found this gave enough
-    #points to make a smoother gif
-    time_mesh = [t for t in np.arange(0.0,7.0,0.1)]
-    
-    #starting set of rotations I found to look like someone is pulling a wheel back for 
-    #a rather large spin. can be messed around with 
-    start_animation = [0.0, -0.75, -1.5, -2.25, -3.0, -3.75, -4.5, -5.25]
-    
-    #start actual spin at the last part of the pullback
-    #store all rotations of original image (in degrees) that create the gif
-    rotations = [start_animation[7]]
-    velocities = [0]
-
-    #i picked e^2t for no real reason other than it makes the wheel get up to speed quick
-    acceleration_func = lambda t: exp(2*t) if t <= 2.0 else 0
-
-    #now calculate distance traveled in degrees from the original image for each point in the
-    #time mesh using basic rotational dynamics
-    for i in range(1,len(time_mesh)):
-        t = time_mesh[i]
-        a = acceleration_func(t)
-        v = velocities[i-1] + a * t
-        d = rotations[i-1] + v * t
-
-        rotations.append(d)
-        velocities.append(v)
-
-    #reguardless of where we ended up, square up the last point with the original image so we can
-    #position the wheel where the winning slice always hits the top
-    win_ang_pos = rotations[len(rotations)-1] + (360 - (rotations[len(rotations)-1] % 360))
-    rotations.append(win_ang_pos)
-
-    #in order to hit the top of the circle, find the distance from the winning angle to 270(the top
-    #of the circle). The minus 180 here is used to get the more gentle stop from the end_animation
-    #array
-    rotations.append(win_ang_pos + (270 - win_ang) - 180 if win_ang <= 270 else win_ang_pos + 360 - (win_ang - 270) - 180)
-    end_animation = [45,45,25,20,20,10,5,2,1,1,1]
-    curr = rotations[len(rotations)-1]
-    for i in range(len(end_animation)):
-        curr += end_animation[i]
-        rotations.append(curr)
-
-    #append the start animation to the front of the rotations array
-    rotations = start_animation + rotations
-
-    #make the gif
-    wheelImgs = [wheel.rotate(-rotations[i], expand=False, fillcolor='#DDD') for i in range(len(rotations))]
-    wheel.save('../tmp/out.gif', save_all=True, append_images=wheelImgs)
-    return wheelPath
+        memberC = member.color if member.color != discord.Color.default() else discord.Color.blurple()
+        colors.append((memberC.r, memberC.g, memberC.b))
+    if win_ang is None:
+        win_ang = random.randint(0, 359)
+    gif = await renderer.render('render_wheel', colors, win_ang, config.getAttribute('wheelSize', 400))
+    return gif, get_winner(len(members), win_ang)
+
+
+# Writes a member's new balance through to the caches that hold it, None means they no longer have a wallet
+def store_balance(guildid: int, memberid: int, amount):
+    balances.put((guildid, memberid), amount)
+    leaderboard = leaderboards.get(guildid)
+    if leaderboard is not None:
+        leaderboard.update(memberid, amount)
 
 
 #############################################################
 # SQL functions for updating DB state
+# Each public function queues its query on the ledger thread and awaits the result.
+# Every wallet, transaction and snapshot belongs to one guild, so each of them takes the guild id first.
 #############################################################
-def update_coin(memberid: int, amount: int):
+def _update_coin(connection, guildid: int, memberid: int, amount: int):
+    connection.execute('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (?, ?, ?) ON CONFLICT(guild_id, id) DO UPDATE SET coin=excluded.coin',
+                       (guildid, memberid, amount))
+    snapshots.record(connection, guildid, [(memberid, amount)])
+
+
+async def update_coin(guildid: int, memberid: int, amount: int):
     logging.debug('Updating coin for: ' + str(memberid) + ': ' + str(amount))
-    cur = sql.connection.cursor()
-    cur.execute("INSERT INTO AMOUNTS(id, coin) VALUES ('{0}', {1}) ON CONFLICT(id) DO UPDATE SET coin=excluded.coin".format(memberid, amount))
-    sql.connection.commit()
+    await sql.run(_update_coin, guildid, memberid, amount)
+    store_balance(guildid, memberid, amount)
     return amount
 
 
-def get_coin(memberid: int):
-    cur = sql.connection.cursor()
-    amount = cur.execute("SELECT coin from AMOUNTS WHERE id IS '{0}'".format(memberid)).fetchall()
+def _update_coins(connection, guildid: int, amounts: list):
+    connection.executemany('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (?, ?, ?) ON CONFLICT(guild_id, id) DO UPDATE SET coin=excluded.coin',
+                           [(guildid, memberid, amount) for memberid, amount in amounts])
+    snapshots.record(connection, guildid, amounts)
+
+
+# Writes many (memberid, amount) balances in a single statement
+async def update_coins(guildid: int, amounts: list):
+    await sql.run(_update_coins, guildid, amounts)
+    for memberid, amount in amounts:
+        store_balance(guildid, memberid, amount)
+
+
+def _create_wallets(connection, guildid: int, amounts: list):
+    created = [(memberid, amount) for memberid, amount in amounts
+               if connection.execute('INSERT OR IGNORE INTO AMOUNTS(guild_id, id, coin) VALUES (?, ?, ?)', (guildid, memberid, amount)).rowcount]
+    snapshots.record(connection, guildid, created)
+    return created
+
+
+# Writes (memberid, amount) balances for members without a wallet, returns the ones that were created
+async def create_wallets(guildid: int, amounts: list):
+    created = await sql.run(_create_wallets, guildid, amounts)
+    for memberid, amount in created:
+        store_balance(guildid, memberid, amount)
+    return created
+
+
+def _get_coin(connection, guildid: int, memberid: int):
+    amount = connection.execute('SELECT coin FROM AMOUNTS WHERE guild_id = ? AND id = ?', (guildid, memberid)).fetchall()
     if amount:
         return amount[0][0]
     return None
 
 
+async def get_coin(guildid: int, memberid: int):
+    key = (guildid, memberid)
+    amount = balances.get(key)
+    if amount is MISSING:
+        amount = await sql.read(_get_coin, guildid, memberid)
+        balances.put(key, amount)
+    elif debugBalanceCache:
+        stored = await sql.read(_get_coin, guildid, memberid)
+        if stored != amount:
+            logging.warning(f'Balance cache mismatch for {memberid} in {guildid}: cached {amount}, stored {stored}')
+    return amount
+
+
+def _remove_coin(connection, guildid: int, memberid: int):
+    connection.execute('DELETE FROM AMOUNTS WHERE guild_id = ? AND id = ?', (guildid, memberid))
+
+
 # Clears out all coin from a member's entry
-def remove_coin(memberid: int):
-    cur = sql.connection.cursor()
-    cur.execute("DELETE FROM AMOUNTS WHERE id is '{0}'".format(memberid))
-    sql.connection.commit()
+async def remove_coin(guildid: int, memberid: int):
+    await sql.run(_remove_coin, guildid, memberid)
+    store_balance(guildid, memberid, None)
+
+
+def _add_transaction(connection, guildid: int, memberid: int, amount: int, memo: str = None):
+    connection.execute('INSERT INTO TRANSACTIONS(guild_id, date, id, coin, memo) VALUES (?, ?, ?, ?, ?)',
+                       (guildid, datetime.datetime.utcnow(), memberid, amount, memo))
 
 
 # Adds a transaction entry for a specific member
-def add_transaction(memberid: int, amount: int):
-    cur = sql.connection.cursor()
-    cur.execute("INSERT INTO TRANSACTIONS(date, id, coin) VALUES (?, ?, ?)", (datetime.datetime.utcnow(), memberid, amount))
-    sql.connection.commit()
+async def add_transaction(guildid: int, memberid: int, amount: int, memo: str = None):
+    await sql.run(_add_transaction, guildid, memberid, amount, memo)
+
+
+# Reads, updates and records a balance change in one savepoint, returns the new balance. A member without a wallet
+# starts from defaultCoin.
+def _add_coin(connection, guildid: int, memberid: int, amount: int, persist: bool, defaultCoin: int):
+    balance = _get_coin(connection, guildid, memberid)
+    if balance is None:
+        balance = defaultCoin
+    balance += amount
+    _update_coin(connection, guildid, memberid, balance)
+    if persist:
+        _add_transaction(connection, guildid, memberid, amount)
+    return balance
+
+
+# Checks every debit against the debt limit, then writes all balances and transactions in the same savepoint
+def _settle(connection, guildid: int, changes: list, memo: str, defaultCoin: int, debtLimit: int):
+    balances = {}
+    for memberid, amount in changes:
+        current = balances.get(memberid, _get_coin(connection, guildid, memberid))
+        if current is None:
+            current = defaultCoin
+        if amount < 0 and current + amount < debtLimit:
+            return None
+        balances[memberid] = current + amount
+
+    date = datetime.datetime.utcnow()
+    connection.executemany('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (?, ?, ?) ON CONFLICT(guild_id, id) DO UPDATE SET coin=excluded.coin',
+                           [(guildid, memberid, amount) for memberid, amount in balances.items()])
+    connection.executemany('INSERT INTO TRANSACTIONS(guild_id, date, id, coin, memo) VALUES (?, ?, ?, ?, ?)',
+                           [(guildid, date, memberid, amount, memo) for memberid, amount in changes])
+    snapshots.record(connection, guildid, balances.items())
+    return balances
+
+
+def _remove_transactions(connection, guildid: int, memberid: int):
+    connection.execute('DELETE FROM TRANSACTIONS WHERE guild_id = ? AND id = ?', (guildid, memberid))
+    connection.execute('DELETE FROM SNAPSHOTS WHERE guild_id = ? AND id = ?', (guildid, memberid))
+    connection.execute('DELETE FROM TRANSACTION_ROLLUPS WHERE guild_id = ? AND id = ?', (guildid, memberid))
 
 
 # Removes all transactions associated with a user
-def remove_transactions(memberid: int):
-    cur = sql.connection.cursor()
-    cur.execute("DELETE FROM TRANSACTIONS WHERE id is '{0}'".format(memberid))
-    sql.connection.commit()
-
-
-# Gets rankings of coin amounts
-def get_coin_rankings():
-    cur = sql.connection.cursor()
-    amounts = cur.execute("SELECT id, coin FROM AMOUNTS ORDER BY coin").fetchall()
-    if amounts:
-        return amounts
-    return None
+async def remove_transactions(guildid: int, memberid: int):
+    await sql.run(_remove_transactions, guildid, memberid)
+
+
+def _get_coin_rankings(connection, guildid: int):
+    return connection.execute('SELECT id, coin FROM AMOUNTS WHERE guild_id = ? ORDER BY coin DESC, id', (guildid,)).fetchall()
+
+
+def _get_all_coin(connection, guildid: int):
+    return connection.execute('SELECT id, coin FROM AMOUNTS WHERE guild_id = ?', (guildid,)).fetchall()
+
+
+# Gets every (memberid, amount) stored for a guild
+async def get_all_coin(guildid: int):
+    return await sql.read(_get_all_coin, guildid)
+
+
+# Gets every (memberid, amount) of a guild, richest first
+async def get_coin_rankings(guildid: int):
+    return await sql.read(_get_coin_rankings, guildid)
 
 
-# Get all transactions between now and the given date, ordered from greatest to least.
-def get_transactions(time: datetime):
-    cur = sql.connection.cursor()
-    transactions = cur.execute("SELECT id, coin FROM TRANSACTIONS WHERE date BETWEEN ? AND ? ORDER BY coin", (time, datetime.datetime.utcnow())).fetchall()
+def _get_top_transactions(connection, guildid: int, time: datetime, isWins: bool, limit: int):
+    if isWins:
+        query = 'SELECT id, coin FROM TRANSACTIONS WHERE guild_id = ? AND date BETWEEN ? AND ? AND coin > 0 ORDER BY coin DESC LIMIT ?'
+    else:
+        query = 'SELECT id, coin FROM TRANSACTIONS WHERE guild_id = ? AND date BETWEEN ? AND ? AND coin < 0 ORDER BY coin ASC LIMIT ?'
+    transactions = connection.execute(query, (guildid, time, datetime.datetime.utcnow(), limit)).fetchall()
     if transactions:
         return transactions
     return None
+
+
+# Get the largest gains (or losses) in a guild between now and the given date, ordered from greatest to least.
+async def get_top_transactions(guildid: int, time: datetime, isWins: bool, limit: int = 5):
+    return await sql.read(_get_top_transactions, guildid, time, isWins, limit)
+
+
+# Wallets, transactions and snapshots written before the ledger was split by guild are stored under guild 0. This
+# hands them to a guild, rows the guild already has its own copy of are left where they are. Returns the rows moved.
+def _claim_legacy_ledger(connection, guildid: int):
+    claimed = 0
+    for table in ('AMOUNTS', 'TRANSACTIONS', 'SNAPSHOTS', 'TRANSACTION_ROLLUPS'):
+        claimed += connection.execute(f'UPDATE OR IGNORE {table} SET guild_id = ? WHERE guild_id = 0', (guildid,)).rowcount
+    return claimed
+
+
+async def claim_legacy_ledger(guildid: int):
+    claimed = await sql.run(_claim_legacy_ledger, guildid)
+    if claimed:
+        logging.info(f'Moved {claimed} ledger rows from before guild ledgers into guild {guildid}')
+        reload_ledger()
+    return claimed
+
+
+# Set once the legacy ledger has been claimed at start up. Commands and button presses wait for it, otherwise a legacy
+# member's first command creates a fresh wallet in their guild and their old one can no longer be claimed.
+legacyClaimed = asyncio.Event()
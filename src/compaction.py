@@ -0,0 +1,121 @@
+# Keeps TRANSACTIONS from growing forever. Transactions older than the horizon are compacted one guild day at a time:
+# only rows !bigwins and !biglosses can still show stay, that is the top few of the current week, month or year, and
+# everything else is summed into one TRANSACTION_ROLLUPS row per member per month, so balances can still be replayed.
+# Freed pages are then handed back to the file system a few at a time with PRAGMA incremental_vacuum.
+# Every step is a short ledger job with a pause after it, so the bot keeps serving commands throughout.
+import asyncio
+import datetime
+import logging
+import sql_client as sql
+import commands
+import snapshots
+
+periods = ['week', 'month', 'year']
+
+
+def _guilds(connection):
+    return [guildid for guildid, in connection.execute('SELECT DISTINCT guild_id FROM AMOUNTS')]
+
+
+# For each period start: the smallest win and the smallest loss among the top keep of the guild's period so far, or 1
+# and -1 while it has fewer than keep of them. Read once per pass, transactions made during the pass can only raise
+# them, which keeps a few rows more than needed.
+def _thresholds(connection, guildid: int, starts: list, keep: int):
+    if keep <= 0:
+        return {}
+    now = datetime.datetime.utcnow()
+    query = 'SELECT coin FROM TRANSACTIONS WHERE guild_id = ? AND date BETWEEN ? AND ? AND coin {} 0 ORDER BY coin {} LIMIT 1 OFFSET ?'
+    thresholds = {}
+    for start in starts:
+        win = connection.execute(query.format('>', 'DESC'), (guildid, start, now, keep - 1)).fetchone()
+        loss = connection.execute(query.format('<', 'ASC'), (guildid, start, now, keep - 1)).fetchone()
+        thresholds[start] = (win[0] if win else 1), (loss[0] if loss else -1)
+    return thresholds
+
+
+def _kept(coin: int, thresholds: list):
+    return any(coin >= win if coin > 0 else coin < 0 and coin <= loss for win, loss in thresholds)
+
+
+# Compacts the oldest day of a guild not compacted yet, if it is before cutoff. starts are the first days of the current
+# week, month and year, a day keeps the rows that pass the thresholds of a period it is part of, see _thresholds.
+# Progress is the last day done and the starts it was done with, per guild in JOB_STATE. Once a period has closed the
+# days from its start are compacted again, since what was kept for it can go. Returns the number of transactions
+# rolled up, or None when the guild has nothing left to compact.
+def _compact_day(connection, guildid: int, cutoff: str, starts: list, thresholds: dict):
+    stateName = f'compaction {guildid}'
+    state = (snapshots._get_state(connection, stateName) or '').split()
+    start = ''
+    if state:
+        done, previous = state[0], state[1:]
+        start = (datetime.date.fromisoformat(done) + datetime.timedelta(days=1)).isoformat()
+        if not previous:
+            # compacted before periods were tracked, when the top of every day was kept
+            start = ''
+        elif previous != starts:
+            start = min([start] + [old for old, new in zip(previous, starts) if old != new])
+    first = connection.execute('SELECT MIN(date) FROM TRANSACTIONS WHERE guild_id = ? AND date >= ? AND date < ?',
+                               (guildid, start, cutoff)).fetchone()[0]
+    if first is None:
+        return None
+    day = datetime.date.fromisoformat(str(first)[:10])
+    end = (day + datetime.timedelta(days=1)).isoformat()
+    rows = connection.execute('SELECT rowid, id, coin FROM TRANSACTIONS WHERE guild_id = ? AND date >= ? AND date < ?',
+                              (guildid, day.isoformat(), end)).fetchall()
+
+    periodThresholds = [thresholds[periodStart] for periodStart in starts if periodStart <= day.isoformat() and periodStart in thresholds]
+    rolled = [row for row in rows if not _kept(row[2], periodThresholds)]
+
+    month = day.replace(day=1)
+    totals = {}
+    for _, memberid, coin in rolled:
+        total, count = totals.get(memberid, (0, 0))
+        totals[memberid] = (total + coin, count + 1)
+    connection.executemany('INSERT INTO TRANSACTION_ROLLUPS(guild_id, id, month, coin, count) VALUES (?, ?, ?, ?, ?) '
+                           'ON CONFLICT(guild_id, id, month) DO UPDATE SET coin=coin + excluded.coin, count=count + excluded.count',
+                           [(guildid, memberid, month, total, count) for memberid, (total, count) in totals.items()])
+    connection.executemany('DELETE FROM TRANSACTIONS WHERE rowid = ?', [(rowid,) for rowid, _, _ in rolled])
+    snapshots._set_state(connection, stateName, ' '.join([day.isoformat()] + starts))
+    return len(rolled)
+
+
+# Frees up to pages unused pages at the end of the file, returns how many are still free. Does nothing unless the
+# database was created with (or converted to) auto_vacuum=INCREMENTAL, see ledger_io.enable_incremental_vacuum.
+def _vacuum_step(connection, pages: int):
+    if connection.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        return 0
+    connection.execute(f'PRAGMA incremental_vacuum({int(pages)})').fetchall()
+    return connection.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+compacting = False
+
+
+# One full pass: compacts every guild up to the horizon, then vacuums the freed pages. horizonDays None only vacuums.
+async def compact(horizonDays, keep: int, pause: float, vacuumPages: int):
+    global compacting
+    if compacting:
+        return
+    compacting = True
+    try:
+        if horizonDays is not None:
+            cutoff = (datetime.datetime.utcnow().date() - datetime.timedelta(days=horizonDays)).isoformat()
+            starts = [commands.period_start(period).isoformat() for period in periods]
+            for guildid in await sql.read(_guilds):
+                thresholds = await sql.read(_thresholds, guildid, starts, keep)
+                rolled, days = 0, 0
+                while True:
+                    count = await sql.run(_compact_day, guildid, cutoff, starts, thresholds)
+                    if count is None:
+                        break
+                    rolled += count
+                    days += 1
+                    await asyncio.sleep(pause)
+                if days:
+                    logging.info(f'Compacted {days} days of guild {guildid} before {cutoff}, rolled up {rolled} transactions')
+        while await sql.run(_vacuum_step, vacuumPages):
+            await asyncio.sleep(pause)
+    except Exception:
+        logging.exception('Ledger compaction stopped, it will carry on from where it was on the next pass')
+    finally:
+        compacting = False
@@ -6,3 +6,15 @@ with open('../config.yml') as f:
 
 def getAttribute(field, default='INVALIDKEY'):
     return configMap.get(field, default)
+
+
+# Settings for one guild: its entry under guilds in config.yml wins over the top level value, e.g.
+# guilds:
+#   123456789012345678:
+#     channelName: coin
+#     defaultCoin: 500
+def getGuildAttribute(guildid, field, default='INVALIDKEY'):
+    overrides = (configMap.get('guilds') or {}).get(guildid) or {}
+    if field in overrides:
+        return overrides[field]
+    return getAttribute(field, default)
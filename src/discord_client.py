@@ -2,7 +2,21 @@ import discord
 import config
 import commands
 import views
-import spellchecker
+import wagers
+import renderer
+import asyncio
+import logging
+import os
+import datetime
+import ledger_io
+import metrics
+import outbound
+import snapshots
+import compaction
+from command_suggester import CommandSuggester
+from command_registry import CommandRegistry, parse_member, parse_members, parse_member_amount, parse_member_amount_reason, parse_amount, parse_period, parse_directory, parse_history, \
+    parse_page, parse_optional_member
+from io import BytesIO
 
 
 userCommands = {
@@ -10,8 +24,10 @@ userCommands = {
              'Outputs this list of commands.',
     '!setup': 'Usage: `!setup [user1] [user2] [user3]`\n'
               'Updates the user\'s role with their current amount or the default starting amount of coin if no record exists.',
-    '!rankings': 'Usage: `!rankings`\n'
-                 'Outputs power rankings for the server.',
+    '!rankings': 'Usage: `!rankings [page]`\n'
+                 'Outputs power rankings for the server, one page at a time.',
+    '!rank': 'Usage: `!rank [user]`\n'
+             'Outputs where someone stands in the power rankings, defaults to you.',
     '!give': 'Usage: `!give [user] [amount]`\n'
              'Gives coin to a specific user, no strings attached.',
     '!bet': 'Usage: `!bet [user] [amount] [reason]`\n'
@@ -21,7 +37,9 @@ userCommands = {
     '!brokecheck': 'Usage: `!brokecheck [user]`\n'
                    'Checks a member\'s poverty level.',
     '!debtlimit': 'Usage: `!debtlimit`\n'
-                  'Outputs the max amount of coin someone can go into debt.'
+                  'Outputs the max amount of coin someone can go into debt.',
+    '!history': 'Usage: `!history [user] [week|month|year]`\n'
+                'Charts a wallet over time, defaults to your own wallet this month.'
 }
 
 adminCommands = {
@@ -38,230 +56,393 @@ adminCommands = {
     '!biglosses': 'Usage: `!biglosses [week|month|year]`\n'
                 'Outputs the greatest losses in the specified time period.',
     '!reset': 'Usage: `!reset [user]`\n'
-              'Resets a user\'s wallet to the default starting amount'
+              'Resets a user\'s wallet to the default starting amount',
+    '!reconcile': 'Usage: `!reconcile`\n'
+                  'Creates missing wallets and fixes the coin role of every member in the server.',
+    '!export': 'Usage: `!export`\n'
+               'Writes a backup of all wallets and transactions to the bot\'s server.',
+    '!perf': 'Usage: `!perf`\n'
+             'Outputs how long commands, ledger jobs, chart renders and Discord calls have been taking.'
 }
 
-class Client(discord.Client):
+registry = CommandRegistry()
+# Built once over the commands listed in the help, hidden ones such as !hardreset are never suggested
+suggester = CommandSuggester()
+suggester.add_all(userCommands.keys())
+suggester.add_all(adminCommands.keys())
+
+
+# Fills in balance history for transactions recorded before snapshots existed, in the background
+def start_backfill():
+    asyncio.ensure_future(snapshots.backfill(config.getAttribute('snapshotBackfillChunk', 200), config.getAttribute('snapshotBackfillPause', 1)))
+
+
+# Closes bets and wheels whose time is up, including any that ran out while the bot was down
+async def sweep_wagers(client: discord.Client):
+    while True:
+        try:
+            await wagers.sweep(client)
+        except Exception:
+            logging.exception('Wager sweep failed')
+        await asyncio.sleep(config.getAttribute('wagerSweepInterval', 5))
+
+
+# Hands wallets from before guild ledgers to their guild: the only guild the bot is in, or legacyGuildId when it is in several
+async def claim_legacy_ledger(client: discord.Client):
+    guildid = config.getAttribute('legacyGuildId', None)
+    if guildid is None and len(client.guilds) == 1:
+        guildid = client.guilds[0].id
+    try:
+        if guildid is not None:
+            await commands.claim_legacy_ledger(guildid)
+    finally:
+        # a failed claim is logged by discord.py, commands are not held back forever because of it
+        commands.legacyClaimed.set()
+
+
+# With autoShard on, discord.py opens as many gateway shards as Discord recommends (or shardCount) in one process
+clientBase = discord.AutoShardedClient if config.getAttribute('autoShard', False) else discord.Client
+
+
+# Creates the wallet tier roles of a guild that are missing, see commands.prepare_roles
+async def prepare_roles(guild: discord.Guild):
+    try:
+        await commands.prepare_roles(guild)
+    except discord.HTTPException as e:
+        logging.warning(f'Could not set up wallet roles in {guild.name}: {e}')
+
+
+# Compacts old transactions and vacuums the space they leave behind, once at start up and then every compactionInterval
+async def compact_ledger():
+    while True:
+        await compaction.compact(config.getAttribute('compactAfterDays', None), config.getAttribute('compactionKeep', 5),
+                                 config.getAttribute('compactionPause', 1), config.getAttribute('compactionVacuumPages', 256))
+        await asyncio.sleep(config.getAttribute('compactionInterval', 24 * 3600))
+
+
+class Client(clientBase):
+    # Runs once before the gateway connection is opened
+    async def setup_hook(self):
+        if metrics.enabled:
+            self.http.request = metrics.instrument_http(self.http.request)
+            port = config.getAttribute('metricsPort', None)
+            if port:
+                self.metricsServer = await metrics.serve(config.getAttribute('metricsHost', '127.0.0.1'), port)
+
+        for view in views.persistent_views():
+            self.add_view(view)
+
     async def on_ready(self):
         print(f'Logged in as {self.user} (ID: {self.user.id})')
         print('------')
+        for guild in self.guilds:
+            commands.build_role_index(guild)
+            asyncio.ensure_future(prepare_roles(guild))
+        await claim_legacy_ledger(self)
+        if config.getAttribute('warmRenderer', True):
+            asyncio.ensure_future(renderer.warm_up())
+        start_backfill()
+        # on_ready runs again after every reconnect, only one sweeper and compactor are needed
+        if getattr(self, 'sweeper', None) is None:
+            self.sweeper = asyncio.ensure_future(sweep_wagers(self))
+            self.compactor = asyncio.ensure_future(compact_ledger())
+        if config.getAttribute('reconcileOnStartup', False):
+            for guild in self.guilds:
+                asyncio.ensure_future(reconcile_guild(guild))
         # TODO: COLLECT EMOTE INFORMATION AND USE THAT INSTEAD OF HARDCODED VALUES
 
-    async def on_message(self, message: discord.Message):
-        # we do not want the bot to reply to itself or message in other channels
-        if message.author.id == self.user.id or message.channel.name != config.getAttribute('channelName'):
-            return
+    # Keep the wallet role index in step with changes made by the bot or anyone else
+    async def on_guild_role_create(self, role: discord.Role):
+        commands.role_index(role.guild).add_role(role)
 
-        guild = message.channel.guild
-        if message.content.startswith('!help'):
-            embed = discord.Embed(title='Cactus Coin Bot Commands', color=discord.Color.dark_green())
-            for idx, key in enumerate(userCommands.keys()):
-                embed.add_field(name=key, value=userCommands[key], inline=True)
-                if idx % 2 == 1:
-                    embed.add_field(name='\u200b', value='\u200b', inline=True)
-            await message.channel.send(embed=embed)
-
-        elif message.content.startswith('!adminhelp') and commands.is_admin(message.author):
-            embed = discord.Embed(title='Cactus Coin Bot Admin Commands', color=discord.Color.orange())
-            for idx, key in enumerate(adminCommands.keys()):
-                embed.add_field(name=key, value=adminCommands[key], inline=True)
-                if idx % 2 == 1:
-                    embed.add_field(name='\u200b', value='\u200b', inline=True)
-            await message.channel.send(embed=embed)
-
-        elif message.content.startswith('!hello'):
-            await message.reply('Hello!')
-
-        elif message.content.startswith('!sadge'):
-            await message.channel.send('<:sadge:763188455248887819>')
+    async def on_guild_role_delete(self, role: discord.Role):
+        commands.role_index(role.guild).remove_role(role)
+        commands.invalidate_permissions()
 
-        elif 'deez' in message.content:
-            await message.reply('Deez nuts')
+    async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
+        if before.name != after.name:
+            commands.role_index(after.guild).replace_role(before, after)
+            commands.invalidate_permissions()
 
-        elif message.content.startswith('!setup'):
-            if message.mentions:
-                for member in message.mentions:
-                    await commands.verify_coin(guild, member)
-                await message.channel.send('Verified coin for: ' + ', '.join([mention.display_name for mention in message.mentions]))
-            else:
-                await message.reply('No mentions found. Follow the format: `!setup [user1] [user2] ...`')
-
-        elif message.content.startswith('!rankings'):
-            filePath = await commands.compute_rankings(message.guild)
-            file = discord.File(filePath)
-            await message.channel.send('Here are the current power rankings:', file=file)
-
-        elif message.content.startswith('!debtlimit'):
-            await message.channel.send(f'The current debt limit is {str(config.getAttribute("debtLimit", -10000))}.')
-
-        elif message.content.startswith('!brokecheck'):
-            if message.mentions:
-                target_member = message.mentions[0]
-                target_member_coin = commands.get_coin(target_member.id)
-                if target_member_coin <= 0:
-                    await message.channel.send(f'{target_member.display_name} is p <:OMEGALUL:392149610593779724> <:OMEGALUL:392149610593779724> r')
-                else:
-                    await message.channel.send(f'{target_member.display_name} isn\'t poor (yet)')
-
-        elif message.content.startswith('!give'):
-            messageContent = message.content.split()
-            if message.mentions and len(messageContent) == 3 and messageContent[2].lstrip('-').isnumeric():
-                recieving_member = message.mentions[0]
-                amount = int(messageContent[2])
-                author_coin = commands.get_coin(message.author.id)
-                if author_coin - amount < config.getAttribute('debtLimit'):
-                    await message.reply('You don\'t have this much coin to give <:sadge:763188455248887819>')
-                elif recieving_member.id == message.author.id:
-                    await message.reply('Are you stupid or something?')
-                elif amount > 0:
-                    await commands.add_coin(guild, recieving_member, amount)
-                    await commands.add_coin(guild, message.author, -amount)
-                elif amount < 0:
-                    await message.reply('Nice try <:shanechamp:910353567603384340>')
-            else:
-                await message.reply('Error parsing command. Follow the format: `!give [user] [amount]`')
-
-        elif message.content.startswith('!bet'):
-            messageContent = message.content.split(sep=None, maxsplit=3)
-            if message.mentions and len(messageContent) == 4 and messageContent[2].lstrip('-').isnumeric():
-                recieving_member = message.mentions[0]
-                recieving_member_coin = commands.get_coin(recieving_member.id)
-                initiating_member_coin = commands.get_coin(message.author.id)
-                amount = int(messageContent[2])
-                if recieving_member_coin - amount < config.getAttribute('debtLimit'):
-                    await message.channel.send(f'{recieving_member.display_name} doesn\'t have enough to bet <:OMEGALUL:392149610593779724>')
-                elif initiating_member_coin - amount < config.getAttribute('debtLimit'):
-                    await message.reply('You don\'t even have enough to bet <:OMEGALUL:392149610593779724>')
-                elif recieving_member.id == message.author.id:
-                    await message.reply('Are you stupid or something?')
-                elif amount < 0:
-                    await message.reply('Nice try <:shanechamp:910353567603384340>')
-                elif amount > 0:
-                    # Have the challenged member confirm the bet
-                    view = views.ConfirmBet(recieving_member.id)
-                    betMessage = await message.channel.send(f'{recieving_member.mention} do you accept the bet?',
-                                                            view=view)
-                    # Wait for the View to stop listening for input...
-                    await view.wait()
-                    if view.value is None:
-                        # if the bet message times out
-                        await betMessage.delete()
-                    elif not view.value:
-                        await betMessage.edit(f'{recieving_member.display_name} has declined the bet.', view=None)
-                    else:
-                        betResultView = views.DecideBetOutcome(message.author, recieving_member)
-                        await betMessage.edit(
-                            f'{recieving_member.display_name} has accepted the bet. After the bet is over, pick a winner below:',
-                            view=betResultView)
-                        await betResultView.wait()
-                        if betResultView.winner is None:
-                            await betMessage.edit('Something went wrong or the bet timed out.', view=None)
-                        else:
-                            winner = message.author if message.author.id == betResultView.winner else recieving_member
-                            loser = message.author if message.author.id != betResultView.winner else recieving_member
-                            await betMessage.edit(
-                                f'{winner.display_name} won the ${str(amount)} bet against {loser.display_name} for "{messageContent[3]}"!',
-                                view=None)
-                            # resolve bet amounts
-                            await commands.add_coin(guild, winner, amount)
-                            await commands.add_coin(guild, loser, -amount)
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.roles != after.roles:
+            commands.role_index(after.guild).update_member(after)
+            commands.invalidate_permissions(after)
 
-            else:
-                await message.reply('Error parsing command. Follow the format: `!bet [user] [amount] [reason]`')
-
-        elif message.content.startswith('!wheel'):
-            messageContent = message.content.split()
-            if len(messageContent) == 2 and messageContent[1].isnumeric():
-                betAmount = int(messageContent[1])
-                wheelJoinView = views.JoinWheel(message.author, betAmount)
-                wheelMessage = await message.channel.send(
-                    f'It\'s time to spin the wheel! The bet is {messageContent[1]} coin, and the winner takes all!\n'
-                    f'Click "Join" to play! You have 2 minutes to join the bet.',
-                    view=wheelJoinView
-                )
-                await wheelJoinView.wait()
-                if wheelJoinView.members is None:
-                    await wheelMessage.edit('The wheel bet has been cancelled.', view=None)
-                    return
-                elif len(wheelJoinView.members) == 1:
-                    await wheelMessage.edit('Not enough people have joined this wheel, the bet is cancelled.', view=None)
-                    return
-                    # Grab the list of members that have joined the wheel instance
-                # wheelGifPath = commands.generateWheel(wheelJoinView.members)
-            else:
-                await message.reply('Error parsing command. Follow the format: `!wheel [amount]`')
-
-        elif message.content.startswith('!adminadjust') and commands.is_admin(message.author):
-            messageContent = message.content.split()
-            if message.mentions and len(messageContent) == 3 and messageContent[2].lstrip('-').isnumeric():
-                recieving_member = message.mentions[0]
-                amount = int(messageContent[2])
-                await commands.add_coin(guild, recieving_member, amount, persist=False)
-            else:
-                await message.reply('Error parsing command. Follow the format: `!adminadjust [user] [amount]`')
-
-        elif message.content.startswith('!reset') and commands.is_admin(message.author):
-            if message.mentions:
-                recieving_member = message.mentions[0]
-                amount = commands.get_coin(recieving_member.id)
-                await commands.add_coin(guild, recieving_member, -(amount - config.getAttribute('defaultCoin')), persist=False)
-                await commands.update_role(guild, recieving_member, config.getAttribute('defaultCoin'))
-            else:
-                await message.reply('Error parsing command. Follow the format: `!reset [user]`')
+    async def on_member_remove(self, member: discord.Member):
+        commands.role_index(member.guild).drop_member(member.id)
+        commands.invalidate_permissions(member)
 
-        elif message.content.startswith('!clear') and commands.is_admin(message.author):
-            if message.mentions:
-                recieving_member = message.mentions[0]
-                commands.remove_coin(recieving_member.id)
-                await commands.remove_role(guild, recieving_member)
-            else:
-                await message.reply('Error parsing command. Follow the format: `!clear [user]`')
-
-        elif message.content.startswith('!balance') and commands.is_admin(message.author):
-            if message.mentions:
-                recieving_member = message.mentions[0]
-                balance = commands.get_coin(recieving_member.id)
-                if balance:
-                    await message.reply(f'{recieving_member.display_name}\'s balance: {str(balance)}.')
-                else:
-                    await message.reply(f'{recieving_member.display_name} has no balance.')
-            else:
-                await message.reply('Error parsing command. Follow the format: `!balance [user]`')
-
-        elif message.content.startswith('!bigwins') or message.content.startswith('!biglosses') and commands.is_admin(message.author):
-            messageContent = message.content.split()
-            validPeriods = ['week', 'month', 'year']
-            if len(messageContent) > 1 and messageContent[1] in validPeriods:
-                wins = message.content.startswith('!bigwins')
-                text = 'winners' if wins else 'losers'
-                filePath = await commands.get_movements(message.guild, messageContent[1], wins)
-                if filePath:
-                    file = discord.File(filePath)
-                    await message.channel.send(f'Here are the this {messageContent[1]}\'s biggest {text}:', file=file)
-                else:
-                    await message.reply(f'There are no {text} for this {messageContent[1]}.')
-            else:
-                await message.reply(f'Error parsing command. Follow the format: `{messageContent[0]} [week|month|year]`')
-                
-
-        elif message.content.startswith('!hardreset') and commands.is_dev(message.author):
-            # BE CAREFUL WITH THIS IT WILL CLEAR OUT ALL COIN
-            output = ''
-            for member in guild.members:
-                coin = commands.get_coin(member.id)
-                commands.remove_coin(member.id)
-                commands.remove_transactions(member.id)
-                await commands.remove_role(guild, member)
-                output += member.display_name + ' - ' + str(coin) + '\n'
-            await message.reply('Everything cleared out...here\'s the short history just in case.\n' + output)
+    async def on_message(self, message: discord.Message):
+        # we do not want the bot to reply to itself, in DMs or in other channels
+        if message.author.id == self.user.id or message.guild is None or \
+                message.channel.name != config.getGuildAttribute(message.guild.id, 'channelName'):
+            return
+
+        # messages can arrive before on_ready has handed the legacy ledger to its guild
+        await commands.legacyClaimed.wait()
+        outcome = await registry.dispatch(message)
+        if outcome == 'handled':
+            return
+
+        if outcome == 'not permitted':
+            await outbound.reply(message, 'You don\'t have permission to use that command.')
+
+        elif 'deez' in message.content:
+            await outbound.reply(message, 'Deez nuts')
 
         # Can't parse command, reply best guess
         elif message.content.startswith('!'):
             command = message.content.split()[0]
-            spellcheck = spellchecker.SpellChecker(language=None, case_sensitive=True)
-            spellcheck.word_frequency.load_words(userCommands.keys())
-            correction = spellcheck.correction(command)
-            if correction != command:
-                await message.reply(f'Invalid command, did you mean `{correction}`?  Try `!help` for valid commands.')
+            corrections = [correction for correction in suggester.suggest(command) if registry.permitted(correction, message.author)]
+            if corrections:
+                await outbound.reply(message, f'Invalid command, did you mean {" or ".join(f"`{correction}`" for correction in corrections)}?  Try `!help` for valid commands.')
             else:
-                await message.reply('Invalid command. Try `!help` for valid commands.')
+                await outbound.reply(message, 'Invalid command. Try `!help` for valid commands.')
+
+
+#############################################################
+# Command handlers, each receives the message followed by the arguments its parser returned
+#############################################################
+def help_embed(title: str, color: discord.Color, helpText: dict):
+    embed = discord.Embed(title=title, color=color)
+    for idx, key in enumerate(helpText.keys()):
+        embed.add_field(name=key, value=helpText[key], inline=True)
+        if idx % 2 == 1:
+            embed.add_field(name='\u200b', value='\u200b', inline=True)
+    return embed
+
+
+@registry.command('!help')
+async def help_command(message: discord.Message):
+    await outbound.send(message.channel, embed=help_embed('Cactus Coin Bot Commands', discord.Color.dark_green(), userCommands))
+
+
+@registry.command('!adminhelp', check=commands.is_admin)
+async def admin_help(message: discord.Message):
+    await outbound.send(message.channel, embed=help_embed('Cactus Coin Bot Admin Commands', discord.Color.orange(), adminCommands))
+
+
+@registry.command('!hello')
+async def hello(message: discord.Message):
+    await outbound.reply(message, 'Hello!')
+
+
+@registry.command('!sadge')
+async def sadge(message: discord.Message):
+    await outbound.send(message.channel, '<:sadge:763188455248887819>')
+
+
+@registry.command('!setup', parser=parse_members, error='No mentions found. Follow the format: `!setup [user1] [user2] ...`')
+async def setup(message: discord.Message, members: list):
+    for member in members:
+        await commands.verify_coin(message.guild, member)
+    await outbound.send(message.channel, 'Verified coin for: ' + ', '.join([mention.display_name for mention in members]))
+
+
+@registry.command('!rankings', parser=parse_page, usage='!rankings [page]')
+async def rankings(message: discord.Message, page: int):
+    chart = await commands.compute_rankings(message.guild, page)
+    if chart:
+        file = discord.File(BytesIO(chart), filename='power-rankings.png')
+        await outbound.send(message.channel, 'Here are the current power rankings:', file=file)
+    elif page > 1:
+        await outbound.reply(message, f'There is no page {page} of the power rankings.')
+    else:
+        await outbound.reply(message, 'The power rankings could not be drawn right now.')
+
+
+@registry.command('!rank', parser=parse_optional_member, usage='!rank [user]')
+async def rank(message: discord.Message, target_member: discord.Member):
+    target_member = target_member or message.author
+    position = await commands.get_rank(message.guild.id, target_member.id)
+    if position is None:
+        await outbound.reply(message, f'{target_member.display_name} does not have a wallet yet, use `!setup` to make one.')
+        return
+    place, total, amount = position
+    await outbound.reply(message, f'{target_member.display_name} is number {place} of {total} with {amount}¢.')
+
+
+@registry.command('!history', parser=parse_history, usage='!history [user] [week|month|year]')
+async def history(message: discord.Message, target_member: discord.Member, period: str):
+    target_member = target_member or message.author
+    chart = await commands.get_history(target_member, period)
+    if chart:
+        file = discord.File(BytesIO(chart), filename=f'history-{period}.png')
+        await outbound.send(message.channel, f'Here is {target_member.display_name}\'s wallet this {period}:', file=file)
+    else:
+        await outbound.reply(message, f'There is no history for {target_member.display_name} yet.')
+
+
+@registry.command('!debtlimit')
+async def debt_limit(message: discord.Message):
+    await outbound.send(message.channel, f'The current debt limit is {str(config.getGuildAttribute(message.guild.id, "debtLimit", -10000))}.')
+
+
+@registry.command('!brokecheck', parser=parse_member, usage='!brokecheck [user]')
+async def broke_check(message: discord.Message, target_member: discord.Member):
+    target_member_coin = await commands.get_coin(message.guild.id, target_member.id)
+    if target_member_coin is None or target_member_coin <= 0:
+        await outbound.send(message.channel, f'{target_member.display_name} is p <:OMEGALUL:392149610593779724> <:OMEGALUL:392149610593779724> r')
+    else:
+        await outbound.send(message.channel, f'{target_member.display_name} isn\'t poor (yet)')
+
+
+@registry.command('!give', parser=parse_member_amount, usage='!give [user] [amount]')
+async def give(message: discord.Message, recieving_member: discord.Member, amount: int):
+    if recieving_member.id == message.author.id:
+        await outbound.reply(message, 'Are you stupid or something?')
+    elif amount > 0:
+        # the transfer checks the debt limit in the same transaction that moves the coin
+        if await commands.transfer(message.guild, message.author, recieving_member, amount, 'give') is None:
+            await outbound.reply(message, 'You don\'t have this much coin to give <:sadge:763188455248887819>')
+    elif amount < 0:
+        await outbound.reply(message, 'Nice try <:shanechamp:910353567603384340>')
+
+
+@registry.command('!bet', parser=parse_member_amount_reason, usage='!bet [user] [amount] [reason]')
+async def bet(message: discord.Message, recieving_member: discord.Member, amount: int, reason: str):
+    recieving_member_coin = await commands.get_coin(message.guild.id, recieving_member.id)
+    initiating_member_coin = await commands.get_coin(message.guild.id, message.author.id)
+    debtLimit = config.getGuildAttribute(message.guild.id, 'debtLimit')
+    if recieving_member_coin - amount < debtLimit:
+        await outbound.send(message.channel, f'{recieving_member.display_name} doesn\'t have enough to bet <:OMEGALUL:392149610593779724>')
+    elif initiating_member_coin - amount < debtLimit:
+        await outbound.reply(message, 'You don\'t even have enough to bet <:OMEGALUL:392149610593779724>')
+    elif recieving_member.id == message.author.id:
+        await outbound.reply(message, 'Are you stupid or something?')
+    elif amount < 0:
+        await outbound.reply(message, 'Nice try <:shanechamp:910353567603384340>')
+    elif amount > 0:
+        # Have the challenged member confirm the bet, the buttons carry on from the wager row from here
+        await wagers.create(outbound.send(message.channel, f'{recieving_member.mention} do you accept the bet?', view=views.detached(views.ConfirmBet())),
+                            'bet', message.author, recieving_member, amount, reason)
+
+
+@registry.command('!wheel', parser=parse_amount, usage='!wheel [amount]')
+async def wheel(message: discord.Message, betAmount: int):
+    sending = outbound.send(
+        message.channel,
+        f'It\'s time to spin the wheel! The bet is {str(betAmount)} coin, and the winner takes all!\n'
+        f'Click "Join" to play! Joining closes in {wagers.wheelJoinTime} seconds.',
+        view=views.detached(views.JoinWheel())
+    )
+    # the sweeper spins it once joining closes
+    await wagers.create(sending, 'wheel', message.author, None, betAmount)
+
+
+@registry.command('!adminadjust', parser=parse_member_amount, check=commands.is_admin, usage='!adminadjust [user] [amount]')
+async def admin_adjust(message: discord.Message, recieving_member: discord.Member, amount: int):
+    await commands.add_coin(message.guild, recieving_member, amount, persist=False)
+
+
+@registry.command('!reset', parser=parse_member, check=commands.is_admin, usage='!reset [user]')
+async def reset(message: discord.Message, recieving_member: discord.Member):
+    await commands.reset_coin(message.guild, recieving_member)
+
+
+@registry.command('!clear', parser=parse_member, check=commands.is_admin, usage='!clear [user]')
+async def clear(message: discord.Message, recieving_member: discord.Member):
+    await commands.remove_coin(message.guild.id, recieving_member.id)
+    await commands.remove_role(message.guild, recieving_member)
+
+
+@registry.command('!balance', parser=parse_member, check=commands.is_admin, usage='!balance [user]')
+async def balance(message: discord.Message, recieving_member: discord.Member):
+    balance = await commands.get_coin(message.guild.id, recieving_member.id)
+    if balance:
+        await outbound.reply(message, f'{recieving_member.display_name}\'s balance: {str(balance)}.')
+    else:
+        await outbound.reply(message, f'{recieving_member.display_name} has no balance.')
+
+
+async def movements(message: discord.Message, period: str, wins: bool):
+    text = 'winners' if wins else 'losers'
+    chart = await commands.get_movements(message.guild, period, wins)
+    if chart:
+        file = discord.File(BytesIO(chart), filename=f'{text}-{period}.png')
+        await outbound.send(message.channel, f'Here are the this {period}\'s biggest {text}:', file=file)
+    else:
+        await outbound.reply(message, f'There are no {text} for this {period}.')
+
+
+@registry.command('!bigwins', parser=parse_period, check=commands.is_admin, usage='!bigwins [week|month|year]')
+async def big_wins(message: discord.Message, period: str):
+    await movements(message, period, True)
+
+
+@registry.command('!biglosses', parser=parse_period, check=commands.is_admin, usage='!biglosses [week|month|year]')
+async def big_losses(message: discord.Message, period: str):
+    await movements(message, period, False)
+
+
+# Runs a guild-wide wallet reconciliation and describes what it changed
+async def reconcile_guild(guild: discord.Guild):
+    members, created, fixed, elapsed = await commands.reconcile(guild)
+    summary = f'Checked {members} members in {elapsed:.1f}s: created {created} wallets and fixed {fixed} roles.'
+    logging.info(f'Reconciled {guild.name}. {summary}')
+    return summary
+
+
+@registry.command('!reconcile', check=commands.is_admin)
+async def reconcile(message: discord.Message):
+    await outbound.reply(message, await reconcile_guild(message.guild))
+
+
+@registry.command('!export', check=commands.is_admin)
+async def export(message: discord.Message):
+    directory = os.path.join(config.getAttribute('exportDir', '../exports'), datetime.datetime.now().strftime('%Y-%m-%d-%H%M%S'))
+    # the export reads through its own connection on a worker thread, the bot keeps running meanwhile
+    counts = await asyncio.to_thread(ledger_io.export_ledger, config.getAttribute('dbFile'), directory)
+    await outbound.reply(message, f'Exported {counts["AMOUNTS"]} wallets and {counts["TRANSACTIONS"]} transactions to `{directory}`.')
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return f'>{metrics.buckets[-1]}s'
+    return f'{seconds * 1000:.0f}ms' if seconds < 1 else f'{seconds:.1f}s'
+
+
+@registry.command('!perf', check=commands.is_admin)
+async def perf(message: discord.Message):
+    if not metrics.enabled:
+        await outbound.reply(message, 'Metrics are off, set `metricsEnabled: true` in config.yml to collect them.')
+        return
+    embed = discord.Embed(title='Cactus Coin Performance', color=discord.Color.dark_gold())
+    for title, rows in metrics.summary():
+        lines = [f'`{label}` {count}x, mean {format_seconds(mean)}, p50 ≤{format_seconds(p50)}, p99 ≤{format_seconds(p99)}'
+                 for label, count, mean, p50, p99 in rows]
+        embed.add_field(name=title, value='\n'.join(lines)[:1024] or 'Nothing recorded yet.', inline=False)
+    errors = ', '.join(f'`{source}` {count}' for source, count in metrics.counters['errors'].items())
+    embed.add_field(name='Errors', value=errors[:1024] or 'None.', inline=False)
+    await outbound.reply(message, embed=embed)
+
+
+@registry.command('!import', parser=parse_directory, check=commands.is_dev, usage='!import [directory]')
+async def import_ledger(message: discord.Message, directory: str):
+    if not os.path.isdir(directory):
+        await outbound.reply(message, f'`{directory}` is not a directory on the bot\'s server.')
+        return
+    try:
+        counts = await asyncio.to_thread(ledger_io.import_ledger, config.getAttribute('dbFile'), directory)
+    except RuntimeError as e:
+        await outbound.reply(message, f'Nothing was imported: {e} To replace the ledger, stop the bot and run `python ledger_cli.py import {directory} --replace`.')
+        return
+    commands.reload_ledger()
+    # exports from before guild ledgers come in as legacy rows and belong to the guild importing them
+    await commands.claim_legacy_ledger(config.getAttribute('legacyGuildId', message.guild.id))
+    start_backfill()
+    await outbound.reply(message, f'Imported {counts.get("AMOUNTS", 0)} wallets and {counts.get("TRANSACTIONS", 0)} transactions, run `!reconcile` to update roles.')
+
+
+@registry.command('!hardreset', check=commands.is_dev)
+async def hard_reset(message: discord.Message):
+    # BE CAREFUL WITH THIS IT WILL CLEAR OUT ALL COIN
+    output = ''
+    for member in message.guild.members:
+        coin = await commands.get_coin(message.guild.id, member.id)
+        await commands.remove_coin(message.guild.id, member.id)
+        await commands.remove_transactions(message.guild.id, member.id)
+        await commands.remove_role(message.guild, member)
+        output += member.display_name + ' - ' + str(coin) + '\n'
+    await outbound.reply(message, 'Everything cleared out...here\'s the short history just in case.\n' + output)
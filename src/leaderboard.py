@@ -0,0 +1,63 @@
+from bisect import bisect_left, insort
+
+
+# Every wallet ordered richest first, so a member's position is a binary search and a page is a slice.
+# It is loaded from AMOUNTS once and then kept in step by the ledger write functions in commands.
+class Leaderboard:
+    def __init__(self):
+        # (-coin, memberid), sorted
+        self.entries = []
+        self.amounts = {}
+        self.loaded = False
+        # balances written while the initial load was in flight, applied on top of it
+        self.pending = None
+
+    # Starts a load, updates from now on are held until finish_load
+    def begin_load(self):
+        self.pending = []
+
+    # rows are (memberid, amount), already ordered when read through the AMOUNTS_COIN index so the sort is a single pass
+    def finish_load(self, rows):
+        self.entries = [(-amount, memberid) for memberid, amount in rows]
+        self.entries.sort()
+        self.amounts = dict(rows)
+        self.loaded = True
+        pending, self.pending = self.pending or [], None
+        for memberid, amount in pending:
+            self.update(memberid, amount)
+
+    def clear(self):
+        self.entries = []
+        self.amounts = {}
+        self.loaded = False
+        self.pending = None
+
+    # Records a member's new balance, None removes their wallet
+    def update(self, memberid: int, amount):
+        if self.pending is not None:
+            self.pending.append((memberid, amount))
+            return
+        if not self.loaded:
+            return
+        old = self.amounts.pop(memberid, None)
+        if old is not None:
+            del self.entries[bisect_left(self.entries, (-old, memberid))]
+        if amount is not None:
+            self.amounts[memberid] = amount
+            insort(self.entries, (-amount, memberid))
+
+    # 1 based position of a member, members with the same balance share a position. None if they have no wallet.
+    def rank(self, memberid: int):
+        amount = self.amounts.get(memberid)
+        if amount is None:
+            return None
+        return bisect_left(self.entries, (-amount,)) + 1
+
+    # (memberid, amount) pairs from position start onwards, richest first
+    def iterate(self, start: int = 0):
+        for i in range(start, len(self.entries)):
+            amount, memberid = self.entries[i]
+            yield memberid, -amount
+
+    def __len__(self):
+        return len(self.entries)
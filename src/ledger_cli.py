@@ -0,0 +1,47 @@
+# Exports or imports the ledger from the command line, run from the src directory like main.py:
+#   python ledger_cli.py export ../backups/2024-01-01 [--format parquet|csv]
+#   python ledger_cli.py import ../backups/2024-01-01 [--replace]
+#   python ledger_cli.py vacuum
+# Export and import are safe to run while the bot is up, imported balances show up in the bot after a restart or !import.
+# Import refuses a ledger that already has transactions, --replace empties the imported tables first.
+# vacuum switches a database created before compaction to incremental vacuum, run it once with the bot stopped.
+import argparse
+import logging
+import sys
+import time
+import config
+import ledger_io
+
+
+def main():
+    logging.basicConfig(stream=sys.stderr, level=config.getAttribute('logLevel', 'INFO'))
+    parser = argparse.ArgumentParser(description='Export, import or vacuum the Cactus Coin ledger.')
+    parser.add_argument('action', choices=['export', 'import', 'vacuum'])
+    parser.add_argument('directory', nargs='?')
+    parser.add_argument('--format', choices=['parquet', 'csv'], default=None, help='export format, parquet when pyarrow is installed')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--replace', action='store_true', help='import: empty the tables being imported first')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.action == 'vacuum':
+        if ledger_io.enable_incremental_vacuum(config.getAttribute('dbFile')):
+            print(f'Switched to incremental vacuum in {time.perf_counter() - start:.1f}s')
+        else:
+            print('Incremental vacuum is already on')
+        return
+    if args.directory is None:
+        parser.error(f'{args.action} needs a directory')
+    if args.action == 'export':
+        counts = ledger_io.export_ledger(config.getAttribute('dbFile'), args.directory, args.format, args.chunk_size)
+    else:
+        try:
+            counts = ledger_io.import_ledger(config.getAttribute('dbFile'), args.directory, args.chunk_size, args.replace)
+        except RuntimeError as e:
+            parser.exit(1, f'Import failed: {e}\n')
+    summary = ', '.join(f'{count} {table.lower()}' for table, count in counts.items())
+    print(f'{args.action.capitalize()}ed {summary} in {time.perf_counter() - start:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+# Streams the ledger tables to and from files without loading them into memory. Parquet is used when pyarrow is
+# installed, otherwise gzipped CSV. Both directions use their own SQLite connection, so they can run next to the bot.
+import csv
+import gzip
+import importlib.util
+import logging
+import os
+import sqlite3
+from schema import create_schema
+
+
+# Table name -> (columns, pyarrow types, statement used to import a chunk of rows)
+tables = {
+    'AMOUNTS': (['guild_id', 'id', 'coin'], ['int64', 'int64', 'int64'],
+                'INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (?, ?, ?) ON CONFLICT(guild_id, id) DO UPDATE SET coin=excluded.coin'),
+    'TRANSACTIONS': (['guild_id', 'id', 'coin', 'memo', 'date'], ['int64', 'int64', 'int64', 'string', 'string'],
+                     'INSERT INTO TRANSACTIONS(guild_id, id, coin, memo, date) VALUES (?, ?, ?, ?, ?)'),
+    'TRANSACTION_ROLLUPS': (['guild_id', 'id', 'month', 'coin', 'count'], ['int64', 'int64', 'string', 'int64', 'int64'],
+                            'INSERT INTO TRANSACTION_ROLLUPS(guild_id, id, month, coin, count) VALUES (?, ?, ?, ?, ?) '
+                            'ON CONFLICT(guild_id, id, month) DO UPDATE SET coin=coin + excluded.coin, count=count + excluded.count'),
+}
+# Tables whose imported rows are added to what is there rather than replacing it, importing into them twice double counts
+appended = ['TRANSACTIONS', 'TRANSACTION_ROLLUPS']
+# Exports from before guild ledgers have no guild_id, their rows are imported as guild 0 and claimed like any other legacy rows
+defaults = {'guild_id': 0}
+extensions = {'parquet': '.parquet', 'csv': '.csv.gz'}
+
+
+# pyarrow pulls in numpy and takes a while to load, so it is only imported once a parquet file is read or written
+def load_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('pyarrow is needed to read or write parquet files')
+    return pyarrow
+
+
+def default_format():
+    return 'parquet' if importlib.util.find_spec('pyarrow') is not None else 'csv'
+
+
+def connect(dbFile: str):
+    connection = sqlite3.connect(dbFile, isolation_level=None)
+    connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    connection.execute('PRAGMA busy_timeout=5000')
+    return connection
+
+
+# Writes every ledger table to <directory>/<TABLE>.parquet (or .csv.gz), returns the number of rows per table
+def export_ledger(dbFile: str, directory: str, fmt: str = None, chunkSize: int = 10000):
+    fmt = fmt or default_format()
+    os.makedirs(directory, exist_ok=True)
+    connection = connect(dbFile)
+    counts = {}
+    try:
+        # a read transaction gives every table the same snapshot while the bot keeps writing
+        connection.execute('BEGIN')
+        for table, (columns, types, _) in tables.items():
+            cursor = connection.execute(f'SELECT {", ".join(columns)} FROM {table}')
+            path = os.path.join(directory, table + extensions[fmt])
+            writer = write_parquet if fmt == 'parquet' else write_csv
+            counts[table] = writer(path + '.partial', cursor, columns, types, chunkSize)
+            os.replace(path + '.partial', path)
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+    return counts
+
+
+def write_parquet(path: str, cursor: sqlite3.Cursor, columns: list, types: list, chunkSize: int):
+    pyarrow = load_pyarrow()
+    schema = pyarrow.schema([(column, getattr(pyarrow, kind)()) for column, kind in zip(columns, types)])
+    count = 0
+    with pyarrow.parquet.ParquetWriter(path, schema, compression='zstd') as writer:
+        rows = cursor.fetchmany(chunkSize)
+        while rows:
+            # each chunk becomes one row group
+            arrays = [pyarrow.array(column, type=field.type) for column, field in zip(zip(*rows), schema)]
+            writer.write_table(pyarrow.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+            rows = cursor.fetchmany(chunkSize)
+    return count
+
+
+def write_csv(path: str, cursor: sqlite3.Cursor, columns: list, types: list, chunkSize: int):
+    count = 0
+    with gzip.open(path, 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        rows = cursor.fetchmany(chunkSize)
+        while rows:
+            writer.writerows(rows)
+            count += len(rows)
+            rows = cursor.fetchmany(chunkSize)
+    return count
+
+
+# Path and format of the export of table in directory, or None
+def find_export(directory: str, table: str):
+    for fmt, extension in extensions.items():
+        path = os.path.join(directory, table + extension)
+        if os.path.exists(path):
+            return path, fmt
+    return None
+
+
+# Loads every table file found in directory, one transaction per chunk. Balances are upserted, transactions appended.
+# Transactions already in the ledger would be counted twice, so unless replace is set this refuses to import into a
+# ledger that has any, and with replace every table being imported is emptied first. Returns the rows imported per table.
+def import_ledger(dbFile: str, directory: str, chunkSize: int = 10000, replace: bool = False):
+    connection = connect(dbFile)
+    counts = {}
+    try:
+        create_schema(connection)
+        exports = {table: find_export(directory, table) for table in tables}
+        connection.execute('BEGIN IMMEDIATE')
+        if replace:
+            for table, export in exports.items():
+                if export is not None:
+                    connection.execute(f'DELETE FROM {table}')
+        else:
+            filled = [table for table in appended if exports[table] is not None and connection.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone()]
+            if filled:
+                connection.execute('ROLLBACK')
+                raise RuntimeError(f'{", ".join(filled)} already has rows, importing would count them twice. Import with replace to empty them first.')
+        connection.execute('COMMIT')
+
+        for table, (columns, types, statement) in tables.items():
+            if exports[table] is not None:
+                path, fmt = exports[table]
+                reader = read_parquet if fmt == 'parquet' else read_csv
+                counts[table] = 0
+                for rows in reader(path, columns, types, chunkSize):
+                    connection.execute('BEGIN IMMEDIATE')
+                    connection.executemany(statement, rows)
+                    connection.execute('COMMIT')
+                    counts[table] += len(rows)
+            else:
+                logging.warning(f'No export of {table} found in {directory}')
+        # balance snapshots are derived from the tables above, drop them so the next backfill rebuilds them
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute('DELETE FROM SNAPSHOTS')
+        connection.execute("DELETE FROM JOB_STATE WHERE name = 'snapshotBackfill'")
+        # imported transactions can be older than what was already compacted, start compaction over
+        connection.execute("DELETE FROM JOB_STATE WHERE name LIKE 'compaction %'")
+        connection.execute('COMMIT')
+    finally:
+        connection.close()
+    return counts
+
+
+# Switches a database created before incremental vacuum existed over to it. This needs one full VACUUM, which rewrites
+# the whole file and blocks every other connection while it runs, so only do it with the bot stopped.
+def enable_incremental_vacuum(dbFile: str):
+    connection = connect(dbFile)
+    try:
+        if connection.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            return False
+        connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        connection.execute('VACUUM')
+        return True
+    finally:
+        connection.close()
+
+
+def read_parquet(path: str, columns: list, types: list, chunkSize: int):
+    pyarrow = load_pyarrow()
+    parquetFile = pyarrow.parquet.ParquetFile(path)
+    present = [column for column in columns if column in parquetFile.schema_arrow.names]
+    for batch in parquetFile.iter_batches(batch_size=chunkSize, columns=present):
+        values = {column: batch.column(i).to_pylist() for i, column in enumerate(present)}
+        yield list(zip(*[values[column] if column in values else [defaults[column]] * batch.num_rows for column in columns]))
+
+
+def read_csv(path: str, columns: list, types: list, chunkSize: int):
+    with gzip.open(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        positions = [header.index(column) if column in header else None for column in columns]
+        rows = []
+        for line in reader:
+            rows.append(tuple(convert(line[position], kind) if position is not None else defaults[column]
+                              for position, kind, column in zip(positions, types, columns)))
+            if len(rows) == chunkSize:
+                yield rows
+                rows = []
+        if rows:
+            yield rows
+
+
+# CSV has no types or NULL, empty strings come back as None
+def convert(value: str, kind: str):
+    if value == '':
+        return None
+    return int(value) if kind == 'int64' else value
@@ -1,19 +1,27 @@
-import discord_client
-import discord
 import config
 import logging
 import sys
 import atexit
 import signal
 
-logging.basicConfig(stream=sys.stderr, level=config.getAttribute('logLevel', 'INFO'))
-
-# This is needed to get full list of members
-intents = discord.Intents.default()
-intents.members = True
-client = discord_client.Client(intents=intents)
 
 def main():
+    # imported here, the chart worker processes import this module too and must not open the ledger or a client
+    import discord
+    import discord_client
+    import outbound
+
+    logging.basicConfig(stream=sys.stderr, level=config.getAttribute('logLevel', 'INFO'))
+
+    # This is needed to get full list of members
+    intents = discord.Intents.default()
+    intents.members = True
+    if config.getAttribute('autoShard', False):
+        # shardCount is optional, without it Discord's recommended count is used
+        client = discord_client.Client(intents=intents, shard_count=config.getAttribute('shardCount', None), http_trace=outbound.trace_config())
+    else:
+        client = discord_client.Client(intents=intents, http_trace=outbound.trace_config())
+
     token = config.getAttribute('token', None)
     if token:
         client.run(token)
@@ -26,7 +34,8 @@ def handle_exit():
     # await client.close()
 
 
-atexit.register(handle_exit)
-signal.signal(signal.SIGTERM, handle_exit)
-signal.signal(signal.SIGINT, handle_exit)
-main()
+if __name__ == '__main__':
+    atexit.register(handle_exit)
+    signal.signal(signal.SIGTERM, handle_exit)
+    signal.signal(signal.SIGINT, handle_exit)
+    main()
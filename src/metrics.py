@@ -0,0 +1,159 @@
+# Latency histograms and counters for the bot's hot paths, shown by !perf and optionally served in the Prometheus text
+# format. Everything is recorded from the event loop thread, so plain ints and floats are enough and nothing is locked.
+# When metricsEnabled is off, timed() hands back a shared no-op context and count() returns straight away.
+import asyncio
+import contextlib
+import logging
+import time
+from bisect import bisect_left
+import config
+
+enabled = config.getAttribute('metricsEnabled', False)
+
+# Upper bounds of the histogram buckets in seconds, anything slower lands in a final +Inf bucket
+buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# family -> (metric name, label name, title shown by !perf)
+histogramFamilies = {
+    'command': ('cactus_command_seconds', 'command', 'Commands'),
+    'ledger': ('cactus_ledger_seconds', 'job', 'Ledger jobs'),
+    'render': ('cactus_render_seconds', 'chart', 'Chart renders'),
+    'discord': ('cactus_discord_seconds', 'route', 'Discord REST calls'),
+    'outbound': ('cactus_outbound_wait_seconds', 'priority', 'Outbound queue wait'),
+}
+# family -> (metric name, label name)
+counterFamilies = {
+    'errors': ('cactus_errors_total', 'source'),
+    'renderCache': ('cactus_render_cache_total', 'result'),
+    'outboundEvents': ('cactus_outbound_events_total', 'event'),
+}
+
+# family -> label -> Histogram or count
+histograms = {family: {} for family in histogramFamilies}
+counters = {family: {} for family in counterFamilies}
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    # Upper bound of the bucket holding the q-th quantile, or None if it is in the +Inf bucket
+    def quantile(self, q: float):
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+
+def observe(family: str, label: str, seconds: float):
+    histogram = histograms[family].get(label)
+    if histogram is None:
+        histogram = histograms[family][label] = Histogram()
+    histogram.observe(seconds)
+
+
+def count(family: str, label: str, amount: int = 1):
+    if enabled:
+        counters[family][label] = counters[family].get(label, 0) + amount
+
+
+class Timer:
+    def __init__(self, family: str, label: str):
+        self.family = family
+        self.label = label
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, excType, exc, traceback):
+        observe(self.family, self.label, time.perf_counter() - self.start)
+        if excType is not None:
+            count('errors', f'{self.family} {self.label}')
+        return False
+
+
+disabledTimer = contextlib.nullcontext()
+
+
+# Times the body of a with block into the family's histogram under label, failures are also counted as errors
+def timed(family: str, label: str):
+    if not enabled:
+        return disabledTimer
+    return Timer(family, label)
+
+
+# Wraps discord.py's HTTPClient.request so every REST call is timed under its route template, e.g.
+# PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}
+def instrument_http(request):
+    async def timed_request(route, **kwargs):
+        with timed('discord', f'{route.method} {route.path}'):
+            return await request(route, **kwargs)
+    return timed_request
+
+
+# (title, [(label, count, mean, p50, p99)]) per histogram family, busiest labels first
+def summary(limit: int = 8):
+    families = []
+    for family, (_, _, title) in histogramFamilies.items():
+        rows = sorted(histograms[family].items(), key=lambda item: item[1].total, reverse=True)[:limit]
+        families.append((title, [(label, histogram.count, histogram.total / histogram.count, histogram.quantile(.5), histogram.quantile(.99))
+                                 for label, histogram in rows]))
+    return families
+
+
+def escape(value: str):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Everything recorded so far in the Prometheus text exposition format
+def exposition():
+    lines = []
+    for family, (name, labelName, title) in histogramFamilies.items():
+        lines.append(f'# HELP {name} {title} latency in seconds')
+        lines.append(f'# TYPE {name} histogram')
+        for label, histogram in histograms[family].items():
+            labels = f'{labelName}="{escape(label)}"'
+            cumulative = 0
+            for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{{labels}}} {histogram.total}')
+            lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+    for family, (name, labelName) in counterFamilies.items():
+        lines.append(f'# TYPE {name} counter')
+        for label, value in counters[family].items():
+            lines.append(f'{name}{{{labelName}="{escape(label)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+# Answers every request on the connection with the current metrics, whatever the path
+async def handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        body = exposition().encode()
+        writer.write(b'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                     + f'Content-Length: {len(body)}\r\n\r\n'.encode() + body)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+# Starts the scrape endpoint, meant to stay on localhost and be read by a local Prometheus or curl
+async def serve(host: str, port: int):
+    server = await asyncio.start_server(handle_scrape, host, port)
+    logging.info(f'Serving metrics on http://{host}:{port}/metrics')
+    return server
@@ -0,0 +1,216 @@
+# Every message, edit, delete and role call the bot makes goes through one scheduler instead of straight to discord.py,
+# so a burst of role updates after a payout cannot hold up the reply to someone's command.
+#  - Requests have a priority: replies to commands go first, wager updates next and role changes last.
+#  - Each route (method and path, with every id but the guild or channel one replaced) has a budget read from Discord's
+#    X-RateLimit headers and 429s. While a route is out of budget its requests wait in the queue without holding one of
+#    the concurrency slots, so other routes keep moving.
+#  - An edit of a message that is still waiting to be sent is merged into the one already queued.
+# Interaction responses are left alone, their token only lasts a few seconds and they have a route of their own.
+import asyncio
+import collections
+import re
+import time
+import aiohttp
+import discord
+import config
+import metrics
+
+INTERACTIVE, UPDATE, COSMETIC = 0, 1, 2
+priorityNames = ['interactive', 'update', 'cosmetic']
+
+majorParameter = re.compile(r'^/(channels|guilds|webhooks)/\d+')
+snowflake = re.compile(r'/\d{15,}')
+apiPrefix = re.compile(r'^/api/v\d+')
+
+
+# Rate limit key for a request, e.g. PUT /guilds/1234/members/{id}/roles/{id}
+def route_key(method: str, path: str):
+    major = majorParameter.match(path)
+    prefix = major.group(0) if major else ''
+    return f'{method} {prefix}{snowflake.sub("/{id}", path[len(prefix):])}'
+
+
+class OutboundRequest:
+    def __init__(self, priority: int, key: str, call, args: tuple, kwargs: dict, messageid: int = None):
+        self.priority = priority
+        self.key = key
+        self.call = call
+        self.args = args
+        self.kwargs = kwargs
+        self.messageid = messageid
+        self.future = asyncio.get_running_loop().create_future()
+        self.queued = time.monotonic()
+
+
+class OutboundScheduler:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        # per priority, route key -> requests in the order they were made, so routes take turns within a priority
+        self.queues = [collections.OrderedDict() for _ in priorityNames]
+        # message id -> queued edit of it
+        self.edits = {}
+        # route key -> [requests left, time.monotonic() the budget resets]
+        self.budgets = {}
+        self.globalReset = 0
+        self.running = 0
+        self.wakeup = None
+        self.task = None
+
+    def submit(self, priority: int, key: str, call, *args, **kwargs):
+        return self.enqueue(OutboundRequest(priority, key, call, args, kwargs))
+
+    # Queues message.edit(**fields), or folds the fields into an edit of the same message that has not gone out yet
+    def submit_edit(self, priority: int, key: str, message, fields: dict):
+        queued = self.edits.get(message.id)
+        if queued is not None:
+            queued.kwargs.update(fields)
+            metrics.count('outboundEvents', 'edit merged')
+            return queued.future
+        request = OutboundRequest(priority, key, message.edit, (), dict(fields), message.id)
+        self.edits[message.id] = request
+        return self.enqueue(request)
+
+    def enqueue(self, request: OutboundRequest):
+        self.queues[request.priority].setdefault(request.key, collections.deque()).append(request)
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.get_running_loop().create_task(self.dispatch())
+        self.wakeup.set()
+        return request.future
+
+    def available(self, key: str, now: float):
+        if now < self.globalReset:
+            return False
+        budget = self.budgets.get(key)
+        return budget is None or budget[0] > 0 or now >= budget[1]
+
+    # Takes the most urgent request whose route has budget left, or returns None
+    def next_request(self, now: float):
+        for queue in self.queues:
+            for key, requests in queue.items():
+                if self.available(key, now):
+                    request = requests.popleft()
+                    if requests:
+                        # the route goes to the back so the others at this priority get a turn
+                        queue.move_to_end(key)
+                    else:
+                        del queue[key]
+                    return request
+        return None
+
+    # Seconds until the next route that has requests waiting gets its budget back
+    def next_reset(self, now: float):
+        resets = [self.budgets[key][1] for queue in self.queues for key in queue if key in self.budgets]
+        return max(min(resets, default=now), self.globalReset) - now
+
+    async def dispatch(self):
+        while any(self.queues):
+            self.wakeup.clear()
+            now = time.monotonic()
+            request = self.next_request(now) if self.running < self.concurrency else None
+            if request is None:
+                # woken by a new request, a finished one or new rate limit headers, or when a budget resets
+                timeout = self.next_reset(now) if self.running < self.concurrency else None
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=max(timeout, 0.001) if timeout is not None else None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if request.messageid is not None:
+                self.edits.pop(request.messageid, None)
+            budget = self.budgets.get(request.key)
+            if budget is not None:
+                if now >= budget[1]:
+                    # the window has passed, the response will tell us the new budget
+                    del self.budgets[request.key]
+                else:
+                    budget[0] -= 1
+            self.running += 1
+            asyncio.ensure_future(self.run(request))
+
+    async def run(self, request: OutboundRequest):
+        if metrics.enabled:
+            metrics.observe('outbound', priorityNames[request.priority], time.monotonic() - request.queued)
+        try:
+            result = await request.call(*request.args, **request.kwargs)
+            if not request.future.done():
+                request.future.set_result(result)
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+        finally:
+            self.running -= 1
+            if self.wakeup is not None:
+                self.wakeup.set()
+
+    # Updates a route's budget from the headers of a response Discord sent for it
+    def observe(self, key: str, status: int, headers):
+        now = time.monotonic()
+        if status == 429:
+            retryAfter = float(headers.get('Retry-After', 1))
+            metrics.count('outboundEvents', 'rate limited')
+            if headers.get('X-RateLimit-Global'):
+                self.globalReset = now + retryAfter
+            else:
+                self.budgets[key] = [0, now + retryAfter]
+        elif 'X-RateLimit-Remaining' in headers:
+            self.budgets[key] = [int(headers['X-RateLimit-Remaining']), now + float(headers.get('X-RateLimit-Reset-After', 0))]
+        else:
+            return
+        if self.wakeup is not None:
+            self.wakeup.set()
+
+    def __len__(self):
+        return sum(len(requests) for queue in self.queues for requests in queue.values())
+
+
+scheduler = OutboundScheduler(config.getAttribute('outboundConcurrency', 8))
+
+
+# Passed to the client as http_trace so every REST response, scheduled or not, updates the route budgets
+def trace_config():
+    trace = aiohttp.TraceConfig()
+
+    async def on_request_end(session, context, params: aiohttp.TraceRequestEndParams):
+        scheduler.observe(route_key(params.method, apiPrefix.sub('', params.url.path)), params.response.status, params.response.headers)
+
+    trace.on_request_end.append(on_request_end)
+    return trace
+
+
+#############################################################
+# The calls the bot makes, each awaits the result of the discord.py call it stands in for
+#############################################################
+async def send(channel: discord.abc.Messageable, *args, priority: int = INTERACTIVE, **kwargs):
+    return await scheduler.submit(priority, route_key('POST', f'/channels/{channel.id}/messages'), channel.send, *args, **kwargs)
+
+
+async def reply(message: discord.Message, *args, priority: int = INTERACTIVE, **kwargs):
+    return await scheduler.submit(priority, route_key('POST', f'/channels/{message.channel.id}/messages'), message.reply, *args, **kwargs)
+
+
+async def edit(message: discord.PartialMessage, priority: int = UPDATE, **fields):
+    key = route_key('PATCH', f'/channels/{message.channel.id}/messages/{message.id}')
+    return await scheduler.submit_edit(priority, key, message, fields)
+
+
+async def delete(message: discord.PartialMessage, priority: int = UPDATE):
+    return await scheduler.submit(priority, route_key('DELETE', f'/channels/{message.channel.id}/messages/{message.id}'), message.delete)
+
+
+async def add_roles(member: discord.Member, *roles: discord.Role, reason: str = None):
+    key = route_key('PUT', f'/guilds/{member.guild.id}/members/{member.id}/roles/{roles[0].id}')
+    return await scheduler.submit(COSMETIC, key, member.add_roles, *roles, reason=reason)
+
+
+async def remove_roles(member: discord.Member, *roles: discord.Role, reason: str = None):
+    key = route_key('DELETE', f'/guilds/{member.guild.id}/members/{member.id}/roles/{roles[0].id}')
+    return await scheduler.submit(COSMETIC, key, member.remove_roles, *roles, reason=reason)
+
+
+async def create_role(guild: discord.Guild, **fields):
+    return await scheduler.submit(COSMETIC, route_key('POST', f'/guilds/{guild.id}/roles'), guild.create_role, **fields)
+
+
+async def delete_role(role: discord.Role, reason: str = None):
+    return await scheduler.submit(COSMETIC, route_key('DELETE', f'/guilds/{role.guild.id}/roles/{role.id}'), role.delete, reason=reason)
@@ -0,0 +1,37 @@
+import hashlib
+from collections import OrderedDict
+
+
+# LRU cache of rendered images keyed by a hash of everything that went into drawing them, bounded by total bytes
+class RenderCache:
+    def __init__(self, maxBytes: int):
+        self.maxBytes = maxBytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    # Builds a cache key from the chart inputs, anything with a stable repr can be passed in
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def get(self, key: str):
+        image = self.entries.get(key)
+        if image is not None:
+            self.entries.move_to_end(key)
+        return image
+
+    def put(self, key: str, image: bytes):
+        if len(image) > self.maxBytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = image
+        self.size += len(image)
+        while self.size > self.maxBytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
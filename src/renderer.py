@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import config
+import metrics
+
+
+_pool = None
+_warmed = False
+
+
+# Runs in a worker process: the plotting stack is imported there on first use and never in the bot process itself
+def _call(name: str, args: tuple):
+    import charts
+    return getattr(charts, name)(*args)
+
+
+# Charts render in worker processes, in parallel and off the event loop. Workers are spawned rather than forked: the
+# pool starts after the ledger thread and the event loop, and a forked child could inherit a lock one of them held.
+def pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=config.getAttribute('chartWorkers', 2), mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+# Runs charts.<name>(*args) in the worker pool and returns its result
+async def render(name: str, *args):
+    with metrics.timed('render', name):
+        return await asyncio.get_running_loop().run_in_executor(pool(), _call, name, args)
+
+
+# Loads the plotting stack in every worker in the background so the first chart after startup is not slow
+async def warm_up():
+    global _warmed
+    if _warmed:
+        return
+    _warmed = True
+    try:
+        await asyncio.gather(*[render('warm_up') for _ in range(config.getAttribute('chartWorkers', 2))])
+    except Exception:
+        logging.exception('Renderer warm up failed')
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+
+
+# Collects wallet role updates per member and applies only the latest one once changes settle down.
+# Callers schedule a member and return straight away, a background task drains the queue after `delay` seconds.
+class RoleSyncQueue:
+    def __init__(self, sync, delay: float, concurrency: int):
+        # sync(guild, member) is awaited to bring a member's role in line with their current balance
+        self.sync = sync
+        self.delay = delay
+        self.concurrency = concurrency
+        self.pending = {}
+        self.task = None
+
+    def schedule(self, guild, member):
+        # later changes for the same member of a guild replace earlier ones, the sync reads the balance when it runs
+        self.pending[(guild.id, member.id)] = (guild, member)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.drain())
+
+    async def drain(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        while self.pending:
+            await asyncio.sleep(self.delay)
+            batch, self.pending = self.pending, {}
+            await asyncio.gather(*[self.sync_member(semaphore, guild, member) for guild, member in batch.values()])
+
+    async def sync_member(self, semaphore: asyncio.Semaphore, guild, member):
+        async with semaphore:
+            try:
+                await self.sync(guild, member)
+            except Exception:
+                logging.exception('Role sync failed for ' + member.display_name)
@@ -0,0 +1,54 @@
+import logging
+import sqlite3
+
+
+# Schema changes applied in order, PRAGMA user_version records how many have already run
+migrations = [
+    ['CREATE TABLE IF NOT EXISTS AMOUNTS (id integer PRIMARY KEY, coin integer)',
+     'CREATE TABLE IF NOT EXISTS TRANSACTIONS (id integer, coin integer, memo string, date date)'],
+    # covers the period scans behind !bigwins and !biglosses, id is included so the index alone answers the query
+    ['CREATE INDEX IF NOT EXISTS TRANSACTIONS_DATE_COIN ON TRANSACTIONS (date, coin, id)'],
+    # end of day balance per member, written alongside every balance change and backfilled from TRANSACTIONS
+    ['CREATE TABLE IF NOT EXISTS SNAPSHOTS (id integer, day date, coin integer, PRIMARY KEY (id, day))',
+     'CREATE TABLE IF NOT EXISTS JOB_STATE (name text PRIMARY KEY, value text)'],
+    # wallets in leaderboard order
+    ['CREATE INDEX IF NOT EXISTS AMOUNTS_COIN ON AMOUNTS (coin DESC, id)'],
+    # open and finished bets and wheels, see wagers.py. players and votes are json.
+    ['CREATE TABLE IF NOT EXISTS WAGERS (message_id integer PRIMARY KEY, kind text, state text, guild_id integer, channel_id integer, '
+     'creator integer, opponent integer, amount integer, reason text, players text, votes text, expires real)',
+     'CREATE INDEX IF NOT EXISTS WAGERS_STATE_EXPIRES ON WAGERS (state, expires)'],
+    # one ledger per guild. Rows from single guild databases get guild 0 and are handed to their guild on start up,
+    # see commands.claim_legacy_ledger. AMOUNTS and SNAPSHOTS are rebuilt to move guild_id into their primary keys.
+    ['CREATE TABLE AMOUNTS_BY_GUILD (guild_id integer NOT NULL DEFAULT 0, id integer, coin integer, PRIMARY KEY (guild_id, id))',
+     'INSERT INTO AMOUNTS_BY_GUILD(id, coin) SELECT id, coin FROM AMOUNTS',
+     'DROP TABLE AMOUNTS',
+     'ALTER TABLE AMOUNTS_BY_GUILD RENAME TO AMOUNTS',
+     'CREATE INDEX AMOUNTS_COIN ON AMOUNTS (guild_id, coin DESC, id)',
+     'ALTER TABLE TRANSACTIONS ADD COLUMN guild_id integer NOT NULL DEFAULT 0',
+     'DROP INDEX IF EXISTS TRANSACTIONS_DATE_COIN',
+     'CREATE INDEX TRANSACTIONS_DATE_COIN ON TRANSACTIONS (guild_id, date, coin, id)',
+     'CREATE INDEX TRANSACTIONS_MEMBER ON TRANSACTIONS (guild_id, id)',
+     'CREATE TABLE SNAPSHOTS_BY_GUILD (guild_id integer NOT NULL DEFAULT 0, id integer, day date, coin integer, PRIMARY KEY (guild_id, id, day))',
+     'INSERT INTO SNAPSHOTS_BY_GUILD(id, day, coin) SELECT id, day, coin FROM SNAPSHOTS',
+     'DROP TABLE SNAPSHOTS',
+     'ALTER TABLE SNAPSHOTS_BY_GUILD RENAME TO SNAPSHOTS',
+     # the backfill now walks (guild id, member id)
+     "UPDATE JOB_STATE SET value = '0 ' || value WHERE name = 'snapshotBackfill' AND value != 'done'"],
+    # transactions past the compaction horizon summed per member per month, see compaction.py
+    ['CREATE TABLE IF NOT EXISTS TRANSACTION_ROLLUPS (guild_id integer, id integer, month date, coin integer, count integer, '
+     'PRIMARY KEY (guild_id, id, month))'],
+    # lets !bigwins (read backwards) and !biglosses stop after the first few rows of the period instead of sorting all of it
+    ['CREATE INDEX IF NOT EXISTS TRANSACTIONS_COIN_DATE ON TRANSACTIONS (guild_id, coin, date, id)'],
+]
+
+
+# Brings a database up to the latest schema, the connection must be opened with isolation_level=None
+def create_schema(connection: sqlite3.Connection):
+    version = connection.execute('PRAGMA user_version').fetchone()[0]
+    for number, statements in enumerate(migrations[version:], start=version + 1):
+        logging.info('Applying ledger migration ' + str(number))
+        connection.execute('BEGIN IMMEDIATE')
+        for statement in statements:
+            connection.execute(statement)
+        connection.execute(f'PRAGMA user_version = {number}')
+        connection.execute('COMMIT')
@@ -0,0 +1,99 @@
+# Daily balance snapshots: one row per member per day they had a balance change, holding their balance at the end of
+# that day. History charts read these instead of replaying TRANSACTIONS.
+import asyncio
+import datetime
+import itertools
+import logging
+import sql_client as sql
+
+
+# Records the current balances of some members of a guild for today, called from inside the ledger jobs that change balances
+def record(connection, guildid: int, amounts):
+    day = datetime.datetime.utcnow().date()
+    connection.executemany('INSERT INTO SNAPSHOTS(guild_id, id, day, coin) VALUES (?, ?, ?, ?) '
+                           'ON CONFLICT(guild_id, id, day) DO UPDATE SET coin=excluded.coin',
+                           [(guildid, memberid, day, amount) for memberid, amount in amounts])
+
+
+# Snapshots from start onwards, plus the last one before start so the chart knows where the period began
+def _get_history(connection, guildid: int, memberid: int, start: datetime.date):
+    before = connection.execute('SELECT day, coin FROM SNAPSHOTS WHERE guild_id = ? AND id = ? AND day < ? ORDER BY day DESC LIMIT 1',
+                                (guildid, memberid, start)).fetchall()
+    return before + connection.execute('SELECT day, coin FROM SNAPSHOTS WHERE guild_id = ? AND id = ? AND day >= ? ORDER BY day',
+                                       (guildid, memberid, start)).fetchall()
+
+
+async def get_history(guildid: int, memberid: int, start: datetime.date):
+    return await sql.read(_get_history, guildid, memberid, start)
+
+
+def _get_state(connection, name: str):
+    state = connection.execute('SELECT value FROM JOB_STATE WHERE name = ?', (name,)).fetchall()
+    if state:
+        return state[0][0]
+    return None
+
+
+def _set_state(connection, name: str, value: str):
+    connection.execute('INSERT INTO JOB_STATE(name, value) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value=excluded.value', (name, value))
+
+
+# Backfills snapshots for the next chunk of wallets by walking back from their current balance through their daily
+# transaction totals. Existing snapshots are kept. Progress is the last (guild id, member id) done and lives in
+# JOB_STATE so an import can restart it and a restart of the bot resumes it. Returns False once every wallet has been handled.
+def _backfill_chunk(connection, chunkSize: int):
+    state = _get_state(connection, 'snapshotBackfill')
+    if state == 'done':
+        return False
+    after = tuple(int(part) for part in state.split()) if state else (-1, -1)
+    wallets = connection.execute('SELECT guild_id, id, coin FROM AMOUNTS WHERE (guild_id, id) > (?, ?) ORDER BY guild_id, id LIMIT ?',
+                                 after + (chunkSize,)).fetchall()
+    if not wallets:
+        _set_state(connection, 'snapshotBackfill', 'done')
+        return False
+
+    rows = []
+    for guildid, members in itertools.groupby(wallets, key=lambda wallet: wallet[0]):
+        members = [(memberid, coin) for _, memberid, coin in members]
+        placeholders = ', '.join('?' * len(members))
+        parameters = [guildid] + [memberid for memberid, _ in members]
+        totals = {}
+        for memberid, day, total in connection.execute(f'SELECT id, date(date) AS day, SUM(coin) FROM TRANSACTIONS WHERE guild_id = ? AND id IN ({placeholders}) '
+                                                       f'GROUP BY id, day', parameters):
+            totals.setdefault(memberid, {})[day] = total
+        # compacted transactions only have a monthly total, it is counted on the first of the month
+        for memberid, day, total in connection.execute(f'SELECT id, month, coin FROM TRANSACTION_ROLLUPS WHERE guild_id = ? AND id IN ({placeholders})',
+                                                       parameters):
+            days = totals.setdefault(memberid, {})
+            days[day] = days.get(day, 0) + total
+
+        for memberid, balance in members:
+            # the balance at the end of a day is the current balance minus everything that happened on later days
+            for day, total in sorted(totals.get(memberid, {}).items(), reverse=True):
+                rows.append((guildid, memberid, day, balance))
+                balance -= total
+    connection.executemany('INSERT OR IGNORE INTO SNAPSHOTS(guild_id, id, day, coin) VALUES (?, ?, ?, ?)', rows)
+    _set_state(connection, 'snapshotBackfill', f'{wallets[-1][0]} {wallets[-1][1]}')
+    return True
+
+
+backfilling = False
+
+
+# Runs the backfill a chunk at a time with a pause in between so other ledger jobs keep flowing
+async def backfill(chunkSize: int, pause: float):
+    global backfilling
+    if backfilling:
+        return
+    backfilling = True
+    try:
+        if await sql.read(_get_state, 'snapshotBackfill') == 'done':
+            return
+        logging.info('Backfilling balance snapshots')
+        while await sql.run(_backfill_chunk, chunkSize):
+            await asyncio.sleep(pause)
+        logging.info('Balance snapshot backfill finished')
+    except Exception:
+        logging.exception('Snapshot backfill stopped, it will resume on the next start')
+    finally:
+        backfilling = False
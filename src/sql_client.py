@@ -1,21 +1,179 @@
 import sqlite3
 import atexit
 import config
+import metrics
+from schema import create_schema
 import signal
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
 
 
-try:
-    connection = sqlite3.connect(config.getAttribute('dbFile'))
-    connection.execute('CREATE TABLE IF NOT EXISTS AMOUNTS (id integer PRIMARY KEY, coin integer)')
-    connection.execute('CREATE TABLE IF NOT EXISTS TRANSACTIONS (id integer, coin integer, memo string, date date)')
-except sqlite3.Error as e:
-    print(e)
+# Writes that arrive within this window of the first queued write share a single commit
+commitWindow = config.getAttribute('dbCommitWindowMs', 5) / 1000
+# Upper bound on the number of jobs grouped into one transaction
+maxBatchSize = 256
 
 
-def handle_exit():
-    if connection:
+class LedgerJob:
+    def __init__(self, fn, args, write: bool):
+        self.fn = fn
+        self.args = args
+        self.write = write
+        self.future = Future()
+
+
+# Owns the only SQLite connection and runs every ledger job on its own thread so the event loop never waits on disk.
+# Jobs run in FIFO order, each inside its own savepoint, and a batch of jobs is committed together.
+class LedgerWriter(threading.Thread):
+    def __init__(self, dbFile: str, window: float, busyTimeout: int = 5000):
+        super().__init__(name='ledger-writer', daemon=True)
+        self.dbFile = dbFile
+        self.window = window
+        self.busyTimeout = busyTimeout
+        self.jobs = queue.Queue()
+        self.running = True
+        # bumped after every committed batch that contained a write, lets callers tell if cached query results are stale
+        self.generation = 0
+
+    def run(self):
+        try:
+            os.makedirs(os.path.dirname(self.dbFile) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.dbFile, isolation_level=None)
+            # only takes effect on a new file and before WAL is switched on, lets compaction free pages a few at a time
+            connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            # exports and imports use their own connections, wait for them instead of failing
+            connection.execute(f'PRAGMA busy_timeout={int(self.busyTimeout)}')
+            create_schema(connection)
+        except (sqlite3.Error, OSError) as e:
+            logging.error('Could not open ledger database: ' + str(e))
+            self.running = False
+            self.fail_pending(e)
+            return
+
+        while self.running:
+            batch = self.collect_batch()
+            if batch:
+                self.run_batch(connection, batch)
         connection.close()
+        # jobs submitted while the writer was stopping would otherwise wait forever
+        self.fail_pending(sqlite3.OperationalError('Ledger writer is not running'))
+
+    # Blocks for the next job, then gathers whatever else arrives during the commit window
+    def collect_batch(self):
+        job = self.jobs.get()
+        if job is None:
+            self.running = False
+            return []
+        batch = [job]
+        # reads do not need to wait for company, just pick up anything already queued
+        deadline = time.monotonic() + (self.window if job.write else 0)
+        while len(batch) < maxBatchSize:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self.jobs.get(timeout=remaining) if remaining > 0 else self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self.running = False
+                break
+            batch.append(job)
+        return batch
+
+    # A batch that cannot begin or commit, e.g. because another connection held the write lock past busy_timeout, fails
+    # every job in it and the writer carries on with the next one. Only a connection that cannot even roll back stops it.
+    def run_batch(self, connection: sqlite3.Connection, batch):
+        results = []
+        try:
+            # take the write lock up front so a batch never fails halfway on a lock held by another connection
+            connection.execute('BEGIN IMMEDIATE' if any(job.write for job in batch) else 'BEGIN')
+            for job in batch:
+                connection.execute('SAVEPOINT job')
+                try:
+                    result = job.fn(connection, *job.args)
+                except Exception as e:
+                    connection.execute('ROLLBACK TO job')
+                    connection.execute('RELEASE job')
+                    results.append((job, None, e))
+                else:
+                    connection.execute('RELEASE job')
+                    results.append((job, result, None))
+            connection.execute('COMMIT')
+        except sqlite3.Error as e:
+            logging.error('Ledger batch failed: ' + str(e))
+            results = [(job, None, e) for job in batch]
+            try:
+                if connection.in_transaction:
+                    connection.execute('ROLLBACK')
+            except sqlite3.Error as rollbackError:
+                logging.error('Ledger connection is unusable, stopping the writer: ' + str(rollbackError))
+                self.running = False
+
+        if any(job.write for job in batch):
+            self.generation += 1
+        for job, result, error in results:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+
+    def fail_pending(self, error: Exception):
+        while True:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None:
+                job.future.set_exception(error)
+
+    def submit(self, fn, *args, write: bool = True):
+        job = LedgerJob(fn, args, write)
+        if not self.running:
+            job.future.set_exception(sqlite3.OperationalError('Ledger writer is not running'))
+        else:
+            self.jobs.put(job)
+        return job.future
+
+    def stop(self):
+        if self.is_alive():
+            self.jobs.put(None)
+            self.join(timeout=5)
+
+
+writer = LedgerWriter(config.getAttribute('dbFile'), commitWindow)
+writer.start()
+
+
+# Queues fn(connection, *args) on the ledger thread, returns a concurrent future for callers outside the event loop
+def submit(fn, *args, write: bool = True):
+    return writer.submit(fn, *args, write=write)
+
+
+# Runs fn(connection, *args) on the ledger thread and waits for it to be committed without blocking the event loop
+async def run(fn, *args, write: bool = True):
+    with metrics.timed('ledger', fn.__name__):
+        return await asyncio.wrap_future(writer.submit(fn, *args, write=write))
+
+
+# Number of write batches committed so far
+def generation():
+    return writer.generation
+
+
+# Same as run but for read only jobs, which skip the group commit window
+async def read(fn, *args):
+    return await run(fn, *args, write=False)
+
+
+def handle_exit(*args):
+    writer.stop()
 
 atexit.register(handle_exit)
 signal.signal(signal.SIGTERM, handle_exit)
-signal.signal(signal.SIGINT, handle_exit)
\ No newline at end of file
+signal.signal(signal.SIGINT, handle_exit)
@@ -1,114 +1,118 @@
 import discord
 import commands
-import config
+import wagers
 
 
-# Define a simple View that gives us a confirmation menu
-class ConfirmBet(discord.ui.View):
-    def __init__(self, memberid: int):
-        super().__init__()
-        self.value = None
-        self.memberId = memberid
+# The views below are persistent: they never time out, every button has a fixed custom_id, and one instance of each is
+# registered with the client at start up. A button press finds its bet or wheel through the id of the message it is on,
+# so open wagers need no live view or coroutine and keep working after a restart. Views that go out with a message are
+# detached first, see detached.
 
-    @discord.ui.button(label='Decline', style=discord.ButtonStyle.red)
-    async def cancel(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user.id == self.memberId:
-            self.value = False
-            self.stop()
-        else:
-            await interaction.response.send_message('Hey this is not your decision to make.', ephemeral=True)
 
-    @discord.ui.button(label='Accept', style=discord.ButtonStyle.green)
-    async def confirm(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user.id == self.memberId:
-            self.value = True
-            self.stop()
-        else:
-            await interaction.response.send_message('Hey this is not your decision to make.', ephemeral=True)
+# Presses can arrive before on_ready has handed the legacy ledger to its guild, they wait for it like commands do
+class WagerView(discord.ui.View):
+    async def interaction_check(self, interaction: discord.Interaction):
+        await commands.legacyClaimed.wait()
+        return True
+
 
+# Lets the challenged member accept or decline a bet
+class ConfirmBet(WagerView):
+    def __init__(self):
+        super().__init__(timeout=None)
 
-# Button prompts that let members decide who won the bet
-class DecideBetOutcome(discord.ui.View):
-    def __init__(self, member1: discord.Member, member2: discord.Member):
-        super().__init__(timeout=600.0)
-        self.winner = None
-        self.member1 = member1
-        self.member1choice = None
-        button1 = discord.ui.Button(label=member1.display_name, style=discord.ButtonStyle.blurple)
-        button1.callback = self.member1win
+    @discord.ui.button(label='Decline', style=discord.ButtonStyle.red, custom_id='bet:decline')
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.respond(interaction, False)
 
-        self.member2 = member2
-        self.member2choice = None
-        button2 = discord.ui.Button(label=member2.display_name, style=discord.ButtonStyle.blurple)
-        button2.callback = self.member2win
+    @discord.ui.button(label='Accept', style=discord.ButtonStyle.green, custom_id='bet:accept')
+    async def confirm(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await self.respond(interaction, True)
 
+    async def respond(self, interaction: discord.Interaction, accept: bool):
+        outcome, wager = await wagers.respond(interaction.message.id, interaction.user.id, accept)
+        if outcome == 'not yours':
+            await interaction.response.send_message('Hey this is not your decision to make.', ephemeral=True)
+        elif outcome == 'closed':
+            await interaction.response.send_message('This bet is no longer open.', ephemeral=True)
+        elif outcome == 'declined':
+            await interaction.response.edit_message(content=f'{interaction.user.display_name} has declined the bet.', view=None)
+        else:
+            creator = wagers.member_name(interaction.guild, wager['creator'])
+            await interaction.response.edit_message(
+                content=f'{interaction.user.display_name} has accepted the bet. After the bet is over, pick a winner below:',
+                view=detached(DecideBetOutcome(creator, interaction.user.display_name)))
+
+
+# Button prompts that let members decide who won the bet. Both sides agreeing settles it, if they disagree a third
+# party's vote decides.
+class DecideBetOutcome(WagerView):
+    def __init__(self, creatorName: str = 'Challenger', opponentName: str = 'Challenged'):
+        super().__init__(timeout=None)
+        button1 = discord.ui.Button(label=creatorName, style=discord.ButtonStyle.blurple, custom_id='bet:creator')
+        button1.callback = self.creatorwin
+        button2 = discord.ui.Button(label=opponentName, style=discord.ButtonStyle.blurple, custom_id='bet:opponent')
+        button2.callback = self.opponentwin
         self.add_item(button1)
         self.add_item(button2)
 
-    # Choose the bet outcome as member1
-    async def member1win(self, interaction: discord.Interaction):
-        if interaction.user.id == self.member1.id:
-            self.member1choice = self.member1.id
-        elif interaction.user.id == self.member2.id:
-            self.member2choice = self.member1.id
-
-        # if both parties agree to the result
-        if self.member1choice and self.member2choice and self.member1choice == self.member2choice:
-            self.winner = self.member1.id
-            self.stop()
-        # if parties do not agree to the result, have a third party decide the winner.
-        elif self.member1choice and self.member2choice and self.member1choice != self.member2choice and interaction.user.id != self.member1.id and interaction.user.id != self.member2.id:
-            self.winner = self.member1.id
-            self.stop()
-        elif self.member1choice and self.member2choice and self.member1choice != self.member2choice:
+    async def creatorwin(self, interaction: discord.Interaction):
+        await self.vote(interaction, 'creator')
+
+    async def opponentwin(self, interaction: discord.Interaction):
+        await self.vote(interaction, 'opponent')
+
+    async def vote(self, interaction: discord.Interaction, side: str):
+        wager = await wagers.get(interaction.message.id)
+        if wager is None:
+            await interaction.response.send_message('This bet is no longer open.', ephemeral=True)
+            return
+        choice = wager[side]
+        outcome, wager = await wagers.vote(interaction.guild, interaction.message.id, interaction.user.id, choice)
+        if outcome == 'closed':
+            await interaction.response.send_message('This bet is no longer open.', ephemeral=True)
+        elif outcome == 'disputed':
             await interaction.response.send_message('Winner chosen, but there is a conflict. Have a third party vote to solve this dispute.', ephemeral=True)
-        else:
+        elif outcome == 'waiting':
             await interaction.response.send_message('Winner chosen, waiting for other party...', ephemeral=True)
-
-    # Choose the bet outcome as member2
-    async def member2win(self, interaction: discord.Interaction):
-        if interaction.user.id == self.member1.id:
-            self.member1choice = self.member2.id
-        elif interaction.user.id == self.member2.id:
-            self.member2choice = self.member2.id
-
-        # if both parties agree to the result
-        if self.member1choice and self.member2choice and self.member1choice == self.member2choice:
-            self.winner = self.member2.id
-            self.stop()
-        # if parties do not agree to the result, have a third party decide the winner.
-        elif self.member1choice and self.member2choice and self.member1choice != self.member2choice and interaction.user.id != self.member1.id and interaction.user.id != self.member2.id:
-            self.winner = self.member2.id
-            self.stop()
-        elif self.member1choice and self.member2choice and self.member1choice != self.member2choice:
-            await interaction.response.send_message('Winner chosen, but there is a conflict. Have a third party vote to solve this dispute.', ephemeral=True)
         else:
-            await interaction.response.send_message('Winner chosen, waiting for other party...', ephemeral=True)
+            await interaction.response.edit_message(content=wagers.settled_text(interaction.guild, wager, choice, outcome == 'settled'), view=None)
 
 
-class JoinWheel(discord.ui.View):
-    def __init__(self, member: discord.Member, amount: int):
-        super().__init__(timeout=120.0)
-        self.members = [member]
-        self.betAmount = amount
-
-    @discord.ui.button(label='Join', style=discord.ButtonStyle.green)
-    async def join(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user not in self.members:
-            currentCoin = commands.get_coin(interaction.user.id)
-            if currentCoin - self.betAmount >= config.getAttribute('debtLimit'):
-                self.members.append(interaction.user)
-                await interaction.response.send_message('You\'re in the bet, good luck!', ephemeral=True)
-            else:
-                await interaction.response.send_message('Sorry, you don\'t have enough money to join this bet.', ephemeral=True)
-        else:
-            await interaction.response.send_message('You\'ve already joined the bet, be patient.', ephemeral=True)
+class JoinWheel(WagerView):
+    def __init__(self):
+        super().__init__(timeout=None)
 
-    @discord.ui.button(label='Cancel', style=discord.ButtonStyle.red)
-    async def cancel(self, button: discord.ui.Button, interaction: discord.Interaction):
-        if interaction.user == self.members[0]:
-            self.members = None
-            await interaction.response.send_message('You got it, cancelling the bet.', ephemeral=True)
-            self.stop()
+    @discord.ui.button(label='Join', style=discord.ButtonStyle.green, custom_id='wheel:join')
+    async def join(self, interaction: discord.Interaction, button: discord.ui.Button):
+        outcome = await wagers.join(interaction.guild, interaction.message.id, interaction.user.id)
+        if outcome == 'joined':
+            await interaction.response.send_message('You\'re in the bet, good luck!', ephemeral=True)
+        elif outcome == 'broke':
+            await interaction.response.send_message('Sorry, you don\'t have enough money to join this bet.', ephemeral=True)
+        elif outcome == 'joined already':
+            await interaction.response.send_message('You\'ve already joined the bet, be patient.', ephemeral=True)
+        else:
+            await interaction.response.send_message('This wheel is no longer open.', ephemeral=True)
+
+    @discord.ui.button(label='Cancel', style=discord.ButtonStyle.red, custom_id='wheel:cancel')
+    async def cancel(self, interaction: discord.Interaction, button: discord.ui.Button):
+        outcome = await wagers.cancel(interaction.message.id, interaction.user.id)
+        if outcome == 'cancelled':
+            await interaction.response.edit_message(content='The wheel bet has been cancelled.', view=None)
+        elif outcome == 'not yours':
+            await interaction.response.send_message('Sorry, only the person who started the bet can stop it.', ephemeral=True)
         else:
-            await interaction.response.send_message('Sorry, only the person who started the bet can stop it.', ephemeral=True)
\ No newline at end of file
+            await interaction.response.send_message('This wheel is no longer open.', ephemeral=True)
+
+
+# Stops a view before it is sent or edited onto a message. discord.py then only renders its buttons instead of keeping
+# the instance for that message forever, presses are handled by the instances from persistent_views.
+def detached(view: discord.ui.View):
+    view.stop()
+    return view
+
+
+# One of each, registered with the client so buttons on any open wager are handled
+def persistent_views():
+    return [ConfirmBet(), DecideBetOutcome(), JoinWheel()]
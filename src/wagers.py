@@ -0,0 +1,248 @@
+# Bets and wheels as rows in WAGERS, keyed by the id of the message carrying their buttons. Every button press is one
+# ledger job that checks the row's state and moves it on, so an open wager costs a row rather than a parked coroutine
+# and survives restarts. A sweeper closes wagers whose time is up.
+#
+# bet:   pending -> accepted -> (disputed ->) settled, or declined / expired / cancelled (loser can no longer cover it)
+# wheel: pending -> settled, or cancelled / expired
+import asyncio
+import json
+import logging
+import random
+import time
+from io import BytesIO
+import discord
+import config
+import commands
+import sql_client as sql
+import outbound
+
+columns = ['message_id', 'kind', 'state', 'guild_id', 'channel_id', 'creator', 'opponent', 'amount', 'reason', 'players', 'votes', 'expires']
+openStates = ('pending', 'accepted', 'disputed')
+
+betAcceptTime = config.getAttribute('betAcceptTime', 180)
+betDecideTime = config.getAttribute('betDecideTime', 600)
+wheelJoinTime = config.getAttribute('wheelJoinTime', 120)
+
+
+def _get(connection, messageid: int):
+    row = connection.execute(f'SELECT {", ".join(columns)} FROM WAGERS WHERE message_id = ?', (messageid,)).fetchone()
+    if row is None:
+        return None
+    wager = dict(zip(columns, row))
+    wager['players'] = json.loads(wager['players'])
+    # json keys are strings, voter id -> the id they voted for
+    wager['votes'] = {int(voter): choice for voter, choice in json.loads(wager['votes']).items()}
+    return wager
+
+
+def _create(connection, messageid: int, kind: str, guildid: int, channelid: int, creator: int, opponent, amount: int, reason, expires: float):
+    connection.execute(f'INSERT INTO WAGERS({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                       (messageid, kind, 'pending', guildid, channelid, creator, opponent, amount, reason, json.dumps([creator]), '{}', expires))
+
+
+# Moves a wager on only if it is still in one of the expected states, returns False if something else got there first
+def _transition(connection, messageid: int, fromStates: tuple, state: str, expires: float = None):
+    placeholders = ', '.join('?' * len(fromStates))
+    if expires is None:
+        cursor = connection.execute(f'UPDATE WAGERS SET state = ? WHERE message_id = ? AND state IN ({placeholders})', (state, messageid) + fromStates)
+    else:
+        cursor = connection.execute(f'UPDATE WAGERS SET state = ?, expires = ? WHERE message_id = ? AND state IN ({placeholders})',
+                                    (state, expires, messageid) + fromStates)
+    return cursor.rowcount == 1
+
+
+def _respond(connection, messageid: int, memberid: int, accept: bool):
+    wager = _get(connection, messageid)
+    if wager is None or wager['state'] != 'pending':
+        return 'closed', wager
+    if memberid != wager['opponent']:
+        return 'not yours', wager
+    if accept:
+        _transition(connection, messageid, ('pending',), 'accepted', time.time() + betDecideTime)
+        return 'accepted', wager
+    _transition(connection, messageid, ('pending',), 'declined')
+    return 'declined', wager
+
+
+# Marks a bet settled and moves the coin in the same savepoint. If the loser can no longer cover it the bet is cancelled.
+def _settle_bet(connection, wager: dict, winner: int, defaultCoin: int, debtLimit: int):
+    loser = wager['opponent'] if winner == wager['creator'] else wager['creator']
+    balances = commands._settle(connection, wager['guild_id'], [(loser, -wager['amount']), (winner, wager['amount'])], 'bet: ' + wager['reason'],
+                                defaultCoin, debtLimit)
+    _transition(connection, wager['message_id'], ('accepted', 'disputed'), 'settled' if balances is not None else 'cancelled')
+    return balances
+
+
+# Records a vote for the winner. Both sides agreeing settles the bet, disagreeing marks it disputed and then the first
+# vote from anyone else decides it. Returns (outcome, wager, balances written or None).
+def _vote(connection, messageid: int, voter: int, choice: int, defaultCoin: int, debtLimit: int):
+    wager = _get(connection, messageid)
+    if wager is None or wager['state'] not in ('accepted', 'disputed'):
+        return 'closed', wager, None
+    parties = (wager['creator'], wager['opponent'])
+    if voter not in parties:
+        if wager['state'] != 'disputed':
+            return 'waiting', wager, None
+        winner = choice
+    else:
+        wager['votes'][voter] = choice
+        connection.execute('UPDATE WAGERS SET votes = ? WHERE message_id = ?', (json.dumps(wager['votes']), messageid))
+        if len(wager['votes']) < 2:
+            return 'waiting', wager, None
+        if wager['votes'][parties[0]] != wager['votes'][parties[1]]:
+            _transition(connection, messageid, ('accepted',), 'disputed')
+            return 'disputed', wager, None
+        winner = choice
+    balances = _settle_bet(connection, wager, winner, defaultCoin, debtLimit)
+    return ('settled' if balances is not None else 'uncovered'), wager, balances
+
+
+def _join(connection, messageid: int, memberid: int, debtLimit: int):
+    wager = _get(connection, messageid)
+    if wager is None or wager['state'] != 'pending':
+        return 'closed'
+    if memberid in wager['players']:
+        return 'joined already'
+    coin = commands._get_coin(connection, wager['guild_id'], memberid)
+    if coin is None or coin - wager['amount'] < debtLimit:
+        return 'broke'
+    connection.execute('UPDATE WAGERS SET players = ? WHERE message_id = ?', (json.dumps(wager['players'] + [memberid]), messageid))
+    return 'joined'
+
+
+def _cancel(connection, messageid: int, memberid: int):
+    wager = _get(connection, messageid)
+    if wager is None or wager['state'] != 'pending':
+        return 'closed'
+    if memberid != wager['creator']:
+        return 'not yours'
+    _transition(connection, messageid, ('pending',), 'cancelled')
+    return 'cancelled'
+
+
+# Spins a wheel that is due: picks the winner and marks it settled. No coin changes hands, the wheel has never paid out.
+# Returns (wager, players still in the guild, wheel angle, winner index) or None if it was not open.
+def _spin(connection, messageid: int, present: set):
+    wager = _get(connection, messageid)
+    if wager is None or wager['state'] != 'pending':
+        return None
+    players = [memberid for memberid in wager['players'] if memberid in present]
+    if len(players) < 2:
+        _transition(connection, messageid, ('pending',), 'expired')
+        return wager, players, None, None
+    win_ang = random.randint(0, 359)
+    _transition(connection, messageid, ('pending',), 'settled')
+    return wager, players, win_ang, commands.get_winner(len(players), win_ang)
+
+
+def _due(connection, now: float):
+    placeholders = ', '.join('?' * len(openStates))
+    return connection.execute(f'SELECT message_id, kind, state FROM WAGERS WHERE state IN ({placeholders}) AND expires <= ?', openStates + (now,)).fetchall()
+
+
+#############################################################
+# Flows used by the commands, the persistent views and the sweeper
+#############################################################
+# Wagers whose message is out but whose row may not be written yet
+creating = set()
+
+
+# Sends the wager's message by awaiting sending, then writes its row keyed by the message id. Returns the message.
+# Its buttons can be pressed before the row exists, presses on a message without a row wait for this to finish.
+async def create(sending, kind: str, creator: discord.Member, opponent, amount: int, reason=None):
+    done = asyncio.get_running_loop().create_future()
+    creating.add(done)
+    try:
+        message = await sending
+        expires = time.time() + (wheelJoinTime if kind == 'wheel' else betAcceptTime)
+        await sql.run(_create, message.id, kind, message.guild.id, message.channel.id, creator.id, opponent.id if opponent else None, amount, reason, expires)
+        return message
+    finally:
+        creating.discard(done)
+        done.set_result(None)
+
+
+# Waits for wagers still being created if messageid has no row yet, it may be one of them
+async def _created(messageid: int):
+    if creating and await sql.read(_get, messageid) is None:
+        await asyncio.wait(list(creating))
+
+
+async def get(messageid: int):
+    await _created(messageid)
+    return await sql.read(_get, messageid)
+
+
+async def respond(messageid: int, memberid: int, accept: bool):
+    await _created(messageid)
+    return await sql.run(_respond, messageid, memberid, accept)
+
+
+async def vote(guild: discord.Guild, messageid: int, voter: int, choice: int):
+    await _created(messageid)
+    outcome, wager, balances = await sql.run(_vote, messageid, voter, choice, config.getGuildAttribute(guild.id, 'defaultCoin'),
+                                             config.getGuildAttribute(guild.id, 'debtLimit'))
+    if balances:
+        commands.apply_balances(guild, balances)
+    return outcome, wager
+
+
+async def join(guild: discord.Guild, messageid: int, memberid: int):
+    await _created(messageid)
+    return await sql.run(_join, messageid, memberid, config.getGuildAttribute(guild.id, 'debtLimit'))
+
+
+async def cancel(messageid: int, memberid: int):
+    await _created(messageid)
+    return await sql.run(_cancel, messageid, memberid)
+
+
+def member_name(guild: discord.Guild, memberid: int):
+    member = guild.get_member(memberid) if guild else None
+    return member.display_name if member else 'Someone who left'
+
+
+# Text for a settled bet, shared by the vote button and anything else that settles one
+def settled_text(guild: discord.Guild, wager: dict, winner: int, covered: bool):
+    loser = wager['opponent'] if winner == wager['creator'] else wager['creator']
+    if not covered:
+        return f'{member_name(guild, loser)} can no longer cover the ${str(wager["amount"])} bet, no coin was moved.'
+    return f'{member_name(guild, winner)} won the ${str(wager["amount"])} bet against {member_name(guild, loser)} for "{wager["reason"]}"!'
+
+
+async def spin(guild: discord.Guild, channel: discord.abc.Messageable, messageid: int):
+    present = {member.id for member in guild.members}
+    result = await sql.run(_spin, messageid, present)
+    if result is None:
+        return
+    wager, players, win_ang, winnerIndex = result
+    wheelMessage = channel.get_partial_message(messageid)
+    if win_ang is None:
+        await outbound.edit(wheelMessage, content='Not enough people have joined this wheel, the bet is cancelled.', view=None)
+        return
+    await outbound.edit(wheelMessage, content='The wheel is spinning...', view=None)
+    members = [guild.get_member(memberid) for memberid in players]
+    wheelGif, _ = await commands.generate_wheel(members, win_ang)
+    await outbound.send(channel, file=discord.File(BytesIO(wheelGif), filename='wheel.gif'), priority=outbound.UPDATE)
+    await outbound.send(channel, f'{members[winnerIndex].display_name} won the wheel!', priority=outbound.UPDATE)
+
+
+# Closes every wager whose time is up: wheels spin, unanswered bets are deleted and undecided ones time out
+async def sweep(client: discord.Client):
+    for messageid, kind, state in await sql.read(_due, time.time()):
+        wager = await sql.read(_get, messageid)
+        guild = client.get_guild(wager['guild_id'])
+        channel = guild.get_channel(wager['channel_id']) if guild else None
+        if channel is None:
+            await sql.run(_transition, messageid, openStates, 'expired')
+            continue
+        try:
+            if kind == 'wheel':
+                await spin(guild, channel, messageid)
+            elif await sql.run(_transition, messageid, (state,), 'expired'):
+                if state == 'pending':
+                    await outbound.delete(channel.get_partial_message(messageid))
+                else:
+                    await outbound.edit(channel.get_partial_message(messageid), content='Something went wrong or the bet timed out.', view=None)
+        except discord.HTTPException as e:
+            logging.warning(f'Could not close {kind} {messageid}: {e}')
@@ -0,0 +1,173 @@
+import discord
+from bisect import bisect_right
+
+
+# One role per balance, e.g. "Cactus Coin: 1037". Roles are made when a balance first needs one and deleted once nobody
+# holds them.
+class ExactRoles:
+    collect = True
+
+    def __init__(self, prefix: str):
+        self.prefix = f'{prefix}: '
+
+    # The role key a balance is shown with, for exact roles the balance itself
+    def key(self, amount: int):
+        return amount
+
+    def name(self, key):
+        return self.prefix + str(key)
+
+    # Returns the key a role name stands for, or None if it is not one of these roles
+    def parse(self, name: str):
+        if not name.startswith(self.prefix):
+            return None
+        amount = name[len(self.prefix):]
+        if not amount.lstrip('-').isnumeric():
+            return None
+        return int(amount)
+
+    # Keys whose roles should always exist
+    def keys(self):
+        return []
+
+
+# A fixed set of balance ranges, e.g. "Cactus Coin: under 0", "Cactus Coin: 0+", "Cactus Coin: 1000+". Ranges are
+# either given by their boundaries or are every multiple of step. A range is keyed by its lowest amount, the range below
+# the first boundary by -inf. Most balance changes stay within a range and need no role change at all. Roles for
+# boundaries are never deleted, roles for multiples of step are made as needed and deleted once nobody holds them.
+class TierRoles:
+    def __init__(self, prefix: str, bounds: list = None, step: int = None):
+        self.prefix = f'{prefix}: '
+        self.bounds = sorted(set(bounds)) if bounds is not None else None
+        self.step = step
+        if self.bounds is None and step is None:
+            raise ValueError('TierRoles needs bounds or a step')
+        self.collect = self.bounds is None
+
+    def key(self, amount):
+        if self.bounds is None:
+            return amount // self.step * self.step
+        position = bisect_right(self.bounds, amount)
+        return self.bounds[position - 1] if position else float('-inf')
+
+    def name(self, key):
+        if key == float('-inf'):
+            return f'{self.prefix}under {self.bounds[0]}'
+        return f'{self.prefix}{key}+'
+
+    def parse(self, name: str):
+        if not name.startswith(self.prefix):
+            return None
+        tier = name[len(self.prefix):]
+        if self.bounds is not None and tier == f'under {self.bounds[0]}':
+            return float('-inf')
+        if not tier.endswith('+') or not tier[:-1].lstrip('-').isnumeric():
+            return None
+        key = int(tier[:-1])
+        if (self.bounds is not None and key not in self.bounds) or (self.bounds is None and key % self.step):
+            return None
+        return key
+
+    # Every tier when they are given by boundaries, multiples of step are made as they are needed
+    def keys(self):
+        if self.bounds is None:
+            return []
+        return [float('-inf')] + self.bounds
+
+
+# Index of the wallet roles in one guild. Maps a role key (see ExactRoles and TierRoles) to its role and tracks which
+# members hold each role, so finding a role, a member's wallet role or an empty role never needs a scan of guild.roles.
+class WalletRoleIndex:
+    def __init__(self, scheme):
+        self.scheme = scheme
+        self.roles = {}
+        self.amounts = {}
+        self.holders = {}
+        self.memberRoles = {}
+
+    # Builds the index from the guild cache, this is the only full pass over roles and members
+    @classmethod
+    def build(cls, guild: discord.Guild, scheme):
+        index = cls(scheme)
+        for role in guild.roles:
+            index.add_role(role)
+        for member in guild.members:
+            index.update_member(member)
+        return index
+
+    def key(self, amount: int):
+        return self.scheme.key(amount)
+
+    def role_name(self, key):
+        return self.scheme.name(key)
+
+    # Returns the key a role stands for, or None if it is not a wallet role
+    def parse(self, role: discord.Role):
+        return self.scheme.parse(role.name)
+
+    def add_role(self, role: discord.Role):
+        amount = self.parse(role)
+        if amount is None:
+            return
+        self.roles[amount] = role
+        self.amounts[role.id] = amount
+        self.holders.setdefault(role.id, set())
+
+    def remove_role(self, role: discord.Role):
+        amount = self.amounts.pop(role.id, None)
+        if amount is None:
+            return
+        if self.roles.get(amount) is not None and self.roles[amount].id == role.id:
+            del self.roles[amount]
+        for memberid in self.holders.pop(role.id, set()):
+            self.memberRoles.get(memberid, set()).discard(role.id)
+
+    # A renamed role may stop or start being a wallet role, its holders carry over either way
+    def replace_role(self, before: discord.Role, after: discord.Role):
+        holders = self.holders.get(before.id, set())
+        self.remove_role(before)
+        self.add_role(after)
+        for memberid in holders:
+            self.add_holder(memberid, after)
+
+    def get(self, key):
+        return self.roles.get(key)
+
+    # Wallet roles currently held by a member, normally zero or one
+    def roles_of(self, memberid: int):
+        return [self.roles[self.amounts[roleid]] for roleid in self.memberRoles.get(memberid, ()) if roleid in self.amounts]
+
+    def holder_count(self, role: discord.Role):
+        return len(self.holders.get(role.id, ()))
+
+    def add_holder(self, memberid: int, role: discord.Role):
+        if role.id not in self.amounts:
+            return
+        self.holders[role.id].add(memberid)
+        self.memberRoles.setdefault(memberid, set()).add(role.id)
+
+    # Returns True when the member was the last holder of the role
+    def remove_holder(self, memberid: int, role: discord.Role):
+        holders = self.holders.get(role.id)
+        if holders is None or memberid not in holders:
+            return False
+        holders.discard(memberid)
+        self.memberRoles.get(memberid, set()).discard(role.id)
+        return not holders
+
+    # Re-reads a member's wallet roles after Discord reports a change
+    def update_member(self, member: discord.Member):
+        current = {role.id for role in member.roles if role.id in self.amounts}
+        previous = self.memberRoles.get(member.id, set())
+        for roleid in previous - current:
+            self.holders[roleid].discard(member.id)
+        for roleid in current - previous:
+            self.holders[roleid].add(member.id)
+        if current:
+            self.memberRoles[member.id] = current
+        else:
+            self.memberRoles.pop(member.id, None)
+
+    def drop_member(self, memberid: int):
+        for roleid in self.memberRoles.pop(memberid, set()):
+            self.holders[roleid].discard(memberid)
@@ -0,0 +1,11 @@
+# The bot's modules read ../config.yml and open the ledger as they are imported, so the tests run from a throwaway
+# deployment laid out like the real one, the same as the benchmarks
+import os
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [root, os.path.join(root, 'src')]
+
+from benchmarks.fixtures import workspace  # noqa: E402
+
+os.chdir(workspace())
@@ -0,0 +1,26 @@
+import asyncio
+import commands
+import sql_client as sql
+
+
+def test_cached_query_keeps_only_the_current_generation(monkeypatch):
+    generation = [0]
+    calls = []
+    monkeypatch.setattr(sql, 'generation', lambda: generation[0])
+
+    async def query(value):
+        calls.append(value)
+        return [value]
+
+    async def run():
+        assert await commands.cached_query(('a',), query, 1) == [1]
+        assert await commands.cached_query(('a',), query, 1) == [1]
+        assert await commands.cached_query(('b',), query, 2) == [2]
+        assert len(commands.chartQueries) == 2
+        generation[0] += 1
+        assert await commands.cached_query(('a',), query, 1) == [1]
+        # the result for b was read before the write and is gone
+        assert list(commands.chartQueries) == [('a',)]
+
+    asyncio.run(run())
+    assert calls == [1, 2, 1]
@@ -0,0 +1,69 @@
+import datetime
+import random
+import sqlite3
+import commands
+import compaction
+from schema import create_schema
+
+guildid = 1
+memberids = list(range(1, 21))
+
+
+def ledger(days: list, perDay: int, seed: int = 0):
+    rng = random.Random(seed)
+    connection = sqlite3.connect(':memory:', isolation_level=None)
+    create_schema(connection)
+    amounts = rng.sample([amount for amount in range(-5000, 5001) if amount], perDay * len(days))
+    rows = [(guildid, rng.choice(memberids), amounts.pop(), day - datetime.timedelta(microseconds=i)) for day in days for i in range(perDay)]
+    connection.executemany('INSERT INTO TRANSACTIONS(guild_id, id, coin, date) VALUES (?, ?, ?, ?)', rows)
+    return connection
+
+
+def compact_all(connection, starts: list):
+    cutoff = (datetime.date.today() + datetime.timedelta(days=1)).isoformat()
+    thresholds = compaction._thresholds(connection, guildid, starts, 5)
+    while compaction._compact_day(connection, guildid, cutoff, starts, thresholds) is not None:
+        pass
+
+
+def totals(connection):
+    return dict(connection.execute('SELECT id, SUM(coin) FROM (SELECT id, coin FROM TRANSACTIONS UNION ALL '
+                                   'SELECT id, coin FROM TRANSACTION_ROLLUPS) GROUP BY id').fetchall())
+
+
+def top(connection):
+    return [commands._get_top_transactions(connection, guildid, commands.period_start(period), isWins, 5)
+            for period in compaction.periods for isWins in (True, False)]
+
+
+def count(connection):
+    return connection.execute('SELECT COUNT(*) FROM TRANSACTIONS').fetchone()[0]
+
+
+def test_busy_days_compact():
+    now = datetime.datetime.utcnow()
+    connection = ledger([now - datetime.timedelta(days=800), now], 200)
+    before, topBefore = totals(connection), top(connection)
+
+    compact_all(connection, [commands.period_start(period).isoformat() for period in compaction.periods])
+
+    # the old day is outside every period and goes entirely, today only keeps the top 5 wins and losses
+    assert count(connection) == 10
+    assert totals(connection) == before
+    assert top(connection) == topBefore
+
+
+def test_closed_period_compacts_again():
+    day = datetime.datetime.utcnow() - datetime.timedelta(days=3)
+    connection = ledger([day], 100)
+    before = totals(connection)
+    dayStart = day.date().isoformat()
+
+    compact_all(connection, [dayStart] * 3)
+    assert count(connection) == 10
+
+    # every period the day was part of has closed
+    later = (day.date() + datetime.timedelta(days=1)).isoformat()
+    compact_all(connection, [later] * 3)
+    assert count(connection) == 0
+    assert totals(connection) == before
@@ -0,0 +1,32 @@
+import asyncio
+import commands
+import discord_client
+from benchmarks.fakes import FakeClient, FakeGuild
+
+
+def test_hidden_commands_are_never_suggested():
+    assert discord_client.suggester.suggest('!hardrese') == []
+    assert discord_client.suggester.suggest('!impor') == []
+
+
+def test_suggestions_only_name_commands_the_author_may_run():
+    member = FakeGuild(1, seed=41).members[0]
+    # !balance is an admin command, a plain member is not offered it
+    assert not discord_client.registry.permitted('!balance', member)
+    assert discord_client.registry.permitted('!give', member)
+
+
+# Commands wait for the legacy claim on start up, and are let through once it is done even if there was nothing to claim
+def test_commands_wait_for_the_legacy_claim():
+    client = FakeClient()
+    client.guilds = [FakeGuild(1, seed=1), FakeGuild(1, seed=2)]
+
+    async def run():
+        commands.legacyClaimed.clear()
+        waiting = asyncio.ensure_future(commands.legacyClaimed.wait())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        await discord_client.claim_legacy_ledger(client)
+        await asyncio.wait_for(waiting, 1)
+
+    asyncio.run(run())
@@ -0,0 +1,39 @@
+import os
+import tempfile
+import pytest
+import ledger_io
+
+
+def ledger():
+    workdir = tempfile.mkdtemp()
+    dbFile = os.path.join(workdir, 'ledger.db')
+    connection = ledger_io.connect(dbFile)
+    ledger_io.create_schema(connection)
+    connection.executemany('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (1, ?, ?)', [(1, 900), (2, 1100)])
+    connection.executemany("INSERT INTO TRANSACTIONS(guild_id, id, coin, date) VALUES (1, ?, ?, '2026-01-01 12:00:00')", [(1, -100), (2, 100)])
+    connection.close()
+    return dbFile, os.path.join(workdir, 'export')
+
+
+def transactions(dbFile: str):
+    connection = ledger_io.connect(dbFile)
+    try:
+        return connection.execute('SELECT id, coin FROM TRANSACTIONS ORDER BY id').fetchall()
+    finally:
+        connection.close()
+
+
+def test_import_into_its_own_ledger_is_refused():
+    dbFile, directory = ledger()
+    ledger_io.export_ledger(dbFile, directory, 'csv')
+    with pytest.raises(RuntimeError):
+        ledger_io.import_ledger(dbFile, directory)
+    assert transactions(dbFile) == [(1, -100), (2, 100)]
+
+
+def test_import_with_replace_does_not_double_count():
+    dbFile, directory = ledger()
+    ledger_io.export_ledger(dbFile, directory, 'csv')
+    counts = ledger_io.import_ledger(dbFile, directory, replace=True)
+    assert counts == {'AMOUNTS': 2, 'TRANSACTIONS': 2, 'TRANSACTION_ROLLUPS': 0}
+    assert transactions(dbFile) == [(1, -100), (2, 100)]
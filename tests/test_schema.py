@@ -0,0 +1,40 @@
+import datetime
+import sqlite3
+import commands
+from schema import create_schema, migrations
+
+
+# Stands in for a connection and returns the query plan of whatever is executed on it
+class Explaining:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def execute(self, query: str, args: tuple):
+        return self.connection.execute('EXPLAIN QUERY PLAN ' + query, args)
+
+
+def test_top_transactions_need_no_sort():
+    connection = sqlite3.connect(':memory:', isolation_level=None)
+    create_schema(connection)
+    for isWins in (True, False):
+        plan = ' '.join(row[3] for row in commands._get_top_transactions(Explaining(connection), 1, datetime.date.today(), isWins, 5))
+        assert 'TRANSACTIONS_COIN_DATE' in plan and 'TEMP B-TREE' not in plan
+
+
+# A ledger written before migrations existed gets every migration, and claiming it hands its rows to the guild
+def test_baseline_ledger_is_migrated_and_claimed():
+    connection = sqlite3.connect(':memory:', isolation_level=None)
+    connection.execute('CREATE TABLE IF NOT EXISTS AMOUNTS (id integer PRIMARY KEY, coin integer)')
+    connection.execute('CREATE TABLE IF NOT EXISTS TRANSACTIONS (id integer, coin integer, memo string, date date)')
+    connection.executemany('INSERT INTO AMOUNTS VALUES (?, ?)', [(1, 900), (2, 1100)])
+    connection.executemany("INSERT INTO TRANSACTIONS VALUES (?, ?, 'bet', '2026-01-01 12:00:00')", [(1, -100), (2, 100)])
+    create_schema(connection)
+    assert connection.execute('PRAGMA user_version').fetchone()[0] == len(migrations)
+    assert commands._get_coin(connection, 7, 1) is None
+
+    # member 2 already has a wallet of their own in guild 7, it is kept and the legacy one stays behind
+    connection.execute('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (7, 2, 500)')
+    assert commands._claim_legacy_ledger(connection, 7) == 3
+    assert (commands._get_coin(connection, 7, 1), commands._get_coin(connection, 7, 2)) == (900, 500)
+    assert connection.execute('SELECT guild_id, id FROM AMOUNTS WHERE guild_id = 0').fetchall() == [(0, 2)]
+    assert connection.execute('SELECT COUNT(*) FROM TRANSACTIONS WHERE guild_id = 7').fetchone()[0] == 2
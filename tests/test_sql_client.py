@@ -0,0 +1,31 @@
+import os
+import sqlite3
+import tempfile
+import pytest
+from sql_client import LedgerWriter
+
+
+def write(connection, value: int):
+    connection.execute('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (1, ?, ?)', (value, value))
+    return value
+
+
+# A batch that cannot take the write lock fails its jobs, and the writer keeps serving the ones after it
+def test_locked_database_fails_the_batch_only():
+    dbFile = os.path.join(tempfile.mkdtemp(), 'ledger.db')
+    writer = LedgerWriter(dbFile, 0, busyTimeout=50)
+    writer.start()
+    try:
+        assert writer.submit(write, 1).result(timeout=5) == 1
+
+        other = sqlite3.connect(dbFile, isolation_level=None)
+        other.execute('BEGIN IMMEDIATE')
+        with pytest.raises(sqlite3.OperationalError):
+            writer.submit(write, 2).result(timeout=5)
+        other.execute('ROLLBACK')
+        other.close()
+
+        assert writer.is_alive()
+        assert writer.submit(write, 3).result(timeout=5) == 3
+    finally:
+        writer.stop()
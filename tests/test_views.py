@@ -0,0 +1,86 @@
+# Presses the wager buttons the way discord.py 2.x does: through item.callback(interaction), which calls the decorated
+# method as (view, interaction, button)
+import asyncio
+import views
+import wagers
+
+
+class FakeResponse:
+    def __init__(self):
+        self.calls = []
+
+    async def send_message(self, content=None, **kwargs):
+        self.calls.append(('send_message', content, kwargs))
+
+    async def edit_message(self, **kwargs):
+        self.calls.append(('edit_message', kwargs.get('content'), kwargs))
+
+
+class FakeUser:
+    id = 2
+    display_name = 'Opponent'
+
+
+class FakeMessage:
+    id = 1000
+
+
+class FakeInteraction:
+    def __init__(self):
+        self.message = FakeMessage()
+        self.user = FakeUser()
+        self.guild = None
+        self.response = FakeResponse()
+
+
+# Builds the view inside a running loop, as the bot does, presses one of its buttons and returns the responses sent
+def press(makeView, customid: str):
+    async def inner():
+        view = makeView()
+        item = next(item for item in view.children if item.custom_id == customid)
+        interaction = FakeInteraction()
+        await item.callback(interaction)
+        return interaction.response.calls
+    return asyncio.run(inner())
+
+
+def test_bet_accept(monkeypatch):
+    async def respond(messageid, userid, accept):
+        assert (messageid, userid, accept) == (1000, 2, True)
+        return 'accepted', {'creator': 1}
+    monkeypatch.setattr(wagers, 'respond', respond)
+    monkeypatch.setattr(wagers, 'member_name', lambda guild, memberid: 'Challenger')
+
+    [(kind, content, kwargs)] = press(views.ConfirmBet, 'bet:accept')
+    assert kind == 'edit_message' and 'has accepted the bet' in content
+    assert isinstance(kwargs['view'], views.DecideBetOutcome)
+    assert kwargs['view'].is_finished()
+
+
+def test_bet_decline(monkeypatch):
+    async def respond(messageid, userid, accept):
+        assert not accept
+        return 'declined', None
+    monkeypatch.setattr(wagers, 'respond', respond)
+
+    [(kind, content, kwargs)] = press(views.ConfirmBet, 'bet:decline')
+    assert kind == 'edit_message' and 'declined' in content and kwargs['view'] is None
+
+
+def test_wheel_join(monkeypatch):
+    async def join(guild, messageid, userid):
+        assert (messageid, userid) == (1000, 2)
+        return 'joined'
+    monkeypatch.setattr(wagers, 'join', join)
+
+    [(kind, content, _)] = press(views.JoinWheel, 'wheel:join')
+    assert kind == 'send_message' and 'You\'re in the bet' in content
+
+
+def test_wheel_cancel(monkeypatch):
+    async def cancel(messageid, userid):
+        return 'cancelled'
+    monkeypatch.setattr(wagers, 'cancel', cancel)
+
+    [(kind, content, kwargs)] = press(views.JoinWheel, 'wheel:cancel')
+    assert kind == 'edit_message' and 'cancelled' in content and kwargs['view'] is None
@@ -0,0 +1,123 @@
+# Runs the wager state machine against a real SQLite ledger
+import asyncio
+import sqlite3
+import commands
+import wagers
+from schema import create_schema
+
+guildid, messageid = 1, 1000
+creator, opponent, judge = 1, 2, 3
+defaultCoin, debtLimit = 1000, -1000
+
+
+def ledger(balances: dict, kind: str = 'bet', amount: int = 100):
+    connection = sqlite3.connect(':memory:', isolation_level=None)
+    create_schema(connection)
+    connection.executemany('INSERT INTO AMOUNTS(guild_id, id, coin) VALUES (?, ?, ?)', [(guildid, memberid, coin) for memberid, coin in balances.items()])
+    wagers._create(connection, messageid, kind, guildid, 10, creator, opponent if kind == 'bet' else None, amount, 'test', 0)
+    return connection
+
+
+def balance(connection, memberid: int):
+    return commands._get_coin(connection, guildid, memberid)
+
+
+def state(connection):
+    return wagers._get(connection, messageid)['state']
+
+
+def transactions(connection):
+    return connection.execute('SELECT COUNT(*) FROM TRANSACTIONS').fetchone()[0]
+
+
+def test_only_the_opponent_can_accept():
+    connection = ledger({creator: 1000, opponent: 1000})
+    assert wagers._respond(connection, messageid, creator, True)[0] == 'not yours'
+    assert wagers._respond(connection, messageid, opponent, True)[0] == 'accepted'
+    assert state(connection) == 'accepted'
+    assert wagers._respond(connection, messageid, opponent, False)[0] == 'closed'
+
+
+def test_decline():
+    connection = ledger({creator: 1000, opponent: 1000})
+    assert wagers._respond(connection, messageid, opponent, False)[0] == 'declined'
+    assert state(connection) == 'declined'
+
+
+def test_agreeing_votes_settle_the_bet():
+    connection = ledger({creator: 1000, opponent: 1000})
+    wagers._respond(connection, messageid, opponent, True)
+    assert wagers._vote(connection, messageid, creator, creator, defaultCoin, debtLimit)[0] == 'waiting'
+    outcome, _, balances = wagers._vote(connection, messageid, opponent, creator, defaultCoin, debtLimit)
+    assert outcome == 'settled' and state(connection) == 'settled'
+    assert (balance(connection, creator), balance(connection, opponent)) == (1100, 900)
+    assert wagers._vote(connection, messageid, opponent, creator, defaultCoin, debtLimit)[0] == 'closed'
+
+
+def test_a_third_party_decides_a_dispute():
+    connection = ledger({creator: 1000, opponent: 1000})
+    wagers._respond(connection, messageid, opponent, True)
+    # before a dispute an outsider's vote does not count
+    assert wagers._vote(connection, messageid, judge, opponent, defaultCoin, debtLimit)[0] == 'waiting'
+    wagers._vote(connection, messageid, creator, creator, defaultCoin, debtLimit)
+    assert wagers._vote(connection, messageid, opponent, opponent, defaultCoin, debtLimit)[0] == 'disputed'
+    assert state(connection) == 'disputed'
+    assert wagers._vote(connection, messageid, judge, opponent, defaultCoin, debtLimit)[0] == 'settled'
+    assert (balance(connection, creator), balance(connection, opponent)) == (900, 1100)
+
+
+# A loser who can no longer cover the bet cancels it, and neither side's balance nor the transactions change
+def test_uncovered_bet_moves_nothing():
+    connection = ledger({creator: 1000, opponent: -950})
+    wagers._respond(connection, messageid, opponent, True)
+    wagers._vote(connection, messageid, creator, creator, defaultCoin, debtLimit)
+    outcome, _, balances = wagers._vote(connection, messageid, opponent, creator, defaultCoin, debtLimit)
+    assert outcome == 'uncovered' and balances is None
+    assert state(connection) == 'cancelled'
+    assert (balance(connection, creator), balance(connection, opponent)) == (1000, -950)
+    assert transactions(connection) == 0
+
+
+def test_join_and_spin():
+    connection = ledger({creator: 1000, opponent: 1000, judge: -1000}, kind='wheel')
+    assert wagers._join(connection, messageid, creator, debtLimit) == 'joined already'
+    assert wagers._join(connection, messageid, judge, debtLimit) == 'broke'
+    assert wagers._join(connection, messageid, opponent, debtLimit) == 'joined'
+    wager, players, win_ang, winnerIndex = wagers._spin(connection, messageid, {creator, opponent})
+    assert players == [creator, opponent] and 0 <= winnerIndex < 2
+    assert state(connection) == 'settled'
+    # the wheel does not pay out
+    assert (balance(connection, creator), balance(connection, opponent)) == (1000, 1000)
+    assert wagers._spin(connection, messageid, {creator, opponent}) is None
+
+
+def test_a_wheel_nobody_joined_expires():
+    connection = ledger({creator: 1000}, kind='wheel')
+    assert wagers._spin(connection, messageid, {creator})[2] is None
+    assert state(connection) == 'expired'
+
+
+class FakeMessage:
+    def __init__(self, messageid: int):
+        self.id = messageid
+        self.guild = self.channel = self
+        # guild and channel ids are the message id too, nothing below looks at them
+
+
+# A press that arrives while the row of its message is still being written waits for it instead of finding no wager
+def test_press_before_the_row_is_written():
+    async def run():
+        message = FakeMessage(987654321)
+        sent = asyncio.Event()
+
+        async def sending():
+            sent.set()
+            return message
+
+        creation = asyncio.ensure_future(wagers.create(sending(), 'bet', FakeMessage(creator), FakeMessage(opponent), 10, 'race'))
+        await sent.wait()
+        outcome, _ = await wagers.respond(message.id, opponent, False)
+        await creation
+        return outcome
+
+    assert asyncio.run(run()) == 'declined'
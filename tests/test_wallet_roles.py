@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+import commands
+import config
+from benchmarks.fakes import FakeGuild, FakeRole
+
+
+def tier_guild(monkeypatch, memberCount: int, roleTiers):
+    guild = FakeGuild(memberCount)
+    monkeypatch.setitem(config.configMap, 'guilds', {guild.id: {'roleMode': 'tiers', 'roleTiers': roleTiers}})
+    return guild
+
+
+def role_names(guild: FakeGuild):
+    return sorted(role.name for role in guild.roles if role.name.startswith('Cactus Coin: '))
+
+
+@pytest.mark.parametrize('roleTiers', [[], 0, -100, 'many', [0, 1.5], True])
+def test_bad_role_tiers_are_a_config_error(monkeypatch, roleTiers):
+    guild = tier_guild(monkeypatch, 0, roleTiers)
+    with pytest.raises(ValueError, match='roleTiers'):
+        commands.build_role_index(guild)
+
+
+# Switching from exact roles to tiers deletes the exact roles and gives their holders the tier for their balance
+def test_switching_to_tiers_moves_members_onto_tier_roles(monkeypatch):
+    guild = tier_guild(monkeypatch, 2, [0, 1000])
+    for member, amount in zip(guild.members, (500, 1500)):
+        member.roles.append(FakeRole(guild, f'Cactus Coin: {amount}'))
+        guild.roles.append(member.roles[0])
+
+    async def run():
+        await commands.update_coins(guild.id, [(member.id, amount) for member, amount in zip(guild.members, (500, 1500))])
+        commands.legacyClaimed.set()
+        await commands.prepare_roles(guild)
+
+    asyncio.run(run())
+    assert role_names(guild) == ['Cactus Coin: 0+', 'Cactus Coin: 1000+', 'Cactus Coin: under 0']
+    assert [[role.name for role in member.roles] for member in guild.members] == [['Cactus Coin: 0+'], ['Cactus Coin: 1000+']]
+
+
+# Rounded tiers are made as balances reach them and deleted once nobody holds them
+def test_step_tier_roles_are_collected(monkeypatch):
+    guild = tier_guild(monkeypatch, 1, 100)
+    guild.roles.append(FakeRole(guild, 'Cactus Coin: 700+'))
+    member = guild.members[0]
+
+    async def run():
+        await commands.prepare_roles(guild)
+        assert role_names(guild) == []
+        await commands.update_role(guild, member, 150)
+        assert role_names(guild) == ['Cactus Coin: 100+']
+        await commands.update_role(guild, member, 250)
+        assert role_names(guild) == ['Cactus Coin: 200+']
+
+    asyncio.run(run())